@@ -2,14 +2,19 @@
 
 import argparse
 import datetime
+import multiprocessing
+import os
 import pandas as pd
+import time
 import yfinance as yf
 import sys
 
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+
 from pandas_datareader import data as pdr
 from etrade_tools import *
 from screener_tools import *
-from stock_chart_tools.utils import get_historical_data, EMA, OBV, SSO, MACD
+from stock_chart_tools.utils import get_historical_data
 from stock_chart_tools.utils import COLUMN_CLOSE, COLUMN_VOLUME, COLUMN_HIGH, COLUMN_LOW, MACD_DIVERGENCE, MACD_LABEL, OBV_LABEL, SS_K, SS_D
 
 DEFAULT_SCREENER_CONFIG_FILE="./etc/stock_screener.json"
@@ -33,28 +38,137 @@ QUID_SLOW_STOCHASTIC_ABOVE_20="0122c7e7-bc9c-4879-8492-e8f9f7e25940"
 FRESHNESS_DAYS=1
 ONE_DAY = 24 * 60 * 60
 
+DEFAULT_DOWNLOAD_WORKERS=4
+DEFAULT_ANALYSIS_WORKERS=min(4,os.cpu_count() or 1)
+
+# Indicators kept with the cached history (beyond the price EMAs)
+ATA_INDICATORS=[
+    OBV_LABEL,OBV_THREE_DAY_EMA,OBV_NINE_DAY_EMA,
+    MACD_LABEL,MACD_DIVERGENCE,MACD_THREE_DAY_EMA,MACD_FIVE_DAY_EMA,
+    SS_K,SS_D,SS_K_THREE_DAY_EMA,SS_K_FIVE_DAY_EMA,
+]
+
 # Globals
 global GLOBAL_VERBOSE
+global GLOBAL_FORCE
 
-def main(screener_config,questions):
-    symbols = get_symbols(screener_config.get(SYMBOLS_DIR))
+def main(screener_config,questions,download_workers,analysis_workers):
+    symbols = sorted(get_symbols(screener_config.get(SYMBOLS_DIR)))
+    if len(symbols) == 0:
+        print(f"no symbols found in {screener_config.get(SYMBOLS_DIR)}")
+        return
+
+    start = time.time()
     count = 0
-    for symbol in sorted(symbols):
-        try:
-            analyze_symbol(screener_config,questions,symbol)
+    failed = list()
+    download_time = 0.0
+
+    # Fill the stale history caches with a few multi-ticker downloads
+    (fetched,missing) = prefetch_historical_data(symbols,screener_config.get(CACHE_DIR))
+    debug(f"downloaded history for {len(fetched)} symbols, {len(missing)} not found")
+
+    # Download the history in threads, hand each symbol to the analysis pool as it arrives
+    analysis_pool = None
+    if analysis_workers > 1:
+        # Spawn rather than fork, the download threads are already running
+        analysis_pool = ProcessPoolExecutor(max_workers=analysis_workers,mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker,initargs=(GLOBAL_FORCE,GLOBAL_VERBOSE))
+
+    try:
+        analyses = dict()
+        with ThreadPoolExecutor(max_workers=max(1,download_workers)) as download_pool:
+            downloads = dict([(download_pool.submit(download_symbol,screener_config,symbol),symbol) for symbol in symbols])
+            for future in as_completed(downloads):
+                symbol = downloads.get(future)
+                try:
+                    download_time += future.result()
+                except Exception as e:
+                    print(f"Error: failed to download {symbol}: {e}")
+                    failed.append(symbol)
+                    continue
+
+                if analysis_pool is None:
+                    try:
+                        analyze_symbol(screener_config,questions,symbol)
+                        count += 1
+                    except Exception as e:
+                        print(f"Error: failed to analyze {symbol}: {e}")
+                        failed.append(symbol)
+                else:
+                    # The workers only read the cached answers they are handed, the answers are written here
+                    answers = get_answer_store(screener_config,symbol)
+                    analyses[analysis_pool.submit(analyze_symbol_worker,screener_config,symbol,dict(answers.get_answers()))] = symbol
+
+        for future in as_completed(analyses):
+            symbol = analyses.get(future)
+            try:
+                results = future.result()
+            except Exception as e:
+                print(f"Error: failed to analyze {symbol}: {e}")
+                failed.append(symbol)
+                continue
+
+            answers = get_answer_store(screener_config,symbol)
+            for (question_id,value,expiration_time,question_text) in results:
+                answers.set_answer(question_id,value,expiration_time,question_text)
+            answers.flush()
             count += 1
-        except KeyError as e:
-            print(f"Error: failed to analyze {symbol}: {e}")
-            
-    if count == 0:
-        print(f"no symbols found in {screener_config.get(SYMBOLS_DIR)}")
+    finally:
+        if analysis_pool is not None:
+            analysis_pool.shutdown()
+
+    elapsed = time.time() - start
+    print(f"\nanalyzed {count}/{len(symbols)} symbols in {elapsed:.1f}s ({count / elapsed:.2f} symbols/s)")
+    print(f"\tdownload workers={download_workers} analysis workers={analysis_workers} download time={download_time:.1f}s")
+    if len(failed) > 0:
+        print(f"\tfailed: {' '.join(sorted(failed))}")
+
+def init_worker(force,verbose):
+    """ Set up an analysis worker process """
+    global GLOBAL_FORCE
+    global GLOBAL_VERBOSE
+    GLOBAL_FORCE = force
+    GLOBAL_VERBOSE = verbose
+
+def download_symbol(screener_config,symbol):
+    """ Bring a symbol's price history cache up to date, returns the seconds it took """
+    start = time.time()
+    get_price_history(symbol,screener_config.get(CACHE_DIR),TWO_YEAR_DAYS)
+    return time.time() - start
+
+class WorkerAnswers():
+    """ The answers an analysis worker sees: the symbol's cached answers, read only, and
+        the new answers collected to be written by the parent process """
+    def __init__(self,cached_answers):
+        self._cached_answers = cached_answers
+        self._results = list()
+
+    def get(self,question_id,default=None):
+        return self._cached_answers.get(question_id,default)
+
+    def set_answer(self,question_id,value,expiration_timestamp,question_text=None):
+        self._results.append((question_id,value,expiration_timestamp,question_text))
+
+    def get_results(self):
+        return self._results
 
 def analyze_symbol(screener_config,questions,symbol):
+    answers = get_answer_store(screener_config,symbol)
+    answer_questions(screener_config,symbol,answers)
+    answers.flush()
+
+def analyze_symbol_worker(screener_config,symbol,cached_answers):
+    """ Answer a symbol's questions in a worker process, returns the new answers
+        as (question id, value, expiration, question text) """
+    answers = WorkerAnswers(cached_answers)
+    answer_questions(screener_config,symbol,answers)
+    return answers.get_results()
+
+def answer_questions(screener_config,symbol,answers):
     print(f"analyzing symbol {symbol}")
-    answer_file = get_answer_file(screener_config.get(CACHE_DIR),symbol)
-    answers = get_all_answers_from_cache(answer_file)
 
-    price_data = get_two_year_data(symbol,screener_config.get(CACHE_DIR))
+    # The history is cached by now, the indicators are computed (and cached) here
+    price_data = get_price_history(symbol,screener_config.get(CACHE_DIR),TWO_YEAR_DAYS,ATA_INDICATORS)
 
     (value,timestamp) = is_price_uptrending(symbol,price_data,answers)
     (value,timestamp) = is_price_above_20dayEMA(symbol,price_data,answers)
@@ -71,8 +185,6 @@ def analyze_symbol(screener_config,questions,symbol):
     (value,timestamp) = is_slow_stochastic_uptrending(symbol,price_data,answers)
     (value,timestamp) = is_slow_stochastic_above_20(symbol,price_data,answers)
 
-    cache_answers(answer_file,answers)
-
 def is_fresh(cached_answer):
 
     # Check to see if "-f" was passed, if so, ignore freshness
@@ -86,12 +198,7 @@ def is_fresh(cached_answer):
     return False
 
 def store_result(answers,quid,value,expiration_time,question_text):
-    if not quid in answers.keys():
-        answers[quid] = dict()
-        answers[quid][CACHE_QUESTION] = question_text
-
-    answers[quid][CACHE_VALUE] = value
-    answers[quid][CACHE_EXPIRATION_TIMESTAMP] = expiration_time
+    answers.set_answer(quid,value,expiration_time,question_text)
 
 def is_price_uptrending(symbol,price_data,answers):
     now = datetime.datetime.now()
@@ -276,8 +383,7 @@ def is_obv_positive(symbol,price_data,answers):
     debug(f"{symbol} didn't find fresh answer for obv positive")
 
     try: 
-        obv_data = OBV(price_data[COLUMN_CLOSE],price_data[COLUMN_VOLUME])
-        current_obv = get_last_value(obv_data,OBV_LABEL)
+        current_obv = get_last_value(price_data,OBV_LABEL)
     except IndexError as e:
         print(f"{symbol} error: {e}")
         return (value,expiration_time)
@@ -304,12 +410,8 @@ def is_obv_uptrending(symbol,price_data,answers):
     debug(f"{symbol} didn't find fresh answer for obv trending up")
 
     try: 
-        obv_data = OBV(price_data[COLUMN_CLOSE],price_data[COLUMN_VOLUME])
-        obv_data[THREE_DAY_EMA] = EMA(obv_data[OBV_LABEL],3)
-        obv_data[NINE_DAY_EMA] = EMA(obv_data[OBV_LABEL],9)
-
-        three_day_ema = get_last_value(obv_data,THREE_DAY_EMA)
-        nine_day_ema = get_last_value(obv_data,NINE_DAY_EMA)
+        three_day_ema = get_last_value(price_data,OBV_THREE_DAY_EMA)
+        nine_day_ema = get_last_value(price_data,OBV_NINE_DAY_EMA)
         
     except IndexError as e:
         print(f"{symbol} error: {e}")
@@ -337,13 +439,9 @@ def is_macd_uptrending(symbol,price_data,answers):
     debug(f"{symbol} didn't find fresh answer for macd trending up")
 
     try: 
-        macd_data = MACD(price_data[COLUMN_CLOSE])
-        macd_data[THREE_DAY_EMA] = EMA(macd_data[MACD_LABEL],3)
-        macd_data[FIVE_DAY_EMA] = EMA(macd_data[MACD_LABEL],5)
-
-        macd_value = get_last_value(macd_data,MACD_LABEL)
-        three_day_ema = get_last_value(macd_data,THREE_DAY_EMA)
-        five_day_ema = get_last_value(macd_data,FIVE_DAY_EMA)
+        macd_value = get_last_value(price_data,MACD_LABEL)
+        three_day_ema = get_last_value(price_data,MACD_THREE_DAY_EMA)
+        five_day_ema = get_last_value(price_data,MACD_FIVE_DAY_EMA)
         
     except IndexError as e:
         print(f"{symbol} error: {e}")
@@ -371,8 +469,7 @@ def is_macd_divergence_positive(symbol,price_data,answers):
     debug(f"{symbol} didn't find fresh answer for macd divergence positive")
 
     try: 
-        macd_data = MACD(price_data[COLUMN_CLOSE])
-        macd_divergence = get_last_value(macd_data,MACD_DIVERGENCE)
+        macd_divergence = get_last_value(price_data,MACD_DIVERGENCE)
         
     except IndexError as e:
         print(f"{symbol} error: {e}")
@@ -400,8 +497,7 @@ def is_macd_positive(symbol,price_data,answers):
     debug(f"{symbol} didn't find fresh answer for macd value positive")
 
     try: 
-        macd_data = MACD(price_data[COLUMN_CLOSE])
-        macd_value = get_last_value(macd_data,MACD_LABEL)
+        macd_value = get_last_value(price_data,MACD_LABEL)
         
     except IndexError as e:
         print(f"{symbol} error: {e}")
@@ -429,9 +525,8 @@ def is_slow_stochastic_positive(symbol,price_data,answers):
     debug(f"{symbol} didn't find fresh answer for slow stochastic positive")
 
     try: 
-        ss = SSO(price_data[COLUMN_CLOSE],price_data[COLUMN_HIGH],price_data[COLUMN_LOW])
-        k_val = get_last_value(ss,SS_K)
-        d_val = get_last_value(ss,SS_D)
+        k_val = get_last_value(price_data,SS_K)
+        d_val = get_last_value(price_data,SS_D)
         
     except IndexError as e:
         print(f"{symbol} error: {e}")
@@ -459,14 +554,9 @@ def is_slow_stochastic_uptrending(symbol,price_data,answers):
     debug(f"{symbol} didn't find fresh answer for slow stochastic uptrending")
 
     try: 
-        ss = SSO(price_data[COLUMN_CLOSE],price_data[COLUMN_HIGH],price_data[COLUMN_LOW])
-
-        # Get the 3day and 5day EMA of %K
-        ss[THREE_DAY_EMA] = EMA(ss[SS_K],3)
-        ss[FIVE_DAY_EMA] = EMA(ss[SS_K],5)
-
-        three_day_ema = get_last_value(ss,THREE_DAY_EMA)
-        five_day_ema = get_last_value(ss,FIVE_DAY_EMA)
+        # The 3day and 5day EMA of %K
+        three_day_ema = get_last_value(price_data,SS_K_THREE_DAY_EMA)
+        five_day_ema = get_last_value(price_data,SS_K_FIVE_DAY_EMA)
         
     except IndexError as e:
         print(f"{symbol} error: {e}")
@@ -495,8 +585,7 @@ def is_slow_stochastic_above_20(symbol,price_data,answers):
     debug(f"{symbol} didn't find fresh answer for slow stochastic > 20")
 
     try: 
-        ss = SSO(price_data[COLUMN_CLOSE],price_data[COLUMN_HIGH],price_data[COLUMN_LOW])
-        k = get_last_value(ss,SS_K)
+        k = get_last_value(price_data,SS_K)
         
     except IndexError as e:
         print(f"{symbol} error: {e}")
@@ -525,6 +614,8 @@ if __name__ == "__main__":
     parser.add_argument('-v','--verbose', dest='verbose', required=False,default=False,action='store_true',help="Increase verbosity")
     parser.add_argument('-s','--symbol', dest='symbol', required=False,default=None,help="Analyze a symbol")
     parser.add_argument('-f','--force', dest='force', required=False,default=False,action='store_true',help="Force update (ignore fresh answers)")
+    parser.add_argument('-d','--download-workers', dest='download_workers', required=False,default=DEFAULT_DOWNLOAD_WORKERS,type=int,help="Number of threads downloading price history")
+    parser.add_argument('-j','--analysis-workers', dest='analysis_workers', required=False,default=DEFAULT_ANALYSIS_WORKERS,type=int,help="Number of processes analyzing symbols (1 analyzes in this process)")
     args = parser.parse_args()
 
     GLOBAL_VERBOSE = args.verbose
@@ -538,5 +629,5 @@ if __name__ == "__main__":
     if args.symbol:
         analyze_symbol(screener_config,questions,args.symbol)
     else:
-        main(screener_config,questions)
+        main(screener_config,questions,args.download_workers,args.analysis_workers)
 
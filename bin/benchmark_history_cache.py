@@ -0,0 +1,60 @@
+#! /usr/bin/python3
+
+import argparse
+import glob
+import os
+import tempfile
+import time
+from screener_tools import *
+
+DEFAULT_SCREENER_CONFIG_FILE="./etc/stock_screener.json"
+
+def main(screener_config_file,cache_dir):
+    if cache_dir is None:
+        screener_config = read_json_file(screener_config_file)
+        cache_dir = screener_config.get(CACHE_DIR)
+
+    migrated = migrate_history_cache(cache_dir)
+    if migrated > 0:
+        print(f"converted {migrated} csv history caches in {cache_dir}")
+
+    history_files = sorted(glob.glob(os.path.join(expanduser(cache_dir),f"*{HISTORY_CACHE_SUFFIX}")))
+    if len(history_files) == 0:
+        print(f"no history caches found in {cache_dir}")
+        return
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # Write the same data as csv for comparison
+        csv_files = list()
+        for history_file in history_files:
+            csv_file = os.path.join(temp_dir,os.path.basename(history_file) + ".csv")
+            read_history_file(history_file)[0].to_csv(csv_file)
+            csv_files.append(csv_file)
+
+        start = time.time()
+        rows = 0
+        for history_file in history_files:
+            rows += len(read_history_file(history_file)[0])
+        binary_time = time.time() - start
+
+        start = time.time()
+        for csv_file in csv_files:
+            price_data = pd.read_csv(csv_file,index_col=0)
+            price_data.index = pd.to_datetime(price_data.index)
+        csv_time = time.time() - start
+
+        binary_size = sum([os.path.getsize(history_file) for history_file in history_files])
+        csv_size = sum([os.path.getsize(csv_file) for csv_file in csv_files])
+
+    print(f"loaded {len(history_files)} symbols ({rows} rows)")
+    print(f"\tbinary: {binary_time:7.3f}s {binary_size / 1024 / 1024:8.2f}MB")
+    print(f"\tcsv   : {csv_time:7.3f}s {csv_size / 1024 / 1024:8.2f}MB ({csv_time / binary_time:.1f}x slower)")
+
+if __name__ == "__main__":
+    # Setup the argument parsing
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-c','--config-file', dest='config_file', help="screener configuration file", default=DEFAULT_SCREENER_CONFIG_FILE)
+    parser.add_argument('-d','--cache-dir', dest='cache_dir', required=False,default=None,help="History cache directory (default is the screener config's cache_dir)")
+
+    args = parser.parse_args()
+    main(args.config_file,args.cache_dir)
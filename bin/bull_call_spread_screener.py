@@ -2,6 +2,7 @@
 
 import argparse
 import datetime
+import numpy as np
 import sys
 from etrade_tools import *
 
@@ -17,8 +18,9 @@ DEFAULT_MIN_LONG_DELTA=1.0
 
 global GLOBAL_DEBUG
 global GLOBAL_VERBOSE
+global GLOBAL_REFRESH
 
-def main(config_file,screener_config_file,option_parameters_file,symbol_list,expiration,output_file):
+def main(config_file,screener_config_file,option_parameters_file,symbol_list,expiration,output_file,score_file=None):
     count = 0
     fh = None
     screener_config = read_json_file(screener_config_file)
@@ -30,15 +32,30 @@ def main(config_file,screener_config_file,option_parameters_file,symbol_list,exp
         except (PermissionError, IOError) as e:
             print(f"Error: could not open {output_file} for writing: {e}")
             sys.exit(1)
+    (quotes, missing) = get_quotes(config_file, symbol_list, screener_config)
+    for symbol in missing:
+        print(f"{symbol} symbol not found")
+
+    # Fetch the option chains for all the quoted symbols concurrently
+    quoted_symbols = [symbol for symbol in symbol_list if symbol in quotes]
+    option_chains = dict(zip(quoted_symbols, get_option_chains(config_file, [(symbol, expiration) for symbol in quoted_symbols], refresh=GLOBAL_REFRESH)))
+    if score_file:
+        scores = read_score_table(score_file)
+    else:
+        scores = get_scores(screener_config, quoted_symbols)
+
     for symbol in symbol_list:
         count += 1
-        option_list = get_bull_call_spreads(config_file,screener_config,option_parameters,symbol,expiration)
+        quote = quotes.get(symbol,None)
+        if quote is None:
+            continue
+        option_list = get_bull_call_spreads(config_file,screener_config,option_parameters,symbol,expiration,quote=quote,option_chain=option_chains.get(symbol))
         for bcs in option_list:
             if output_file:
                 fh.write(f"{symbol.upper()}," + 
                     '"' + f"{bcs.get('company_name')}" + '",' +
                     '"' + f"{bcs.get('sector')}" + '",' +
-                    f"{get_score(screener_config,symbol)},"+
+                    f"{scores.get(symbol.upper(),0.0)},"+
                     f"{bcs.get('stock_price'):.2f}," +
                     f"{bcs.get('days')},"+
                     f"{bcs.get('long_call_strike'):.2f}," +
@@ -66,17 +83,23 @@ def main(config_file,screener_config_file,option_parameters_file,symbol_list,exp
     if count == 0:
         print("No symbols found")
 
-def get_bull_call_spreads(config_file,screener_config,option_parameters,symbol,expiration):
+def get_bull_call_spreads(config_file,screener_config,option_parameters,symbol,expiration,quote=None,option_chain=None):
     # Get the option chain
     call_spread_list = list()
+    if isinstance(option_chain, Exception):
+        print(f"{symbol} No option chain found for {expiration}: {option_chain}")
+        return call_spread_list
+
     try:
-        option_chain = get_option_chain(config_file, symbol, expiration)
+        if option_chain is None:
+            option_chain = get_option_chain(config_file, symbol, expiration, refresh=GLOBAL_REFRESH)
     except OptionChainNotFoundError as e:
         print(f"{symbol} No option chain found for {expiration}")
         return call_spread_list
 
-    # Get the most recent quote
-    quote = get_quote(config_file, symbol, screener_config)
+    # Get the most recent quote (unless one was prefetched)
+    if quote is None:
+        quote = get_quote(config_file, symbol, screener_config)
 
     price = quote.get_price()
 
@@ -85,120 +108,163 @@ def get_bull_call_spreads(config_file,screener_config,option_parameters,symbol,e
     min_downside = option_parameters.get("min_downside", DEFAULT_MIN_DOWNSIDE)
     min_short_call_delta = option_parameters.get("min_short_delta", DEFAULT_MIN_SHORT_DELTA)
     min_long_call_delta = option_parameters.get("min_long_delta", DEFAULT_MIN_LONG_DELTA)
-    
-    days = 0
+
+    # Calculate the number of days until expiration
+    time_delta = option_chain.get_expiration().date() - datetime.date.today()
+    days = time_delta.days
+
+    strikes = option_chain.get_strike_array()
+    open_interest = option_chain.get_call_array(OPTION_OPEN_INTEREST)
+    deltas = option_chain.get_call_array(OPTION_DELTA)
+
+    spreads = find_spread_pairs(
+            strikes,
+            option_chain.get_call_array(OPTION_BID),
+            option_chain.get_call_array(OPTION_ASK),
+            open_interest,
+            deltas,
+            price,
+            days,
+            min_open_interest,
+            min_annual_roo,
+            min_downside,
+            min_short_call_delta,
+            min_long_call_delta)
+
     count = 0
-    for long_call_strike_price in option_chain.get_strike_prices():
+    for spread in spreads:
+        long_call_strike_price = float(strikes[spread.get("long")])
+        short_call_strike_price = float(strikes[spread.get("short")])
         long_call = option_chain.get_call_option(long_call_strike_price)
+        short_call = option_chain.get_call_option(short_call_strike_price)
+
+        long_call_ask = spread.get("long_call_ask")
+        long_call_theta = spread.get("long_call_theta")
+        short_call_bid = spread.get("short_call_bid")
+        short_call_theta = spread.get("short_call_theta")
+        theta_spread = spread.get("theta_spread")
+        cost = spread.get("cost")
+        return_on_spread = spread.get("return_on_spread")
+        roo_annualized = spread.get("roo_annualized")
+        downside_protection = spread.get("downside_protection")
 
-        if long_call.get_adjusted_flag is False:
-            debug(f"LC: {symbol}/{long_call_strike_price} is an adjusted option")
-            continue
-            
-        if days == 0:
-            # Calculate the number of days until expiration
-            time_delta = option_chain.get_expiration().date() - datetime.date.today()
-            days = time_delta.days
-
-        # Filter on long call open interest
-        if long_call.get_open_interest() < min_open_interest:
-            debug(f"LC: {symbol}/{long_call_strike_price}: long call open interest too low {long_call.get_open_interest()} < {min_open_interest}")
-            continue
-            
-        if long_call.get_delta() < min_long_call_delta:
-            debug(f"LC: {symbol}/{long_call_strike_price}: long call delta too low {long_call.get_delta():.2f} < {min_long_call_delta}")
-            break
+        count += 1
 
-        for short_call_strike_price in option_chain.get_strike_prices():
-            short_call = option_chain.get_call_option(short_call_strike_price)
+        if GLOBAL_VERBOSE:
+            print(f"{symbol.upper()}({option_chain.get_expiration().date()}) Bull Credit Spread: days={days}  price=${price:.2f}  beta={quote.get_beta():.2f}")
+            print(f"\tLong Call : ${long_call_strike_price:6.2f}  ask=${long_call_ask:.2f}  time value=${long_call_theta:.2f}  oi={long_call.get_open_interest()}  delta={long_call.get_delta()}")
+            print(f"\tShort Call: ${short_call_strike_price:6.2f}  bid=${short_call_bid:.2f}  time value=${short_call_theta:.2f}  oi={short_call.get_open_interest()}  delta={short_call.get_delta()}")
+            print(f"\tBreak even: ${short_call_strike_price - theta_spread:9.2f}")
+            print(f"\tCost      : ${cost:9.2f}")
+            print(f"\tProfit    : ${100*theta_spread:9.2f}")
+            print(f"\tROO       : {100*return_on_spread:10.2f}% ({100*roo_annualized:6.2f}%)")
+            print(f"\tProtection: {100*downside_protection:10.2f}%")
+            print()
+        else:
+            print(f"{symbol} long call: {long_call_strike_price} short call : {short_call_strike_price}: downside protection {100 * downside_protection:.2f}% annualized roo {100 * roo_annualized:.2f}% profit=${100*theta_spread:.2f} cost=${cost:.2f}")
+
+        matching_call_spread = {
+            "days" : days,
+            "long_call_strike"       : long_call_strike_price,
+            "long_call_ask"          : long_call_ask,
+            "long_call_time_value"   : long_call_theta,
+            "long_call_oi"           : long_call.get_open_interest(),
+            "long_call_delta"        : long_call.get_delta(),
+            "short_call_strike"      : short_call_strike_price,
+            "short_call_bid"         : short_call_bid,
+            "short_call_time_value"  : short_call_theta,
+            "short_call_oi"          : short_call.get_open_interest(),
+            "short_call_delta"       : short_call.get_delta(),
+            "break_even"             : short_call_strike_price - theta_spread,
+            "cost"                   : cost,
+            "profit"                 : 100 * theta_spread,
+            "roo"                    : 100 * return_on_spread,
+            "roo_annual"             : 100 * roo_annualized,
+            "downside"               : 100 * downside_protection,
+            "sector"                 : quote.get_sector(),
+            "company_name"           : quote.get_company_name(),
+            "stock_price"            : quote.get_price()
+            }
+        call_spread_list.append(matching_call_spread)
 
-            if short_call_strike_price <= long_call_strike_price:
-                continue
+    if count == 0:
+        print(f"{symbol}: No matching bull call spreads found")
 
-            if short_call.get_adjusted_flag is False:
-                debug(f"SC: {symbol}/{short_call_strike_price} is an adjusted option")
-                continue
-                
-            # Filter on long call open interest
-            if short_call.get_open_interest() < min_open_interest:
-                debug(f"SC: {symbol}/{short_call_strike_price}: short call open interest too low {short_call.get_open_interest()} < {min_open_interest}")
-                continue
-                
-            if short_call.get_delta() < min_short_call_delta:
-                debug(f"SC: {symbol}/{short_call_strike_price}: short call delta too low {short_call.get_delta():.2f} < {min_short_call_delta}")
+    return call_spread_list
+
+def find_spread_pairs(strikes, bids, asks, open_interest, deltas, price, days,
+        min_open_interest, min_annual_roo, min_downside, min_short_call_delta, min_long_call_delta):
+    """ Find the (long, short) strike index pairs of a chain's calls that make a
+        qualifying bull call spread, in (long strike, short strike) order.
+
+        The arrays are aligned with the ascending strikes. Rather than testing
+        every pair, the search uses the ordering of the chain:
+          - downside protection falls as the short strike rises, so only a prefix
+            of the strikes can be a short call
+          - the first liquid long call under min_long_call_delta ends the search
+          - for each long call, the first liquid strike above it with a delta
+            under min_short_call_delta ends its short call window
+        The surviving short call window is evaluated with array operations """
+    spreads = list()
+
+    # A strike without a call, or a call missing a price, delta or open interest, is never used
+    with np.errstate(invalid="ignore"):
+        liquid = (np.isfinite(open_interest) & (open_interest >= min_open_interest)
+            & np.isfinite(asks) & np.isfinite(bids) & np.isfinite(deltas))
+    downside = 1 - (strikes / price)
+    max_short = np.count_nonzero(downside >= min_downside)
+
+    # Liquid strikes whose delta is too low to be a short call
+    short_delta_breaks = (liquid & (deltas < min_short_call_delta)).nonzero()[0]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for long_index in liquid.nonzero()[0]:
+            if long_index + 1 >= max_short:
                 break
 
-            long_call_ask = long_call.get_ask()
-            long_call_theta = long_call_ask - (price - long_call_strike_price)
+            if deltas[long_index] < min_long_call_delta:
+                debug(f"LC: {strikes[long_index]}: long call delta too low {deltas[long_index]:.2f} < {min_long_call_delta}")
+                break
 
-            short_call_bid = short_call.get_bid()
-            short_call_theta = short_call_bid - (price - short_call_strike_price)
+            # The short call window ends at the first liquid strike above the long with too low a delta
+            position = np.searchsorted(short_delta_breaks, long_index, side="right")
+            window_end = max_short
+            if position < len(short_delta_breaks):
+                window_end = min(window_end, short_delta_breaks[position])
 
-            downside_protection = 1 - (short_call_strike_price / price)
-            if downside_protection < min_downside:
-                debug(f"LC({long_call_strike_price})/SC({short_call_strike_price}) downside protection {downside_protection:.2f} < {min_downside}")
+            short_index = np.arange(long_index + 1, window_end)
+            short_index = short_index[liquid[short_index]]
+            if len(short_index) == 0:
                 continue
 
+            long_call_ask = asks[long_index]
+            long_call_theta = long_call_ask - (price - strikes[long_index])
+            short_call_bid = bids[short_index]
+            short_call_theta = short_call_bid - (price - strikes[short_index])
             theta_spread = short_call_theta - long_call_theta
 
-            if theta_spread < 0:
-                debug(f"LC({long_call_strike_price})/SC({short_call_strike_price}) theta spread {theta_spread:.2f} < 0")
-                continue
-
             cost = 100 * (long_call_ask - short_call_bid)
-
-            return_on_spread = 0
-            if cost > 0:
-                return_on_spread = (100 * theta_spread) / cost
-            roo_annualized = (365/days) * return_on_spread
-
-            if roo_annualized < min_annual_roo:
-                debug(f"LC({long_call_strike_price})/SC({short_call_strike_price}) annualize roo {roo_annualized:.2f} < {min_annual_roo}")
-                continue
-
-            count += 1
-
-            if GLOBAL_VERBOSE:
-                print(f"{symbol.upper()}({option_chain.get_expiration().date()}) Bull Credit Spread: days={days}  price=${price:.2f}  beta={quote.get_beta():.2f}")
-                print(f"\tLong Call : ${long_call_strike_price:6.2f}  ask=${long_call_ask:.2f}  time value=${long_call_theta:.2f}  oi={long_call.get_open_interest()}  delta={long_call.get_delta()}")
-                print(f"\tShort Call: ${short_call_strike_price:6.2f}  bid=${short_call_bid:.2f}  time value=${short_call_theta:.2f}  oi={short_call.get_open_interest()}  delta={short_call.get_delta()}")
-                print(f"\tBreak even: ${short_call_strike_price - theta_spread:9.2f}")
-                print(f"\tCost      : ${cost:9.2f}")
-                print(f"\tProfit    : ${100*theta_spread:9.2f}")
-                print(f"\tROO       : {100*return_on_spread:10.2f}% ({100*roo_annualized:6.2f}%)")
-                print(f"\tProtection: {100*downside_protection:10.2f}%")
-                print()
-            else:
-                print(f"{symbol} long call: {long_call_strike_price} short call : {short_call_strike_price}: downside protection {100 * downside_protection:.2f}% annualized roo {100 * roo_annualized:.2f}% profit=${100*theta_spread:.2f} cost=${cost:.2f}")
-
-            matching_call_spread = {
-                "days" : days,
-                "long_call_strike"       : long_call_strike_price,
-                "long_call_ask"          : long_call_ask,
-                "long_call_time_value"   : long_call_theta,
-                "long_call_oi"           : long_call.get_open_interest(),
-                "long_call_delta"        : long_call.get_delta(),
-                "short_call_strike"      : short_call_strike_price,
-                "short_call_bid"         : short_call_bid,
-                "short_call_time_value"  : short_call_theta,
-                "short_call_oi"          : short_call.get_open_interest(),
-                "short_call_delta"       : short_call.get_delta(),
-                "break_even"             : short_call_strike_price - theta_spread,
-                "cost"                   : cost,
-                "profit"                 : 100 * theta_spread,
-                "roo"                    : 100 * return_on_spread,
-                "roo_annual"             : 100 * roo_annualized,
-                "downside"               : 100 * downside_protection,
-                "sector"                 : quote.get_sector(),
-                "company_name"           : quote.get_company_name(),
-                "stock_price"            : quote.get_price()
-                }
-            call_spread_list.append(matching_call_spread)
-
-    if count == 0:
-        print(f"{symbol}: No matching bull call spreads found")
-
-    return call_spread_list
+            return_on_spread = np.where(cost > 0, (100 * theta_spread) / cost, 0)
+            roo_annualized = (365 / days) * return_on_spread
+
+            matches = (theta_spread >= 0) & (roo_annualized >= min_annual_roo)
+            debug(f"LC: {strikes[long_index]}: {np.count_nonzero(matches)} of {len(short_index)} short calls match")
+
+            for index in matches.nonzero()[0]:
+                spreads.append({
+                    "long"                : int(long_index),
+                    "short"               : int(short_index[index]),
+                    "long_call_ask"       : float(long_call_ask),
+                    "long_call_theta"     : float(long_call_theta),
+                    "short_call_bid"      : float(short_call_bid[index]),
+                    "short_call_theta"    : float(short_call_theta[index]),
+                    "theta_spread"        : float(theta_spread[index]),
+                    "cost"                : float(cost[index]),
+                    "return_on_spread"    : float(return_on_spread[index]),
+                    "roo_annualized"      : float(roo_annualized[index]),
+                    "downside_protection" : float(downside[short_index[index]])
+                    })
+    return spreads
 
 def get_symbols_from_results_file(results_file):
     symbols = list()
@@ -230,6 +296,8 @@ if __name__ == "__main__":
     parser.add_argument('-d','--debug', dest='debug_flag', required=False,default=False,action='store_true',help="Enable debugging" )
     parser.add_argument('-v','--verbose', dest='verbose', required=False,default=False,action='store_true',help="Increase verbosity")
     parser.add_argument('-p','--paramaters', dest='parameters',default=DEFAULT_PARAMS_FILE,help="Option parameters configuration" )
+    parser.add_argument('--refresh', dest='refresh', required=False,default=False,action='store_true',help="Ignore cached option chains and fetch fresh ones")
+    parser.add_argument('--scores', dest='score_file', required=False,default=None,help="Use the scores from a rank_symbols.py output file")
 
     expiration = None
     args = parser.parse_args()
@@ -239,6 +307,7 @@ if __name__ == "__main__":
         expiration = datetime.datetime(year=int(y),month=int(m), day=int(d))
 
     GLOBAL_VERBOSE = args.verbose
+    GLOBAL_REFRESH = args.refresh
     GLOBAL_DEBUG = args.debug_flag
 
     if args.symbol and args.results:
@@ -262,5 +331,5 @@ if __name__ == "__main__":
         sys.exit(1)
 
     screener_config_file = DEFAULT_SCREENER_CONFIG
-    main(args.config_file,screener_config_file,args.parameters,symbol_list,expiration,args.output)
+    main(args.config_file,screener_config_file,args.parameters,symbol_list,expiration,args.output,args.score_file)
 
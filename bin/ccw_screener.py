@@ -2,6 +2,7 @@
 
 import argparse
 import datetime
+import numpy as np
 import sys
 from etrade_tools import *
 
@@ -27,8 +28,9 @@ PCR_STRING_OVERBOUGHT="over bought"
 
 global GLOBAL_DEBUG
 global GLOBAL_VERBOSE
+global GLOBAL_REFRESH
 
-def main(config_file,screener_config_file,market_tone_config,symbol_list,expiration,output_file):
+def main(config_file,screener_config_file,market_tone_config,symbol_list,expiration,output_file,score_file=None):
     count = 0
     fh = None
     screener_config = read_json_file(screener_config_file)
@@ -39,9 +41,24 @@ def main(config_file,screener_config_file,market_tone_config,symbol_list,expirat
         except (PermissionError, IOError) as e:
             print(f"Error: could not open {output_file} for writing: {e}")
             sys.exit(1)
+    (quotes, missing) = get_quotes(config_file, symbol_list, screener_config)
+    for symbol in missing:
+        print(f"{symbol} symbol not found")
+
+    # Fetch the option chains for all the quoted symbols concurrently
+    quoted_symbols = [symbol for symbol in symbol_list if symbol in quotes]
+    option_chains = dict(zip(quoted_symbols, get_option_chains(config_file, [(symbol, expiration) for symbol in quoted_symbols], refresh=GLOBAL_REFRESH)))
+    if score_file:
+        scores = read_score_table(score_file)
+    else:
+        scores = get_scores(screener_config, quoted_symbols)
+
     for symbol in symbol_list:
         count += 1
-        option_list = find_covered_calls(config_file,screener_config_file,market_tone_config,symbol,expiration)
+        quote = quotes.get(symbol,None)
+        if quote is None:
+            continue
+        option_list = find_covered_calls(config_file,screener_config_file,market_tone_config,symbol,expiration,quote=quote,option_chain=option_chains.get(symbol))
 
         for cco in option_list:
             if GLOBAL_VERBOSE:
@@ -59,7 +76,7 @@ def main(config_file,screener_config_file,market_tone_config,symbol_list,expirat
                 fh.write(f"{symbol.upper()}," + 
                     '"' + f"{cco.get('company_name')}" + '",' +
                     '"' + f"{cco.get('sector')}" + '",' +
-                    f"{get_score(screener_config,symbol)},"+
+                    f"{scores.get(symbol.upper(),0.0)},"+
                     '"' + f"{cco.get('display_symbol')}" +'",' +
                     f"{cco.get('days')},"+
                     f"{cco.get('stock_price'):.2f}," +
@@ -91,21 +108,27 @@ def main(config_file,screener_config_file,market_tone_config,symbol_list,expirat
     if count == 0:
         print("No symbols found")
 
-def find_covered_calls(config_file,screener_config_file,market_tone_config,symbol,expiration):
+def find_covered_calls(config_file,screener_config_file,market_tone_config,symbol,expiration,quote=None,option_chain=None):
     option_list = list()
     # Get the market tone config
     tone_config = read_json_file(market_tone_config)
 
     # Get the option chain
+    if isinstance(option_chain, Exception):
+        print(f"{symbol} No option chain found for {expiration}: {option_chain}")
+        return option_list
+
     try:
-        option_chain = get_option_chain(config_file, symbol, expiration)
+        if option_chain is None:
+            option_chain = get_option_chain(config_file, symbol, expiration, refresh=GLOBAL_REFRESH)
     except OptionChainNotFoundError as e:
         print(f"{symbol} No option chain found for {expiration}")
         return option_list
 
-    # Get the most recent quote
-    screener_config = read_json_file(screener_config_file)
-    quote = get_quote(config_file, symbol,screener_config)
+    # Get the most recent quote (unless one was prefetched)
+    if quote is None:
+        screener_config = read_json_file(screener_config_file)
+        quote = get_quote(config_file, symbol,screener_config)
     stock_price = quote.get_price()
     beta = quote.get_beta()
 
@@ -116,134 +139,131 @@ def find_covered_calls(config_file,screener_config_file,market_tone_config,symbo
     elif pcr <= PCR_VALUE_OVERBOUGHT:
         pcr_string = PCR_STRING_OVERBOUGHT
 
-    days = 0
-    count = 0
-
-    for strike_price in option_chain.get_strike_prices():
-        if days == 0:
-            # Calculate the number of days until expiration
-            time_delta = option_chain.get_expiration().date() - datetime.date.today()
-            days = time_delta.days
-
-        call = option_chain.get_call_option(strike_price)
-
-        if call.get_adjusted_flag is False:
-            debug(f"{call.get_display_symbol()} is an adjusted option, skipping")
-            continue
-
-        open_interest = call.get_open_interest()
-        call_premium = call.get_bid()
-        ask_premium = call.get_ask()
-        max_pain = option_chain.get_max_pain()
-        mark = float((call_premium + ask_premium)/2)
-
-        intrinsic_value = 0.0
-        stock_upside = 0.0
-        time_value = call_premium
-
-        if strike_price < stock_price:
-            # In the money
-            intrinsic_value = stock_price - strike_price
-            time_value = call_premium - intrinsic_value
-            stock_upside = 0.0
-        else:
-            intrinsic_value = 0.0
-            time_value = call_premium
-            stock_upside = strike_price - stock_price
-
-        roo = time_value / strike_price
-        upside = stock_upside / stock_price
-        total_gain = roo + upside
-
-        total_cost = 100 * (stock_price - call_premium)
-
-        total_profit = time_value + stock_upside 
-
-        roo_annual = (365/days) * roo
-        upside_annual = (365/days) * upside
-        total_annual = roo_annual + upside_annual
-
-        downside_protection = intrinsic_value / stock_price
-        delta = call.get_delta()
-
-        min_open_interest = tone_config.get("min_open_interest",DEFAULT_MIN_OPEN_INTEREST)
-        min_annual_roo = tone_config.get("min_annual_roo", DEFAULT_MIN_ANNUAL_ROO)
-        max_annual_roo = tone_config.get("max_annual_roo", DEFAULT_MAX_ANNUAL_ROO)
-        min_annual_upside = tone_config.get("min_annual_upside", DEFAULT_MIN_ANNUAL_UPSIDE)
-        min_downside = tone_config.get("min_downside", DEFAULT_MIN_DOWNSIDE)
-        min_delta = tone_config.get("min_delta", DEFAULT_MIN_DELTA)
-        max_delta = tone_config.get("max_delta", DEFAULT_MAX_DELTA)
+    # Calculate the number of days until expiration
+    days = (option_chain.get_expiration().date() - datetime.date.today()).days
 
-        if open_interest < min_open_interest:
-            debug(f"{call.get_display_symbol()} open_interest {open_interest} is too low min={min_open_interest}")
-            continue
-
-        if downside_protection < min_downside:
-            # Not enough downside protection
-            debug(f"{call.get_display_symbol()} downside_protection {downside_protection:.2f} is too low min={min_downside}")
-            continue
-
-        if roo_annual < min_annual_roo:
-            # Not enough option profit potential
-            debug(f"{call.get_display_symbol()} roo_annual {roo_annual:.2f} is too low min={min_annual_roo}")
-            continue
-
-        if delta > 0 and delta < min_delta:
-            # delta is too low
-            debug(f"{call.get_display_symbol()} delta {delta} is too low min={min_delta}")
-            continue
-
-        if delta > tone_config.get("max_delta", DEFAULT_MAX_DELTA):
-            # delta is too high
-            debug(f"{call.get_display_symbol()} delta {delta} is too high max={max_delta}")
-            continue
+    thresholds = get_tone_thresholds(tone_config)
+    strikes = option_chain.get_strike_array()
+    open_interest = option_chain.get_call_array(OPTION_OPEN_INTEREST)
+    bids = option_chain.get_call_array(OPTION_BID)
+    asks = option_chain.get_call_array(OPTION_ASK)
+    deltas = option_chain.get_call_array(OPTION_DELTA)
 
-        if roo_annual > max_annual_roo:
-            # Too risky on the option
-            debug(f"{call.get_display_symbol()} roo_annual {roo_annual:.2f} is too high max={max_annual_roo}")
-            continue
+    (metrics, filters) = covered_call_kernel(strikes, bids, asks, open_interest, deltas, stock_price, days, thresholds)
+    passed = np.logical_and.reduce([mask for (reason, values, mask) in filters]) if len(strikes) else np.zeros(0, dtype=bool)
 
-        if upside_annual < min_annual_upside:
-            # Not enough upside profit potential
-            debug(f"{call.get_display_symbol()} upside_annual {upside_annual:.2f} is too low min={min_annual_upside}")
-            continue
+    if GLOBAL_DEBUG:
+        for index in (~passed).nonzero()[0]:
+            (reason, values) = next((reason, values) for (reason, values, mask) in filters if not mask[index])
+            call = option_chain.get_call_option(option_chain.get_strike_prices()[index])
+            debug(f"{call.get_display_symbol()} {reason.format(value=values[index])}")
 
-        count += 1
+    max_pain = option_chain.get_max_pain()
+    for index in passed.nonzero()[0]:
+        call = option_chain.get_call_option(option_chain.get_strike_prices()[index])
 
         matching_call = {
             "display_symbol": call.get_display_symbol(),
             "days" : days,
             "stock_price" : stock_price,
-            "premium" : call_premium,
-            "mark" : mark,
-            "total_cost" : total_cost,
-            "oi" : open_interest,
+            "premium" : float(bids[index]),
+            "mark" : float(metrics["mark"][index]),
+            "total_cost" : float(metrics["total_cost"][index]),
+            "oi" : int(open_interest[index]),
             "beta" : beta,
             "pcr" : pcr,
             "pcr_string" : pcr_string,
             "max_pain" : max_pain,
-            "roo" : roo * 100,
-            "roo_annual" : roo_annual * 100,
-            "downside" : downside_protection * 100,
-            "delta" : delta,
-            "profit" : time_value * 100,
-            "upside" : upside * 100,
-            "upside_annual" : upside_annual * 100,
-            "upside_profit" : stock_upside * 100,
-            "total_gain" : total_gain * 100,
-            "total_annual" : total_annual * 100,
-            "total_profit" : total_profit * 100,
+            "roo" : float(metrics["roo"][index]) * 100,
+            "roo_annual" : float(metrics["roo_annual"][index]) * 100,
+            "downside" : float(metrics["downside"][index]) * 100,
+            "delta" : float(deltas[index]),
+            "profit" : float(metrics["time_value"][index]) * 100,
+            "upside" : float(metrics["upside"][index]) * 100,
+            "upside_annual" : float(metrics["upside_annual"][index]) * 100,
+            "upside_profit" : float(metrics["stock_upside"][index]) * 100,
+            "total_gain" : float(metrics["total_gain"][index]) * 100,
+            "total_annual" : float(metrics["total_annual"][index]) * 100,
+            "total_profit" : float(metrics["total_profit"][index]) * 100,
             "sector" : quote.get_sector(),
             "company_name" : quote.get_company_name()
         }
 
         option_list.append(matching_call)
 
-    if count == 0:
+    if len(option_list) == 0:
         print(f"{symbol} No matching options found")
 
     return option_list
 
+def get_tone_thresholds(tone_config):
+    """ Read the screening thresholds out of a market tone config once """
+    return {
+        "min_open_interest" : tone_config.get("min_open_interest",DEFAULT_MIN_OPEN_INTEREST),
+        "min_annual_roo" : tone_config.get("min_annual_roo", DEFAULT_MIN_ANNUAL_ROO),
+        "max_annual_roo" : tone_config.get("max_annual_roo", DEFAULT_MAX_ANNUAL_ROO),
+        "min_annual_upside" : tone_config.get("min_annual_upside", DEFAULT_MIN_ANNUAL_UPSIDE),
+        "min_downside" : tone_config.get("min_downside", DEFAULT_MIN_DOWNSIDE),
+        "min_delta" : tone_config.get("min_delta", DEFAULT_MIN_DELTA),
+        "max_delta" : tone_config.get("max_delta", DEFAULT_MAX_DELTA)
+    }
+
+def covered_call_kernel(strikes, bids, asks, open_interest, deltas, stock_price, days, thresholds):
+    """ Evaluate a covered call on every strike of a chain at once.
+
+        strikes, bids, asks, open_interest and deltas are aligned numpy arrays for
+        the calls, thresholds comes from get_tone_thresholds(). Returns a tuple of
+        (metrics, filters): metrics is a dict of per-strike arrays (ratios, not
+        percentages) and filters is a list of (reason, values, pass mask) in the order
+        the filters are applied. reason formats the failing strike's value. A strike
+        passes a filter only when its value is known (NaN fails) """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        in_the_money = strikes < stock_price
+        intrinsic_value = np.where(in_the_money, stock_price - strikes, 0.0)
+        time_value = bids - intrinsic_value
+        stock_upside = np.where(in_the_money, 0.0, strikes - stock_price)
+
+        roo = time_value / strikes
+        upside = stock_upside / stock_price
+        roo_annual = (365 / days) * roo
+        upside_annual = (365 / days) * upside
+
+        metrics = {
+            "mark" : (bids + asks) / 2,
+            "intrinsic_value" : intrinsic_value,
+            "time_value" : time_value,
+            "stock_upside" : stock_upside,
+            "roo" : roo,
+            "upside" : upside,
+            "total_gain" : roo + upside,
+            "total_cost" : 100 * (stock_price - bids),
+            "total_profit" : time_value + stock_upside,
+            "roo_annual" : roo_annual,
+            "upside_annual" : upside_annual,
+            "total_annual" : roo_annual + upside_annual,
+            "downside" : intrinsic_value / stock_price
+        }
+
+    min_delta = thresholds.get("min_delta")
+    max_delta = thresholds.get("max_delta")
+    with np.errstate(invalid="ignore"):
+        filters = [
+            (f"open_interest {{value:.0f}} is too low min={thresholds.get('min_open_interest')}", open_interest,
+                open_interest >= thresholds.get("min_open_interest")),
+            (f"downside_protection {{value:.2f}} is too low min={thresholds.get('min_downside')}", metrics["downside"],
+                metrics["downside"] >= thresholds.get("min_downside")),
+            (f"roo_annual {{value:.2f}} is too low min={thresholds.get('min_annual_roo')}", roo_annual,
+                roo_annual >= thresholds.get("min_annual_roo")),
+            # A delta of 0 (no greeks) isn't too low
+            (f"delta {{value}} is too low min={min_delta}", deltas, (deltas <= 0) | (deltas >= min_delta)),
+            (f"delta {{value}} is too high max={max_delta}", deltas, deltas <= max_delta),
+            (f"roo_annual {{value:.2f}} is too high max={thresholds.get('max_annual_roo')}", roo_annual,
+                roo_annual <= thresholds.get("max_annual_roo")),
+            (f"upside_annual {{value:.2f}} is too low min={thresholds.get('min_annual_upside')}", upside_annual,
+                upside_annual >= thresholds.get("min_annual_upside"))
+        ]
+    return (metrics, filters)
+
 def debug(msg):
     if GLOBAL_DEBUG:
         print(msg)
@@ -274,6 +294,8 @@ if __name__ == "__main__":
     parser.add_argument('-d','--debug', dest='debug', required=False,default=False,action='store_true',help="Enable debugging" )
     parser.add_argument('-v','--verbose', dest='verbose', required=False,default=False,action='store_true',help="Increase verbosity")
     parser.add_argument('-m','--market-tone', dest='market_tone',default=DEFAULT_TONE_FILE,help="Market tone configuration" )
+    parser.add_argument('--refresh', dest='refresh', required=False,default=False,action='store_true',help="Ignore cached option chains and fetch fresh ones")
+    parser.add_argument('--scores', dest='score_file', required=False,default=None,help="Use the scores from a rank_symbols.py output file")
 
     expiration = None
     args = parser.parse_args()
@@ -284,6 +306,7 @@ if __name__ == "__main__":
 
     GLOBAL_DEBUG = args.debug
     GLOBAL_VERBOSE = args.verbose
+    GLOBAL_REFRESH = args.refresh
 
     if args.symbol and args.results:
         print("Error: --symbol (-s) and --results-file (-r) conflict with each other")
@@ -306,5 +329,5 @@ if __name__ == "__main__":
         sys.exit(1)
 
     screener_config_file = DEFAULT_SCREENER_CONFIG
-    main(args.config_file,screener_config_file,args.market_tone,symbol_list,expiration,args.output)
+    main(args.config_file,screener_config_file,args.market_tone,symbol_list,expiration,args.output,args.score_file)
 
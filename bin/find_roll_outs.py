@@ -153,14 +153,19 @@ def get_matching_option_chains(config_file, symbol, existing_expiration, min_day
     option_chain_list = list()
     dates = get_expiration_dates(config_file, symbol)
 
+    chain_requests = list()
     for (expiration_date, expiration_type) in dates:
         if expiration_date > existing_expiration:
             elapsed = expiration_date - existing_expiration
             days = elapsed.days
             if min_days < days < max_days:
-                option_chain = get_option_chain(config_file, symbol, expiration_date)
-                if option_chain:
-                    option_chain_list.append(option_chain)
+                chain_requests.append((symbol, expiration_date))
+
+    for option_chain in get_option_chains(config_file, chain_requests):
+        if isinstance(option_chain, Exception):
+            print(f"{symbol}: {option_chain}")
+            continue
+        option_chain_list.append(option_chain)
 
     return option_chain_list
 
@@ -1,7 +1,7 @@
 #! /usr/bin/python3
 
 from screener_tools import *
-from stock_chart_tools.utils import get_historical_data, COLUMN_CLOSE, SMA, COLUMN_HIGH, COLUMN_LOW
+from stock_chart_tools.utils import get_historical_data, COLUMN_CLOSE, COLUMN_HIGH, COLUMN_LOW
 
 DEFAULT_SCREENER_CONFIG_FILE="./etc/stock_screener.json"
 DEFAULT_LOOKBACK_DAYS = 7
@@ -15,8 +15,18 @@ SYMBOL_FILE = "./etc/sp500.txt"
 BULLISH_VIX = 20
 BEARISH_VIX = 30
 
+# Indicators kept with the cached history (beyond the price EMAs)
+MARKET_TONE_INDICATORS = [FIFTY_DAY_SMA, TWO_HUNDRED_DAY_SMA]
+
+# Columns lined up across all the symbols
+BREADTH_COLUMNS = [COLUMN_CLOSE, COLUMN_HIGH, COLUMN_LOW, TWENTY_DAY_EMA, FIFTY_DAY_SMA, TWO_HUNDRED_DAY_SMA]
+
 def main(screener_config_file, symbol_file, cache_dir):
     screener_config = read_json_file(screener_config_file)
+    symbols = get_symbols_from_file(symbol_file)
+
+    # Fill the stale history caches with a few multi-ticker downloads
+    prefetch_historical_data(list(symbols) + [SYMBOL_VIX, SYMBOL_SPX],cache_dir)
 
     vix, vix_5day_ema, vix_9day_ema = get_vix(cache_dir)
     vix_tone = "neutral"
@@ -37,50 +47,23 @@ def main(screener_config_file, symbol_file, cache_dir):
         spx_trend = "worsening"
 
     lookback_days = DEFAULT_LOOKBACK_DAYS
-    symbols = get_symbols_from_file(symbol_file)
 
-    golden_crosses = set()
-    death_crosses = set()
+    # Line every symbol's history up in a date x symbol matrix per column
+    (matrices, failed) = get_history_matrix(symbols,cache_dir,TWO_YEAR_DAYS,BREADTH_COLUMNS,MARKET_TONE_INDICATORS)
+    closes = matrices.get(COLUMN_CLOSE)
+    count = len(closes.columns)
+    if count == 0:
+        print(f"no price history found for the symbols in {symbol_file}")
+        return
 
-    # 20 Day, 200 Day SMA Today's value
-    over_20day = set()
-    over_200day = set()
+    (golden_crosses, death_crosses) = golden_cross(lookback_days, matrices.get(FIFTY_DAY_SMA), matrices.get(TWO_HUNDRED_DAY_SMA), matrices.get(HISTORY_INDEX))
 
-    # 20 Day, 200 Day SMA Yesterday's value
-    yover_20day = set()
-    yover_200day = set()
+    # 20 Day EMA, 200 Day SMA today's value and a week ago
+    (over_20day, yover_20day) = compare_to_average(closes, matrices.get(TWENTY_DAY_EMA))
+    (over_200day, yover_200day) = compare_to_average(closes, matrices.get(TWO_HUNDRED_DAY_SMA))
 
     # New highs this week
-    new_highs = set()
-    new_lows = set()
-
-    count = 0
-    for symbol in sorted(symbols):
-        try:
-            stock_data = get_two_year_data(symbol,cache_dir)
-            stock_data["20dayEMA"] = EMA(stock_data[COLUMN_CLOSE],20)
-            stock_data["50daySMA"] = SMA(stock_data[COLUMN_CLOSE],50)
-            stock_data["200daySMA"] = SMA(stock_data[COLUMN_CLOSE],200)
-
-            (g, d) = golden_cross(symbol, lookback_days, stock_data)
-            golden_crosses.update(g)
-            death_crosses.update(d)
-
-            (o20, o200, yo20, yo200) = compare20dayEMA(symbol, stock_data)
-            over_20day.update(o20)
-            yover_20day.update(yo20)
-
-            over_200day.update(o200)
-            yover_200day.update(yo200)
-
-            (nh, nl) = new_highs_and_lows(symbol, stock_data)
-            new_highs.update(nh)
-            new_lows.update(nl)
-
-            count += 1
-        except Exception as e:
-            print(f"error with {symbol}: {e}")
-            pass
+    (new_highs, new_lows) = new_highs_and_lows(matrices.get(COLUMN_HIGH), matrices.get(COLUMN_LOW))
 
     change_in_over20 = len(over_20day) - len(yover_20day)
     change_in_over200 = len(over_200day) - len(yover_200day)
@@ -110,83 +93,50 @@ def main(screener_config_file, symbol_file, cache_dir):
 
 def get_spx(cache_dir):
     stock_data = get_two_year_data(SYMBOL_SPX,cache_dir)
-    stock_data["5dayEMA"] = EMA(stock_data[COLUMN_CLOSE],5)
-    stock_data["9dayEMA"] = EMA(stock_data[COLUMN_CLOSE],9)
-
-    return stock_data[COLUMN_CLOSE].iloc[-1], stock_data["5dayEMA"].iloc[-1], stock_data["9dayEMA"].iloc[-1]
+    return stock_data[COLUMN_CLOSE].iloc[-1], stock_data[FIVE_DAY_EMA].iloc[-1], stock_data[NINE_DAY_EMA].iloc[-1]
 
 def get_vix(cache_dir):
     stock_data = get_two_year_data(SYMBOL_VIX,cache_dir)
-    stock_data["5dayEMA"] = EMA(stock_data[COLUMN_CLOSE],5)
-    stock_data["9dayEMA"] = EMA(stock_data[COLUMN_CLOSE],9)
-
-    return stock_data[COLUMN_CLOSE].iloc[-1], stock_data["5dayEMA"].iloc[-1], stock_data["9dayEMA"].iloc[-1]
+    return stock_data[COLUMN_CLOSE].iloc[-1], stock_data[FIVE_DAY_EMA].iloc[-1], stock_data[NINE_DAY_EMA].iloc[-1]
 
-def new_highs_and_lows(symbol, stock_data):
-    highs = set()
-    lows = set()
+def new_highs_and_lows(highs, lows):
+    """ Returns the (symbols, symbols) whose high (low) of the last week is a 52 week high (low) """
+    last_year_highs = highs.iloc[-250:].max()
+    last_week_highs = highs.iloc[-5:].max()
 
-    last_year_highs = stock_data[COLUMN_HIGH][-250:]
-    last_week_highs = stock_data[COLUMN_HIGH][-5:]
+    last_year_lows = lows.iloc[-250:].min()
+    last_week_lows = lows.iloc[-5:].min()
 
-    last_year_lows = stock_data[COLUMN_LOW][-250:]
-    last_week_lows = stock_data[COLUMN_LOW][-5:]
+    new_highs = set(highs.columns[last_week_highs >= last_year_highs])
+    new_lows = set(lows.columns[last_week_lows <= last_year_lows])
 
-    if last_week_highs.max() >= last_year_highs.max():
+    for symbol in sorted(new_highs):
         print(f"****** New high for {symbol}")
-        highs.add(symbol)
-
-    if last_week_lows.min() <= last_year_lows.min():
+    for symbol in sorted(new_lows):
         print(f"****** New low for {symbol}")
-        lows.add(symbol)
-
-    return (highs, lows)
-
-def golden_cross(symbol, lookback_days, stock_data):
-    golden = set()
-    death = set()
-    for index in range(-1 * lookback_days, -1):
-        sma50 = stock_data["50daySMA"].iloc[index]
-        sma200 = stock_data["200daySMA"].iloc[index]
-        date = stock_data.index[index]
-        ysma50 = stock_data["50daySMA"].iloc[index -1]
-        ysma200 = stock_data["200daySMA"].iloc[index -1]
-
-#        print(f"{date} 50day={sma50:.2f} 200day={sma200:.2f}")
-        if sma50 > sma200 and ysma50 <= ysma200:
-            #print(f"\tgolden cross on {date.year}-{date.month:02d}-{date.day:02d}")
-            print(f"\t{symbol}: golden cross on {date}")
-            golden.add(symbol)
-
-        if sma50 < sma200 and ysma50 >= ysma200:
-            print(f"\t{symbol}: death cross on {date}")
-            death.add(symbol)
-
-    return (golden, death)
-        
-def compare20dayEMA(symbol, stock_data):
-    o20 = set()
-    o200 = set()
-
-    yo20 = set()
-    yo200 = set()
-
-    price = stock_data[COLUMN_CLOSE].iloc[-1]
 
-    if price > stock_data["20dayEMA"].iloc[-1]:
-        o20.add(symbol)
+    return (new_highs, new_lows)
 
-    if price > stock_data["20dayEMA"].iloc[-6]:
-        yo20.add(symbol)
+def golden_cross(lookback_days, sma50, sma200, dates):
+    """ Returns the (symbols, symbols) whose 50 day SMA crossed above (below) the 200 day SMA in the lookback period """
+    # Compare each day with the day before, skipping today
+    window = slice(-1 * lookback_days, -1)
+    ysma50 = sma50.shift(1)
+    ysma200 = sma200.shift(1)
+    golden = ((sma50 > sma200) & (ysma50 <= ysma200)).iloc[window]
+    death = ((sma50 < sma200) & (ysma50 >= ysma200)).iloc[window]
 
-    if price > stock_data["200daySMA"].iloc[-1]:
-        o200.add(symbol)
+    for (row, symbol) in golden.stack().loc[lambda crossed: crossed].index:
+        print(f"\t{symbol}: golden cross on {dates.at[row, symbol]}")
+    for (row, symbol) in death.stack().loc[lambda crossed: crossed].index:
+        print(f"\t{symbol}: death cross on {dates.at[row, symbol]}")
 
-    if price > stock_data["200daySMA"].iloc[-6]:
-        yo200.add(symbol)
+    return (set(golden.columns[golden.any()]), set(death.columns[death.any()]))
 
-    return (o20, o200, yo20, yo200)
-        
+def compare_to_average(closes, average):
+    """ Returns the (symbols, symbols) whose last price is above the average today (a week ago) """
+    price = closes.iloc[-1]
+    return (set(closes.columns[price > average.iloc[-1]]), set(closes.columns[price > average.iloc[-6]]))
 
 def get_symbols_from_file(file):
     symbols = set()
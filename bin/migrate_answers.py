@@ -0,0 +1,47 @@
+#! /usr/bin/python3
+
+import argparse
+import os
+import sys
+from screener_tools import *
+
+DEFAULT_SCREENER_CONFIG_FILE="./etc/stock_screener.json"
+
+def main(screener_config_file,db_file):
+    screener_config = read_json_file(screener_config_file)
+    cache_dir = screener_config.get(CACHE_DIR)
+    if db_file is None:
+        db_file = screener_config.get(ANSWER_DB,None)
+    if db_file is None:
+        print(f"error: no answer database given and '{ANSWER_DB}' is not set in {screener_config_file}")
+        sys.exit(1)
+
+    answer_db = get_answer_database(db_file)
+
+    symbol_count = 0
+    answer_count = 0
+    for answer_file in [expanduser(get_answer_file(cache_dir,symbol)) for symbol in sorted(get_answer_file_symbols(cache_dir))]:
+        answers = get_all_answers_from_cache(answer_file)
+        if not isinstance(answers,dict):
+            print(f"skipping {answer_file}, not an answer file")
+            continue
+
+        symbol = answers.get(CACHE_SYMBOL,None)
+        if symbol is None:
+            symbol = os.path.basename(answer_file)[:-len(".json")]
+
+        answers = dict([(key,answers.get(key)) for key in answers if isinstance(answers.get(key),dict)])
+        answer_db.save_answers(symbol,answers)
+        symbol_count += 1
+        answer_count += len(answers)
+
+    print(f"migrated {answer_count} answers for {symbol_count} symbols from {cache_dir} to {answer_db.get_db_file()}")
+
+if __name__ == "__main__":
+    # Setup the argument parsing
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-c','--config-file', dest='config_file', help="screener configuration file", default=DEFAULT_SCREENER_CONFIG_FILE)
+    parser.add_argument('-d','--database', dest='db_file', required=False,default=None,help=f"answer database to write (default is '{ANSWER_DB}' from the screener config)")
+
+    args = parser.parse_args()
+    main(args.config_file,args.db_file)
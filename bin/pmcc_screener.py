@@ -2,6 +2,7 @@
 
 import argparse
 import datetime
+import numpy as np
 import sys
 from etrade_tools import *
 
@@ -10,77 +11,162 @@ DEFAULT_SCREENER_CONFIG="./etc/stock_screener.json"
 
 DEFAULT_MAX_COST=100000
 DEFAULT_MIN_ANNUALIZED=48
+DEFAULT_TOP_K=25
 
 DEFAULT_LONG_CALL_MIN_DAYS = 7 * 20
 DEFAULT_LONG_CALL_MAX_DAYS = 7 * 56
 DEFAULT_SHORT_CALL_MIN_DAYS = 1
 DEFAULT_SHORT_CALL_MAX_DAYS = 7 * 4
 
+# Long call strike range is 45% to 70% of the price
+LONG_CALL_MIN_STRIKE_FACTOR = 0.45
+LONG_CALL_MAX_STRIKE_FACTOR = 0.7
+
 global GLOBAL_DEBUG
 global GLOBAL_VERBOSE
+global GLOBAL_REFRESH
 
-def main(config_file, screener_config, symbol, max_cost, min_annualized, long_call_min_days, long_call_max_days, short_call_min_days, short_call_max_days):
-    quote = get_quote(config_file, symbol)
-    price = quote.get_price()
-
-    # Long call strike range is 45% to 70% of the cost
-    long_call_min_strike = price * 0.45
-    long_call_max_strike = price * 0.7
-
-    long_option_chain_list = get_matching_option_chains(config_file, symbol, long_call_min_days, long_call_max_days)
-    short_option_chain_list = get_matching_option_chains(config_file, symbol, short_call_min_days, short_call_max_days)
-
-    today = datetime.datetime.now()
-
-    for long_option_chain in long_option_chain_list:
-        long_call_expiration = long_option_chain.get_expiration()
-        for long_strike in long_option_chain.get_strike_prices():
-            if long_call_min_strike <= long_strike <= long_call_max_strike:
-                long_call = long_option_chain.get_call_option(long_strike)
-                long_call_ask = long_call.get_ask()
-                long_time_value = (long_strike + long_call_ask) - price
-                #print(f"examining {long_call_expiration} strike {long_strike}: time value ${long_time_value:.2f}")
-
-                # Loop through the short strikes
-                for short_option_chain in short_option_chain_list:
-                    short_call_expiration = short_option_chain.get_expiration()
-                    short_dte = short_option_chain.get_expiration() - today
-                    for short_strike in short_option_chain.get_strike_prices():
-                        if short_strike > price:
-                            short_call = short_option_chain.get_call_option(short_strike)
-                            short_call_bid = short_call.get_bid()
-                            if short_call_bid > long_time_value:
-                                cost_basis = long_strike + long_call_ask - short_call_bid
-                                out_of_pocket = long_call_ask - short_call_bid
-                                max_gain = short_strike - cost_basis
-                                gain_prct = 100 * ( max_gain / out_of_pocket )
-                                annualized_gain = gain_prct * (365 /short_dte.days)
-                                if annualized_gain >= min_annualized and out_of_pocket <= max_cost:
-                                    if GLOBAL_VERBOSE:
-                                        print(f"long call: {long_call.get_display_symbol()} (time_value={long_time_value:.2f}) short call {short_call.get_display_symbol()} (bid={short_call_bid:.2f}) days={short_dte.days}")
-                                        print(f"    cost_basis = ${cost_basis:.2f} my cost=${out_of_pocket:.2f} max_gain=${max_gain:.2f} ({gain_prct:.1f}%) annualized={annualized_gain:.2f}%)")
-                                    else:
-                                        print(f"{long_call.get_display_symbol()} / {short_call.get_display_symbol()} cost=${out_of_pocket*100:.2f} max_gain=${max_gain:.2f}({gain_prct:.1f}%) days={short_dte.days} annualized={annualized_gain:.2f}%")
-                                else:
-                                    debug(f"TOO LOW: {long_call.get_display_symbol()} / {short_call.get_display_symbol()} cost=${out_of_pocket*100:.2f} max_gain=${max_gain:.2f}({gain_prct:.1f}%) days={short_dte.days} annualized={annualized_gain:.2f}%")
-                            else:
-                                debug(f"PREMIUMS DO NOT MATCH: {long_call.get_display_symbol()} / {short_call.get_display_symbol()} time_value={long_time_value}, short call bid={short_call_bid}")
-
-def get_matching_option_chains(config_file, symbol, min_days, max_days):
-    option_chain_list = list()
+def main(config_file, screener_config, symbol_list, max_cost, min_annualized, long_call_min_days, long_call_max_days, short_call_min_days, short_call_max_days, top_k):
+    (quotes, missing) = get_quotes(config_file, symbol_list)
+    for symbol in missing:
+        print(f"{symbol} symbol not found")
 
+    symbols = list()
+    long_chains = dict()
+    short_chains = dict()
+    chain_requests = list()
     today = datetime.datetime.now()
-    dates = get_expiration_dates(config_file, symbol)
-
+    for symbol in [symbol for symbol in symbol_list if symbol in quotes]:
+        try:
+            dates = get_expiration_dates(config_file, symbol)
+        except (ETradeAPIError, AttributeError, TypeError, ValueError) as e:
+            print(f"{symbol} could not get the option expiration dates: {e}")
+            continue
+        symbols.append(symbol)
+        long_chains[symbol] = get_matching_expirations(dates, today, long_call_min_days, long_call_max_days)
+        short_chains[symbol] = get_matching_expirations(dates, today, short_call_min_days, short_call_max_days)
+        for expiration_date in long_chains[symbol] + short_chains[symbol]:
+            chain_requests.append((symbol, expiration_date))
+
+    # Fetch every chain for every symbol in one concurrent batch
+    option_chains = dict()
+    for (chain_request, option_chain) in zip(chain_requests, get_option_chains(config_file, chain_requests, refresh=GLOBAL_REFRESH)):
+        if isinstance(option_chain, Exception):
+            debug(f"{chain_request[0]}: {option_chain}")
+            continue
+        option_chains[chain_request] = option_chain
+
+    pmcc_list = list()
+    for symbol in symbols:
+        price = quotes[symbol].get_price()
+        long_legs = get_long_legs([option_chains[(symbol, d)] for d in long_chains[symbol] if (symbol, d) in option_chains], price)
+        short_legs = get_short_legs([option_chains[(symbol, d)] for d in short_chains[symbol] if (symbol, d) in option_chains], price, today)
+        pmcc_list.extend(find_pmcc_pairs(long_legs, short_legs, price, max_cost, min_annualized))
+
+    pmcc_list.sort(key=lambda pmcc: pmcc.get("annualized_gain"), reverse=True)
+    for pmcc in pmcc_list[:top_k]:
+        long_call = pmcc.get("long_chain").get_call_option(pmcc.get("long_strike"))
+        short_call = pmcc.get("short_chain").get_call_option(pmcc.get("short_strike"))
+        if GLOBAL_VERBOSE:
+            print(f"long call: {long_call.get_display_symbol()} (time_value={pmcc.get('long_time_value'):.2f}) short call {short_call.get_display_symbol()} (bid={pmcc.get('short_call_bid'):.2f}) days={pmcc.get('short_days')}")
+            print(f"    cost_basis = ${pmcc.get('cost_basis'):.2f} my cost=${pmcc.get('out_of_pocket'):.2f} max_gain=${pmcc.get('max_gain'):.2f} ({pmcc.get('gain_prct'):.1f}%) annualized={pmcc.get('annualized_gain'):.2f}%)")
+        else:
+            print(f"{long_call.get_display_symbol()} / {short_call.get_display_symbol()} cost=${pmcc.get('out_of_pocket')*100:.2f} max_gain=${pmcc.get('max_gain'):.2f}({pmcc.get('gain_prct'):.1f}%) days={pmcc.get('short_days')} annualized={pmcc.get('annualized_gain'):.2f}%")
+
+    if len(pmcc_list) == 0:
+        print("No matching poor man's covered calls found")
+
+def get_long_legs(option_chains, price):
+    """ Collect the long call candidates (strike within the long call range) of every chain into parallel arrays """
+    min_strike = price * LONG_CALL_MIN_STRIKE_FACTOR
+    max_strike = price * LONG_CALL_MAX_STRIKE_FACTOR
+
+    legs = _empty_legs("strike", "price", "time_value")
+    for option_chain in option_chains:
+        strikes = option_chain.get_strike_array()
+        candidates = ((min_strike <= strikes) & (strikes <= max_strike)).nonzero()[0]
+        asks = option_chain.get_call_array(OPTION_ASK)[candidates]
+        legs["strike"].append(strikes[candidates])
+        legs["price"].append(asks)
+        legs["time_value"].append((strikes[candidates] + asks) - price)
+        legs["chain"].extend([option_chain] * len(candidates))
+    return _stack_legs(legs)
+
+def get_short_legs(option_chains, price, today):
+    """ Collect the short call candidates (strike above the price) of every chain into parallel arrays """
+    legs = _empty_legs("strike", "price", "days")
+    for option_chain in option_chains:
+        short_dte = option_chain.get_expiration() - today
+        strikes = option_chain.get_strike_array()
+        candidates = (strikes > price).nonzero()[0]
+        legs["strike"].append(strikes[candidates])
+        legs["price"].append(option_chain.get_call_array(OPTION_BID)[candidates])
+        legs["days"].append(np.full(len(candidates), short_dte.days))
+        legs["chain"].extend([option_chain] * len(candidates))
+    return _stack_legs(legs)
+
+def _empty_legs(*columns):
+    legs = dict([(column, list()) for column in columns])
+    legs["chain"] = list()
+    return legs
+
+def _stack_legs(legs):
+    for column in [column for column in legs if column != "chain"]:
+        legs[column] = np.concatenate(legs[column]) if legs[column] else np.zeros(0)
+    return legs
+
+def find_pmcc_pairs(long_legs, short_legs, price, max_cost, min_annualized):
+    """ Evaluate every long leg against every short leg with broadcasting. Pairs
+        where the short call bid does not cover the long call's time value are
+        dropped before any of the gain math is done """
+    pmcc_list = list()
+    if len(long_legs["strike"]) == 0 or len(short_legs["strike"]) == 0:
+        return pmcc_list
+
+    long_time_value = long_legs["time_value"][:, None]
+    short_call_bid = short_legs["price"][None, :]
+    (long_index, short_index) = (short_call_bid > long_time_value).nonzero()
+    debug(f"{len(long_index)} of {long_time_value.size * short_call_bid.size} pairs have premiums that match")
+
+    long_strike = long_legs["strike"][long_index]
+    long_call_ask = long_legs["price"][long_index]
+    short_strike = short_legs["strike"][short_index]
+    short_bid = short_legs["price"][short_index]
+    short_days = short_legs["days"][short_index]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cost_basis = long_strike + long_call_ask - short_bid
+        out_of_pocket = long_call_ask - short_bid
+        max_gain = short_strike - cost_basis
+        gain_prct = 100 * ( max_gain / out_of_pocket )
+        annualized_gain = gain_prct * (365 / short_days)
+
+    matches = (annualized_gain >= min_annualized) & (out_of_pocket <= max_cost)
+    for index in matches.nonzero()[0]:
+        pmcc_list.append({
+            "long_chain"      : long_legs["chain"][long_index[index]],
+            "long_strike"     : float(long_strike[index]),
+            "long_time_value" : float(long_legs["time_value"][long_index[index]]),
+            "short_chain"     : short_legs["chain"][short_index[index]],
+            "short_strike"    : float(short_strike[index]),
+            "short_call_bid"  : float(short_bid[index]),
+            "short_days"      : int(short_days[index]),
+            "cost_basis"      : float(cost_basis[index]),
+            "out_of_pocket"   : float(out_of_pocket[index]),
+            "max_gain"        : float(max_gain[index]),
+            "gain_prct"       : float(gain_prct[index]),
+            "annualized_gain" : float(annualized_gain[index])
+            })
+    return pmcc_list
+
+def get_matching_expirations(dates, today, min_days, max_days):
+    expiration_list = list()
     for (expiration_date, expiration_type) in dates:
         elapsed = expiration_date - today
         days = elapsed.days
         if min_days < days < max_days:
-            option_chain = get_option_chain(config_file, symbol, expiration_date)
-            if option_chain:
-                option_chain_list.append(option_chain)
-
-    return option_chain_list
+            expiration_list.append(expiration_date)
+    return expiration_list
 
 def get_expiration_dates(config_file, symbol):
     date_list = list()
@@ -93,6 +179,21 @@ def get_expiration_dates(config_file, symbol):
         date_list.append((expiration,date.get("expiryType")))
     return date_list
     
+def get_symbols_from_results_file(results_file):
+    symbols = list()
+    try:
+        with open(results_file,"r") as f:
+            for line in f.readlines():
+                if line.startswith("Symbol"):
+                    continue
+                symbol = line.split(",")[0]
+                symbols.append(symbol.strip())
+
+    except IOError as e:
+        print(f"Error reading '{results_file}': {e}")
+        sys.exit(1)
+    return symbols
+
 def debug(msg):
     if GLOBAL_DEBUG:
         print(msg)
@@ -101,7 +202,9 @@ if __name__ == "__main__":
     # Setup the argument parsing
     parser = argparse.ArgumentParser()
     parser.add_argument('-c','--config-file', dest='config_file', help="etrade configuration file", default=DEFAULT_CONFIG_FILE)
-    parser.add_argument('-s','--symbol', dest='symbol', help="Symbol to search (conflicts with -r)" )
+    parser.add_argument('-s','--symbol', dest='symbols', nargs='+', help="Symbol(s) to search (conflicts with -r)" )
+    parser.add_argument('-r','--results-file', dest='results', help="Results CSV file to use as input (conflicts with -s)" )
+    parser.add_argument('-t','--top', dest='top_k', required=False,default=DEFAULT_TOP_K,help="Number of the best matches to show")
     parser.add_argument('-d','--debug', dest='debug_flag', required=False,default=False,action='store_true',help="Enable debugging" )
     parser.add_argument('-v','--verbose', dest='verbose', required=False,default=False,action='store_true',help="Increase verbosity")
     parser.add_argument('--max-cost', dest='max_cost', required=False,default=DEFAULT_MAX_COST,help="Max out of pocket cost in dollars")
@@ -111,23 +214,39 @@ if __name__ == "__main__":
     parser.add_argument('--long-call-max-days', dest='long_call_max_days', required=False,default=DEFAULT_LONG_CALL_MAX_DAYS,help="Long call maximum days until expiration")
     parser.add_argument('--min-days', '--short-call-min-days', dest='short_call_min_days', required=False,default=DEFAULT_SHORT_CALL_MIN_DAYS,help="Short call minimum days until expiration")
     parser.add_argument('--max-days', '--short-call-max-days', dest='short_call_max_days', required=False,default=DEFAULT_SHORT_CALL_MAX_DAYS,help="Short call maximum days until expiration")
+    parser.add_argument('--refresh', dest='refresh', required=False,default=False,action='store_true',help="Ignore cached option chains and fetch fresh ones")
 
     expiration = None
     args = parser.parse_args()
 
     GLOBAL_VERBOSE = args.verbose
+    GLOBAL_REFRESH = args.refresh
     GLOBAL_DEBUG = args.debug_flag
 
+    if args.symbols and args.results:
+        print("Error: --symbol (-s) and --results-file (-r) conflict with each other")
+        sys.exit(1)
+
+    symbol_list = list()
+    if args.symbols:
+        symbol_list = args.symbols
+    elif args.results:
+        symbol_list = get_symbols_from_results_file(args.results)
+    else:
+        print("Error: must specify either --symbol (-s) or --results-file (-r)")
+        sys.exit(1)
+
     screener_config_file = DEFAULT_SCREENER_CONFIG
     main(
         args.config_file,
         screener_config_file,
-        args.symbol,
+        symbol_list,
         int(args.max_cost),
         int(args.min_annualized),
         int(args.long_call_min_days),
         int(args.long_call_max_days),
         int(args.short_call_min_days),
-        int(args.short_call_max_days)
+        int(args.short_call_max_days),
+        int(args.top_k)
         )
 
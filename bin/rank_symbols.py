@@ -0,0 +1,50 @@
+#! /usr/bin/python3
+
+import argparse
+import os
+import sys
+from screener_tools import *
+
+DEFAULT_SCREENER_CONFIG_FILE="./etc/stock_screener.json"
+
+def main(screener_config_file,output_file,fresh_only,include_blocked,processes,top):
+    if output_file:
+        if os.path.exists(output_file):
+            print(f"error: output file '{output_file}' exists")
+            sys.exit(1)
+
+    screener_config = read_json_file(screener_config_file)
+    blocker_ids = get_blocker_ids(get_questions(screener_config.get(QUESTIONS_DIR)))
+
+    table = get_score_table(screener_config,fresh_only=fresh_only,blocker_ids=blocker_ids,processes=processes)
+    if not include_blocked:
+        table = table[~table["Blocked"]].reset_index(drop=True)
+
+    if output_file:
+        try:
+            if output_file.endswith(".parquet"):
+                table.to_parquet(output_file,index=False)
+            else:
+                table.to_csv(output_file,index=False,float_format="%.2f")
+        except (OSError, ImportError) as e:
+            print(f"error, could not write '{output_file}': {e}")
+            sys.exit(1)
+        print(f"wrote {len(table)} ranked symbols to {output_file}")
+        return
+
+    for row in table.head(top).itertuples(index=False):
+        blocked = " (blocked)" if row.Blocked else ""
+        print(f"\t{row.Symbol:5s} (score={row.Score:-6.2f}%, {row.Passed}/{row.Answered}){blocked}")
+
+if __name__ == "__main__":
+    # Setup the argument parsing
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-c','--config-file', dest='config_file', help="screener configuration file", default=DEFAULT_SCREENER_CONFIG_FILE)
+    parser.add_argument('-o','--output', dest='output_file', required=False,default=None,help="Write the ranking to a CSV file (or parquet if the name ends in .parquet)")
+    parser.add_argument('-f','--fresh', dest='fresh_only', required=False,default=False,action='store_true',help="Only count answers that have not expired")
+    parser.add_argument('-b','--include-blocked', dest='include_blocked', required=False,default=False,action='store_true',help="Keep symbols that fail a fresh blocker question")
+    parser.add_argument('-j','--processes', dest='processes', required=False,default=1,type=int,help="Number of processes used to read a json answer cache")
+    parser.add_argument('-t','--top', dest='top', required=False,default=25,type=int,help="Number of symbols to print when not writing a file")
+
+    args = parser.parse_args()
+    main(args.config_file,args.output_file,args.fresh_only,args.include_blocked,args.processes,args.top)
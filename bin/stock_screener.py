@@ -6,17 +6,25 @@ import os
 import json
 import re
 import sys
+import time
 from etrade_tools import *
 
 DEFAULT_SCREENER_CONFIG_FILE="./etc/stock_screener.json"
 
 QUID_EARNINGS_DATE="409a6708-7045-4df2-a705-c238980e7cf1"
 
+# Data the automated questions are answered from
+DATA_QUOTE="quote"
+DATA_OPTION_CHAIN="option_chain"
+
 # Globals
 global GLOBAL_VERBOSE
 global GLOBAL_QUOTE_CACHE
+global GLOBAL_MISSING_SYMBOLS
+global GLOBAL_OPTION_CHAINS
+global GLOBAL_REFRESH
 
-def main(screener_config_file,summary_quote,output_file):
+def main(screener_config_file,summary_quote,output_file,pipeline=False,timings=False):
     if output_file:
         if os.path.exists(output_file):
             print(f"error: output file '{output_file}' exists")
@@ -26,16 +34,40 @@ def main(screener_config_file,summary_quote,output_file):
     symbols = get_symbols(screener_config.get(SYMBOLS_DIR))
     questions = get_questions(screener_config.get(QUESTIONS_DIR))
 
+    # Find the symbols already failing a fresh blocker in one pass over the answers
+    blocker_ids = get_blocker_ids(questions)
+    blocked = get_failed_symbols(screener_config, symbols, blocker_ids)
+
+    # Ask the cheap blockers that fail most often first
+    question_ids = [question.get(QUESTION_ID) for section in questions.keys() for question in questions[section].get(QUESTION_LIST)]
+    planner = QuestionPlanner(questions, get_failure_rates(screener_config, symbols, question_ids))
+    if timings:
+        planner.print_plan()
+
+    unblocked = [symbol for symbol in symbols if symbol.upper() not in blocked]
+    prefetch_question_data(screener_config, unblocked, questions)
+
+    if pipeline:
+        # Answer the automated questions for everyone first, only the survivors get asked anything
+        blocked.update(automated_screen(screener_config, unblocked, questions, planner))
+
     passing = dict()
     symbol_count = 0
     for symbol in sorted(symbols):
         symbol_count+=1
         print(f"\n\t*** {symbol}")
-        (passed,score) = screen_symbol(screener_config,symbol,questions)
+        if symbol.upper() in blocked:
+            print(f"\t\t{symbol} failed fresh blocker screen")
+            continue
+        (passed,score) = screen_symbol(screener_config,symbol,questions,planner)
         if passed:
             print(f"\t\t{symbol} passed")
             passing[symbol] = score
 
+    if timings:
+        print()
+        planner.print_timings()
+
     if len(passing) == 0:
         print(f"\nno valid symbols found")
     else:
@@ -73,12 +105,10 @@ def main(screener_config_file,summary_quote,output_file):
 def fresh_screen(screener_config_file,symbol):
     print(f"\n\t*** {symbol}")
     screener_config = read_json_file(screener_config_file)
-    answer_file = get_answer_file(screener_config.get(CACHE_DIR),symbol)
     questions = get_questions(screener_config.get(QUESTIONS_DIR))
 
     # Delete the cache data for the symbol
-    if os.path.exists(expanduser(answer_file)):
-        os.remove(expanduser(answer_file))
+    get_answer_store(screener_config,symbol).clear()
 
     (passed,score) = screen_symbol(screener_config,symbol,questions)
     if passed:
@@ -89,11 +119,11 @@ def fresh_screen(screener_config_file,symbol):
 def review_symbol(screener_config_file,symbol):
     print(f"Reviewing: {symbol}")
     screener_config = read_json_file(screener_config_file)
-    answer_file = get_answer_file(screener_config.get(CACHE_DIR),symbol)
-    if not os.path.exists(expanduser(answer_file)):
+    store = get_answer_store(screener_config,symbol)
+    if not store.exists():
         print(f"no data found for {symbol}")
 
-    answers = get_all_answers_from_cache(answer_file)
+    answers = store.get_answers()
     for key in answers:
         answer = answers.get(key)
         if isinstance(answer,dict):
@@ -111,62 +141,164 @@ def review_symbol(screener_config_file,symbol):
             else:
                 print(f"  {question} {str(value):5s}(expires: {date_string})")
 
+def prefetch_quotes(screener_config,symbols):
+    """ Fill the quote cache for all of the symbols using batched quote requests """
+    etrade_config = screener_config.get(ETRADE_CONFIG)
+    wanted = [symbol for symbol in symbols if symbol not in GLOBAL_QUOTE_CACHE]
+    if len(wanted) == 0:
+        return
+
+    debug(f"prefetching quotes for {len(wanted)} symbols")
+    (quotes, missing) = get_quotes(etrade_config, wanted, screener_config=screener_config)
+    GLOBAL_QUOTE_CACHE.update(quotes)
+    GLOBAL_MISSING_SYMBOLS.update(missing)
+    for symbol in missing:
+        debug(f"no quote found for {symbol}")
+
+def prefetch_question_data(screener_config,symbols,questions,data_types=(DATA_QUOTE,)):
+    """ Fetch, in bulk, the data needed by the automated questions that the symbols don't have a fresh answer to """
+    wanted = dict([(data_type,list()) for data_type in data_types])
+    for symbol in symbols:
+        answers = get_answer_store(screener_config,symbol)
+        needed = set()
+        for section in questions.keys():
+            for question in questions[section].get(QUESTION_LIST):
+                check = AUTOMATED_CHECKS.get(question.get(QUESTION_TYPE),None)
+                if check and check[0] in wanted and get_automated_answer(answers,question)[0] is None:
+                    needed.add(check[0])
+        for data_type in needed:
+            wanted.get(data_type).append(symbol)
+
+    for (data_type,wanted_symbols) in wanted.items():
+        if len(wanted_symbols) == 0:
+            continue
+        debug(f"prefetching {data_type} data for {len(wanted_symbols)} symbols")
+        if data_type == DATA_QUOTE:
+            prefetch_quotes(screener_config,wanted_symbols)
+        elif data_type == DATA_OPTION_CHAIN:
+            prefetch_option_chains(screener_config,wanted_symbols)
+
+def automated_screen(screener_config,symbols,questions,planner):
+    """ Answer the automated questions for all of the symbols, returns the (upper case) symbols that fail a blocker.
+        The quote based questions go first so the option chains are only fetched for the symbols still passing """
+    early_types = [question_type for question_type in AUTOMATED_QUESTION_TYPES if AUTOMATED_CHECKS.get(question_type)[0] != DATA_OPTION_CHAIN]
+    chain_types = [question_type for question_type in AUTOMATED_QUESTION_TYPES if AUTOMATED_CHECKS.get(question_type)[0] == DATA_OPTION_CHAIN]
+
+    failed = set()
+    prefetch_question_data(screener_config,symbols,questions,(DATA_QUOTE,))
+    survivors = answer_automated_questions(screener_config,symbols,planner,early_types,failed)
+
+    prefetch_question_data(screener_config,survivors,questions,(DATA_OPTION_CHAIN,))
+    survivors = answer_automated_questions(screener_config,survivors,planner,chain_types,failed)
+
+    print(f"\n{len(survivors)}/{len(symbols)} symbols passed the automated questions")
+    return failed
+
+def answer_automated_questions(screener_config,symbols,planner,question_types,failed):
+    """ Answer the questions of the given types for each symbol, returns the symbols that didn't fail a blocker
+        (the ones that did are added to failed) """
+    survivors = list()
+    for symbol in symbols:
+        answers = get_answer_store(screener_config,symbol)
+        passed = True
+        for (section,question) in planner.get_plan(answers,question_types):
+            start = time.time()
+            (value,expiration_timestamp) = ask_question(screener_config,answers,symbol,section,question)
+            planner.record(question,time.time() - start,value)
+            answers.set_answer(question.get(QUESTION_ID),value,expiration_timestamp,question.get(QUESTION_TEXT))
+
+            if value is False and question.get(QUESTION_BLOCKER,False):
+                debug(f"skipping {symbol}, blocker question {question.get(QUESTION_ID)} failed")
+                passed = False
+                break
+        answers.flush()
+
+        if passed:
+            survivors.append(symbol)
+        else:
+            failed.add(symbol.upper())
+    return survivors
+
+def prefetch_option_chains(screener_config,symbols):
+    """ Fetch the next monthly option chains for all of the symbols concurrently """
+    wanted = [symbol for symbol in symbols if symbol not in GLOBAL_OPTION_CHAINS]
+    if len(wanted) == 0:
+        return
+
+    next_monthly = get_next_monthly_expiration()
+    debug(f"prefetching option chains for {len(wanted)} symbols")
+    chains = get_option_chains(screener_config.get(ETRADE_CONFIG), [(symbol, next_monthly) for symbol in wanted], refresh=GLOBAL_REFRESH)
+    GLOBAL_OPTION_CHAINS.update(zip(wanted, chains))
+
+def option_chain(screener_config,symbol,expiration_date):
+    """ Returns the symbol's option chain for the (next monthly) expiration, prefetched when possible """
+    chain = GLOBAL_OPTION_CHAINS.get(symbol,None)
+    if chain is None:
+        try:
+            chain = get_option_chain(screener_config.get(ETRADE_CONFIG), symbol, expiration_date, refresh=GLOBAL_REFRESH)
+        except (OptionChainNotFoundError, ETradeAPIError) as e:
+            chain = e
+        GLOBAL_OPTION_CHAINS[symbol] = chain
+
+    if isinstance(chain,Exception):
+        raise chain
+    return chain
+
 def stock_quote(screener_config,symbol):
     etrade_config = screener_config.get(ETRADE_CONFIG)
     quote = GLOBAL_QUOTE_CACHE.get(symbol,None)
     if quote:
         debug(f"returning cached quote for {symbol}")
         return quote
+
+    if symbol in GLOBAL_MISSING_SYMBOLS:
+        raise SymbolNotFoundError(f"symbol {symbol} is not found")
     
     debug(f"getting quote for {symbol}")
     quote = get_quote(etrade_config, symbol, screener_config=screener_config)
     GLOBAL_QUOTE_CACHE[symbol] = quote
     return quote
 
-def screen_symbol(screener_config,symbol,questions):
+def screen_symbol(screener_config,symbol,questions,planner=None):
 
     if fresh_blocker_screen(screener_config,symbol,questions) is False:
         print(f"\t\t{symbol} failed fresh blocker screen")
         return (False,0.0)
 
-    answer_file = get_answer_file(screener_config.get(CACHE_DIR),symbol)
-    answers = dict()
-    answers[CACHE_SYMBOL] = symbol
+    answers = get_answer_store(screener_config,symbol)
+    if planner is None:
+        planner = QuestionPlanner(questions)
 
     true_count = 0
     total_count = 0
-    for section in sorted(questions.keys()):
-        for question in questions[section].get(QUESTION_LIST):
-            question_id = question.get(QUESTION_ID)
+    for (section,question) in planner.get_plan(answers):
+        question_id = question.get(QUESTION_ID)
 
-            value = None
-            expiration_timestamp = 0
+        value = None
+        expiration_timestamp = 0
 
-            answers[question_id] = dict()
+        start = time.time()
+        (value, expiration_timestamp) = ask_question(screener_config,answers,symbol,section,question)
+        planner.record(question,time.time() - start,value)
 
-            (value, expiration_timestamp) = ask_question(screener_config,answer_file,symbol,section,question)
+        # Save the answers
+        answers.set_answer(question_id,value,expiration_timestamp,question.get(QUESTION_TEXT))
 
-            # Save the answers
-            answers[question_id][CACHE_VALUE] = value
-            answers[question_id][CACHE_EXPIRATION_TIMESTAMP] = expiration_timestamp
-            answers[question_id][CACHE_QUESTION] = question.get(QUESTION_TEXT)
+        if isinstance(value,bool):
+            total_count += 1
+            if value is False:
+                if question.get(QUESTION_BLOCKER,False):
+                    debug(f"skipping {symbol}, blocker question {question_id} failed")
+                    answers.flush()
+                    return (False,0.0)
+            else:
+                true_count += 1
 
-            if isinstance(value,bool):
-                total_count += 1
-                if value is False:
-                    if question.get(QUESTION_BLOCKER,False):
-                        debug(f"skipping {symbol}, blocker question {question_id} failed")
-                        cache_answers(answer_file,answers)
-                        return (False,0.0)
-                else:
-                    true_count += 1
-    
-    cache_answers(answer_file,answers)
+    answers.flush()
     return (True,float(true_count/total_count)*100)
 
 def fresh_blocker_screen(screener_config,symbol,questions):
-    answer_file = get_answer_file(screener_config.get(CACHE_DIR),symbol)
-    answers = get_all_answers_from_cache(answer_file)
+    answers = get_answer_store(screener_config,symbol).get_answers()
 
     # Check for fresh blockers
     for section in sorted(questions.keys()):
@@ -185,18 +317,54 @@ def fresh_blocker_screen(screener_config,symbol,questions):
 
     return True
 
-def check_price(screener_config,answer_file,symbol,section,question):
-    # Get the boolean from cache and return it
-    (value,expiration_timestamp) = get_answer_from_cache(answer_file,symbol,question)
-    if value:
+def ask_automated_question(screener_config,answers,symbol,section,question):
+    """ Answer an AUTOMATED_CHECKS question from the data its type needs (fetched in bulk beforehand when possible) """
+    # Get the answer from cache and return it
+    (value,expiration_timestamp) = get_automated_answer(answers,question)
+    if value is not None:
         return (value,expiration_timestamp)
 
-    try: 
-        quote = stock_quote(screener_config, symbol)
+    (data_type,predicate,expiration,recheck_false) = AUTOMATED_CHECKS.get(question.get(QUESTION_TYPE))
+    try:
+        data = get_question_data(screener_config,symbol,data_type)
     except SymbolNotFoundError as e:
         print(f"\t\t{symbol} does not exist")
         return (False,datetime.datetime(2037,12,31).timestamp())
-    
+    except (OptionChainNotFoundError, ETradeAPIError) as e:
+        print(f"\t\terror fetching options chain: {e}")
+        return (False,0)
+
+    try:
+        value = predicate(symbol,data,question)
+    except (TypeError, ValueError) as e:
+        # Incomplete data (e.g. a quote without a beta), fail it until the data can be fetched again
+        print(f"\t\t{symbol} has incomplete data for '{question.get(QUESTION_TEXT)}': {e}")
+        return (False,0)
+    return (value,expiration(question))
+
+def get_automated_answer(answers,question):
+    """ Returns the cached (value, expiration_timestamp) for an AUTOMATED_CHECKS question, or (None,0)
+        if it has to be checked. A cached False is checked again for the types that re-check failures """
+    (value,expiration_timestamp) = answers.get_answer(question)
+    if value is False and AUTOMATED_CHECKS.get(question.get(QUESTION_TYPE))[3]:
+        return (None,0)
+    return (value,expiration_timestamp)
+
+def get_question_data(screener_config,symbol,data_type):
+    """ Returns the data (quote or option chain) that a question type is answered from """
+    if data_type == DATA_QUOTE:
+        return stock_quote(screener_config,symbol)
+    elif data_type == DATA_OPTION_CHAIN:
+        return option_chain(screener_config,symbol,get_next_monthly_expiration())
+    raise ValueError(f"unknown question data {data_type}")
+
+def get_question_expiration(question):
+    return int(get_current_timestamp() + (86400 * question.get(QUESTION_EXPIRATION_DAYS,0)))
+
+def get_next_monthly_timestamp(question):
+    return get_next_monthly_expiration().timestamp()
+
+def check_price(symbol,quote,question):
     price = quote.get_price()
 
     price_min = question.get(PRICE_MIN,DEFAULT_PRICE_MIN)
@@ -207,95 +375,77 @@ def check_price(screener_config,answer_file,symbol,section,question):
         debug(f"{symbol} price ${price:.2f} is higher than {PRICE_MIN}(${price_min:.2f})")
     else:
         print(f"\t\t{symbol} price ${price:.2f} is too low")
-        return(False,get_current_timestamp() + (86400 * question.get(QUESTION_EXPIRATION_DAYS,0)))
+        return False
 
     # Price is less than or equal to price_max
     if price <= price_max:
         debug(f"{symbol} price ${price:.2f} is lower than {PRICE_MAX}(${price_max:.2f})")
     else:
         print(f"\t\t{symbol} price ${price:.2f} is too high")
-        return(False,get_current_timestamp() + (86400 * question.get(QUESTION_EXPIRATION_DAYS,0)))
+        return False
     debug(f"check price for {symbol} passed")
-    return(True,get_current_timestamp() + (86400 * question.get(QUESTION_EXPIRATION_DAYS,0)))
-
-def check_volume(screener_config,answer_file,symbol,section,question):
-    # Get the boolean from cache and return it
-    (value,expiration_timestamp) = get_answer_from_cache(answer_file,symbol,question)
-    if value:
-        return (value,expiration_timestamp)
+    return True
 
-    try: 
-        quote = stock_quote(screener_config, symbol)
-    except SymbolNotFoundError as e:
-        print(f"\t\t{symbol} does not exist")
-        return (False,datetime.datetime(2037,12,31).timestamp())
-    
+def check_volume(symbol,quote,question):
     avg_vol = quote.get_average_volume()
     volume_min = question.get(VOLUME_MIN,DEFAULT_VOLUME_MIN)
 
     # Volume must be greater than the minimum
     if avg_vol < volume_min:
         print(f"\t\t{symbol} volume {avg_vol} is lower than {VOLUME_MIN}({volume_min})")
-        return(False,get_current_timestamp() + (86400 * question.get(QUESTION_EXPIRATION_DAYS,0)))
+        return False
     debug(f"{symbol} volume {avg_vol} is high enough {VOLUME_MIN}({volume_min})")
-    return(True,get_current_timestamp() + (86400 * question.get(QUESTION_EXPIRATION_DAYS,0)))
-
-def check_beta(screener_config,answer_file,symbol,section,question):
-    # Get the boolean from cache and return it
-    (value,expiration_timestamp) = get_answer_from_cache(answer_file,symbol,question)
-    if value:
-        return (value,expiration_timestamp)
+    return True
 
-    try: 
-        quote = stock_quote(screener_config, symbol)
-    except SymbolNotFoundError as e:
-        print(f"\t\t{symbol} does not exist")
-        return (False,datetime.datetime(2037,12,31).timestamp())
-    
+def check_beta(symbol,quote,question):
     beta = quote.get_beta()
     beta_max = question.get(BETA_MAX,DEFAULT_BETA_MAX)
 
-    # Volume must be greater than the minimum
+    # Beta must be lower than the maximum
     if beta > beta_max:
         print(f"\t\t{symbol} beta {beta} is higher than {BETA_MAX}({beta_max})")
-        return(False,get_current_timestamp() + (86400 * question.get(QUESTION_EXPIRATION_DAYS,0)))
+        return False
     debug(f"{symbol} beta {beta} is low enough {BETA_MAX}({beta_max})")
-    return(True,get_current_timestamp() + (86400 * question.get(QUESTION_EXPIRATION_DAYS,0)))
+    return True
 
-def check_open_interest(screener_config,answer_file,symbol,section,question):
-    # Get the boolean from cache and return it
-    (value,expiration_timestamp) = get_answer_from_cache(answer_file,symbol,question)
-    if value:
-        return (value,expiration_timestamp)
+def check_earnings(symbol,quote,question):
+    """ True if the earnings date is after the next monthly expiration (or unknown) """
+    next_monthly = get_next_monthly_expiration()
+    earnings_date = quote.get_next_earnings_date()
 
-    try: 
-        next_monthly = get_next_monthly_expiration()
-        next_date = f"{next_monthly.year}-{next_monthly.month:02d}-{next_monthly.day:02d}"
-        debug(f"fetching options chain for {symbol} {next_date}")
-        option_chain = get_option_chain(screener_config.get(ETRADE_CONFIG), symbol, next_monthly)
-    except Exception as e:
-        print(f"\t\terror fetching options chain: {e}")
-        return (False,0)
-    
+    if earnings_date:
+        if earnings_date < next_monthly:
+            debug(f"earnings date {earnings_date} is before next_monthly={next_monthly}")
+            return False
+        else:
+            debug(f"earnings date {earnings_date} is after next_monthly={next_monthly}")
+            return True
+    else:
+        debug(f"WARNING: could not determine earnings date")
+        return True
+
+def check_open_interest(symbol,chain,question):
+    next_monthly = get_next_monthly_expiration()
+    next_date = f"{next_monthly.year}-{next_monthly.month:02d}-{next_monthly.day:02d}"
     open_interest_min = question.get(OPEN_INTEREST_MIN,DEFAULT_OPEN_INTEREST_MIN)
 
-    for strike_price in option_chain.get_strike_prices():
-        call = option_chain.get_call_option(strike_price)
-        open_interest = call.get_open_interest()
-        if open_interest >= open_interest_min:
-            debug(f"found open interest {open_interest} for {symbol} strike {strike_price} on {next_date}")
-            return(True,next_monthly.timestamp())
+    open_interest = chain.get_call_array(OPTION_OPEN_INTEREST)
+    matches = (open_interest >= open_interest_min).nonzero()[0]
+    if len(matches) > 0:
+        strike_price = chain.get_strike_array()[matches[0]]
+        debug(f"found open interest {int(open_interest[matches[0]])} for {symbol} strike {strike_price} on {next_date}")
+        return True
 
     # Didn't find sufficient open interest
     print(f"\t\tdid not find sufficient open interest for {symbol} on {next_date}")
-    return(False,next_monthly.timestamp())
+    return False
 
 def debug(message):
     if GLOBAL_VERBOSE:
         print(message)
 
-def ask_question_sector(answer_file,symbol,section,question):
-    (value,expiration_timestamp) = get_answer_from_cache(answer_file,symbol,question)
+def ask_question_sector(answers,symbol,section,question):
+    (value,expiration_timestamp) = answers.get_answer(question)
     if value:
         return (value,expiration_timestamp)
 
@@ -330,32 +480,22 @@ def ask_question_sector(answer_file,symbol,section,question):
     sector_value = sector_list[int(value)-1]
     return(sector_value,get_current_timestamp() + (86400 * question.get(QUESTION_EXPIRATION_DAYS,0)))
 
-def ask_question(screener_config,answer_file,symbol,section,question):
+def ask_question(screener_config,answers,symbol,section,question):
     question_type = question.get(QUESTION_TYPE)
 
-    if question_type == TYPE_BOOLEAN:
-        return ask_question_boolean(answer_file,symbol,section,question)
-    elif question_type == TYPE_PRICE:
-        return check_price(screener_config,answer_file,symbol,section,question)
-    elif question_type == TYPE_VOLUME:
-        return check_volume(screener_config,answer_file,symbol,section,question)
-    elif question_type == TYPE_BETA:
-        return check_beta(screener_config,answer_file,symbol,section,question)
-    elif question_type == TYPE_EARNINGS:
-        return ask_question_earnings(screener_config,answer_file,symbol,section,question)
-    elif question_type == TYPE_SECTOR:
-        return ask_question_sector(answer_file,symbol,section,question)
-    elif question_type == TYPE_OPEN_INTEREST:
-        return check_open_interest(screener_config,answer_file,symbol,section,question)
+    if question_type in AUTOMATED_CHECKS:
+        return ask_automated_question(screener_config,answers,symbol,section,question)
+    elif question_type in INTERACTIVE_QUESTIONS:
+        return INTERACTIVE_QUESTIONS.get(question_type)(answers,symbol,section,question)
     else:
         text = question.get(QUESTION_TEXT)
         print(f"\t{symbol}[{section}] Unkown questions type {question_type}({text})")
     
     return (None,0)
 
-def ask_question_boolean(answer_file,symbol,section,question):
+def ask_question_boolean(answers,symbol,section,question):
     # Get the boolean from cache and return it
-    (value,expiration_timestamp) = get_answer_from_cache(answer_file,symbol,question)
+    (value,expiration_timestamp) = answers.get_answer(question)
     if value is not None:
         return (value,expiration_timestamp)
 
@@ -367,7 +507,7 @@ def ask_question_boolean(answer_file,symbol,section,question):
         return(False,get_current_timestamp() + (86400 * question.get(QUESTION_EXPIRATION_DAYS,0)))
 
 def get_earnings_date(screener_config,symbol):
-    answer_file = get_answer_file(screener_config.get(CACHE_DIR),symbol)
+    answers = get_answer_store(screener_config,symbol)
     questions = get_questions(screener_config.get(QUESTIONS_DIR))
     earnings_question = None
     for section in sorted(questions.keys()):
@@ -376,38 +516,26 @@ def get_earnings_date(screener_config,symbol):
             if question_id == QUID_EARNINGS_DATE:
                 earnings_question = question
 
-    (value,expiration_timestamp) = get_answer_from_cache(answer_file,symbol,earnings_question)
+    (value,expiration_timestamp) = answers.get_answer(earnings_question)
     earnings_date = datetime.datetime.fromtimestamp(expiration_timestamp - (86400*3))
     return earnings_date.strftime("%Y-%m-%d")
 
-def ask_question_earnings(screener_config, answer_file, symbol, section, question):
-    # Get the boolean from cache and return it
-    next_monthly = get_next_monthly_expiration()
-
-    (value,expiration_timestamp) = get_answer_from_cache(answer_file,symbol,question)
-    if value is not None:
-        earnings_date = datetime.datetime.fromtimestamp(expiration_timestamp)
-        if earnings_date < next_monthly:
-            debug(f"(cached) earnings date {earnings_date} is before next_monthly={next_monthly}")
-            return (False,expiration_timestamp)
-        debug(f"(cached) earnings date {earnings_date} is after next_monthly={next_monthly}")
-        return (True,expiration_timestamp)
-
-    quote = stock_quote(screener_config, symbol)
-
-    earnings_date = quote.get_next_earnings_date()
-
-    time.sleep(2)
-    if earnings_date:
-        if earnings_date < next_monthly:
-            debug(f"earnings date {earnings_date} is before next_monthly={next_monthly}")
-            return(False,int(get_current_timestamp() + (86400 * question.get(QUESTION_EXPIRATION_DAYS,0))))
-        else:
-            debug(f"earnings date {earnings_date} is after next_monthly={next_monthly}")
-            return (True,int(get_current_timestamp() + (86400 * question.get(QUESTION_EXPIRATION_DAYS,0))))
-    else:
-        debug(f"WARNING: could not determine earnings date")
-        return (True,int(get_current_timestamp() + (86400 * question.get(QUESTION_EXPIRATION_DAYS,0))))
+# Automated question types: type -> (data needed, predicate(symbol, data, question), expiration(question),
+# re-check a cached False). Only a cached True is trusted for the filters that can start passing any day
+AUTOMATED_CHECKS={
+    TYPE_PRICE: (DATA_QUOTE, check_price, get_question_expiration, True),
+    TYPE_VOLUME: (DATA_QUOTE, check_volume, get_question_expiration, True),
+    TYPE_BETA: (DATA_QUOTE, check_beta, get_question_expiration, True),
+    TYPE_EARNINGS: (DATA_QUOTE, check_earnings, get_question_expiration, False),
+    TYPE_OPEN_INTEREST: (DATA_OPTION_CHAIN, check_open_interest, get_next_monthly_timestamp, True),
+}
+AUTOMATED_QUESTION_TYPES=tuple(AUTOMATED_CHECKS.keys())
+
+# Question types that prompt for an answer
+INTERACTIVE_QUESTIONS={
+    TYPE_BOOLEAN: ask_question_boolean,
+    TYPE_SECTOR: ask_question_sector,
+}
 
 if __name__ == "__main__":
     # Setup the argument parsing
@@ -418,13 +546,19 @@ if __name__ == "__main__":
     parser.add_argument('-o','--output', dest='output_file', required=False,default=None,help="Write the results to a file")
     parser.add_argument('-r','--review', dest='review_symbol', required=False,default=None,help="Review a symbol's cached data")
     parser.add_argument('-s','--symbol', dest='symbol', required=False,default=None,help="Perform fresh screen of a symbol")
+    parser.add_argument('-p','--pipeline', dest='pipeline', required=False,default=False,action='store_true',help="Answer the automated questions for all symbols before asking any interactive ones")
+    parser.add_argument('-t','--timings', dest='timings', required=False,default=False,action='store_true',help="Print the question order and the time spent on each question")
+    parser.add_argument('--refresh', dest='refresh', required=False,default=False,action='store_true',help="Ignore cached option chains and fetch fresh ones")
     args = parser.parse_args()
     GLOBAL_VERBOSE = args.verbose
+    GLOBAL_REFRESH = args.refresh
     GLOBAL_QUOTE_CACHE = dict()
+    GLOBAL_MISSING_SYMBOLS = set()
+    GLOBAL_OPTION_CHAINS = dict()
     if args.review_symbol:
         review_symbol(args.config_file,args.review_symbol)
     elif args.symbol:
         fresh_screen(args.config_file,args.symbol)
     else:
-        main(args.config_file,args.summary_quote,args.output_file)
+        main(args.config_file,args.summary_quote,args.output_file,args.pipeline,args.timings)
 
@@ -1,11 +1,18 @@
 import pyetrade
 
+from concurrent.futures import ThreadPoolExecutor
 import datetime
 import json
+import numpy as np
+import os
 from os.path import expanduser
+import random
 import re
+import requests
 from screener_tools import *
+import threading
 import time
+from zoneinfo import ZoneInfo
 
 PROPERTIES_CREDENTIALS_FILE="credentials"
 PROPERTIES_AUTHTOKEN_FILE="authtoken"
@@ -15,8 +22,52 @@ PROPERTIES_SANDBOX="SANDBOX"
 PROPERTIES_LAST_AUTH_TIME="last_auth_time"
 PROPERTIES_OAUTH_TOKEN="oauth_token"
 PROPERTIES_OAUTH_TOKEN_SECRET="oauth_token_secret"
+PROPERTIES_MAX_IN_FLIGHT="max_in_flight"
+PROPERTIES_REQUESTS_PER_SECOND="requests_per_second"
+PROPERTIES_CHAIN_CACHE_DIR="chain_cache_dir"
 MAX_AUTH_TIME=120 * 60
 MIN_AUTH_RENEW_THRESHOLD=15 * 60
+HTTP_POOL_SIZE=16
+MAX_QUOTE_SYMBOLS=25
+DEFAULT_MAX_IN_FLIGHT=4
+DEFAULT_REQUESTS_PER_SECOND=4.0
+MAX_API_RETRIES=5
+RETRY_BACKOFF_BASE=0.5
+RETRY_BACKOFF_MAX=30.0
+
+# Option chain cache
+DEFAULT_CHAIN_CACHE_DIR="~/.etrade-chains"
+CHAIN_CACHE_MARKET_HOURS_TTL=15 * 60
+# A cached chain is stale by the next market open, files this old are removed
+CHAIN_CACHE_MAX_AGE=7 * 24 * 60 * 60
+CHAIN_CACHE_FETCH_TIME="fetch_time"
+CHAIN_CACHE_EXPIRATION="expiration_timestamp"
+CHAIN_CACHE_DATA="data"
+
+# Option chain columns
+OPTION_BID="bid"
+OPTION_ASK="ask"
+OPTION_LAST="lastPrice"
+OPTION_VOLUME="volume"
+OPTION_OPEN_INTEREST="openInterest"
+OPTION_DELTA="delta"
+OPTION_THETA="theta"
+OPTION_COLUMNS=(OPTION_BID, OPTION_ASK, OPTION_LAST, OPTION_VOLUME, OPTION_OPEN_INTEREST, OPTION_DELTA, OPTION_THETA)
+OPTION_GREEKS=(OPTION_DELTA, OPTION_THETA)
+
+# US equity market hours
+MARKET_TIMEZONE=ZoneInfo("America/New_York")
+MARKET_OPEN_TIME=datetime.time(9,30)
+MARKET_CLOSE_TIME=datetime.time(16,0)
+
+# One authenticated session per etrade config file, shared by the whole process
+_SESSIONS = dict()
+_SESSIONS_LOCK = threading.Lock()
+
+# Chain cache directory per etrade config file, and the directories pruned by this process
+_CHAIN_CACHE_DIRS = dict()
+_PRUNED_CHAIN_CACHE_DIRS = set()
+_CHAIN_CACHE_LOCK = threading.Lock()
 
 class ETradeConfigurationError(Exception):
     """ Exception for configuration files """
@@ -31,6 +82,26 @@ class SymbolNotFoundError(Exception):
 class AccountCreationException(Exception):
     pass
 
+class ETradeAPIError(Exception):
+    """ Base exception for failed E*Trade API calls """
+    pass
+
+class ETradeThrottledError(ETradeAPIError):
+    """ The broker rejected the request for exceeding its rate limit (retryable) """
+    pass
+
+class ETradeAuthExpiredError(ETradeAPIError):
+    """ The auth token was rejected """
+    pass
+
+class ETradeNotFoundError(ETradeAPIError):
+    """ The requested symbol or chain does not exist """
+    pass
+
+class ETradeTransientError(ETradeAPIError):
+    """ Server or network failure that may succeed on retry """
+    pass
+
 ################################################################################
 # Public methods
 ################################################################################
@@ -44,36 +115,144 @@ def authenticate (consumer_key,consumer_secret):
 
 def get_quote(config_file, symbol, screener_config=None):
     """ Returns a quote for the symbol as a float """
-    quote_data = get_quote_data(config_file, symbol)
+    try:
+        quote_data = get_quote_data(config_file, symbol)
+    except ETradeNotFoundError:
+        raise SymbolNotFoundError(f"symbol {symbol} is not found")
 
     if quote_data.get("QuoteResponse").get("QuoteData") is None:
         raise SymbolNotFoundError(f"symbol {symbol} is not found")
 
     return Quote(quote_data,screener_config)
 
+def get_quotes(config_file, symbols, screener_config=None):
+    """ Returns a tuple of (dict of symbol -> Quote, list of symbols that were not found),
+        requesting up to MAX_QUOTE_SYMBOLS symbols per call """
+    quotes = dict()
+    missing = list()
+
+    requested = dict()
+    for symbol in symbols:
+        requested[symbol.upper()] = symbol
+    symbol_list = list(requested.keys())
+
+    for start in range(0, len(symbol_list), MAX_QUOTE_SYMBOLS):
+        batch = symbol_list[start:start + MAX_QUOTE_SYMBOLS]
+        try:
+            quote_data = get_quotes_data(config_file, batch)
+        except ETradeNotFoundError:
+            # None of the symbols in the batch exist
+            continue
+
+        # Incomplete quotes are left out, like missing symbols
+        for (symbol,quote) in parse_quotes(quote_data,screener_config).items():
+            if symbol in requested:
+                quotes[requested[symbol]] = quote
+
+    for symbol in requested.values():
+        if symbol not in quotes:
+            missing.append(symbol)
+
+    return (quotes, missing)
+
 def get_quote_data(config_file, symbol):
     """ takes in an etrade json config file and a symbol, returns the quote data as a json object """
-    authtoken_data = _get_authtoken(config_file)
-    market = _get_market(authtoken_data)
-    return market.get_quote([symbol], detail_flag="all", require_earnings_date=True, resp_format='json')
+    return get_quotes_data(config_file, [symbol])
 
-def get_option_chain(config_file, symbol, expiration_date):
+def get_quotes_data(config_file, symbols):
+    """ takes in an etrade json config file and a list of symbols (at most MAX_QUOTE_SYMBOLS),
+        returns the quote data as a json object """
+    return get_session(config_file).call_market("get_quote", list(symbols), detail_flag="all", require_earnings_date=True, resp_format='json')
+
+def get_option_chain(config_file, symbol, expiration_date, refresh=False):
     """ takes in an etrade json config file and a symbol and an expiration date
-        returns the option chain data as a json object """
-    authtoken_data = _get_authtoken(config_file)
-    market = _get_market(authtoken_data)
+        returns the option chain data as a json object. A fresh copy from the
+        on-disk chain cache is used unless refresh is set. The session is only
+        created when the chain has to be fetched """
     option_chain = None
+    if not refresh:
+        option_chain = _get_cached_option_chain(config_file, symbol, expiration_date)
+    if option_chain is None:
+        option_chain = _fetch_option_chain(config_file, symbol, expiration_date)
+    return option_chain
+
+def _get_cached_option_chain(config_file, symbol, expiration_date):
+    """ Returns the OptionChain from the on-disk chain cache, None if there is no fresh usable copy """
+    option_data = _read_cached_chain(_get_chain_cache_filename(get_chain_cache_dir(config_file), symbol, expiration_date))
+    if option_data is None:
+        return None
+    try:
+        return OptionChain(symbol,option_data)
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None
+
+def _fetch_option_chain(config_file, symbol, expiration_date):
+    """ Fetch an option chain from etrade and write it to the chain cache """
     try:
-        option_chain = OptionChain(symbol,market.get_option_chains(symbol,expiry_date=expiration_date,resp_format='json'))
-    except Exception:
+        option_data = get_session(config_file).call_market("get_option_chains",symbol,expiry_date=expiration_date,resp_format='json')
+    except ETradeNotFoundError:
         raise OptionChainNotFoundError(f"could not find option chain for {expiration_date}")
+
+    option_chain = None
+    try:
+        option_chain = OptionChain(symbol,option_data)
+    except (AttributeError, KeyError, TypeError, ValueError):
+        raise OptionChainNotFoundError(f"could not parse option chain for {expiration_date}")
+
+    _cache_chain(_get_chain_cache_filename(get_chain_cache_dir(config_file), symbol, expiration_date), option_data)
     return option_chain
 
+def get_option_chains(config_file, chain_requests, max_in_flight=None, refresh=False):
+    """ takes in an etrade json config file and a list of (symbol, expiration_date) pairs,
+        fetches the option chains concurrently (at most max_in_flight at a time) and
+        returns a list in the same order holding either an OptionChain or the
+        exception (OptionChainNotFoundError or ETradeAPIError) for that pair.
+        Cached chains are read first; if anything has to be fetched the session
+        is authenticated here, so a verification code prompt never happens
+        inside a worker """
+    chain_requests = list(chain_requests)
+    if len(chain_requests) == 0:
+        return list()
+
+    results = [None] * len(chain_requests)
+    if not refresh:
+        for (index, (symbol, expiration_date)) in enumerate(chain_requests):
+            results[index] = _get_cached_option_chain(config_file, symbol, expiration_date)
+
+    missing = [index for index in range(len(chain_requests)) if results[index] is None]
+    if len(missing) == 0:
+        return results
+
+    session = get_session(config_file)
+    session.authenticate()
+    if max_in_flight is None:
+        max_in_flight = session.get_max_in_flight()
+
+    def fetch(index):
+        (symbol, expiration_date) = chain_requests[index]
+        try:
+            return _fetch_option_chain(config_file, symbol, expiration_date)
+        except (OptionChainNotFoundError, ETradeAPIError) as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=max(1,min(max_in_flight,len(missing)))) as executor:
+        for (index, result) in zip(missing, executor.map(fetch, missing)):
+            results[index] = result
+    return results
+
+def get_chain_cache_dir(config_file):
+    """ Returns the option chain cache directory named by an etrade json config file """
+    key = os.path.abspath(expanduser(config_file))
+    with _CHAIN_CACHE_LOCK:
+        cache_dir = _CHAIN_CACHE_DIRS.get(key,None)
+        if cache_dir is None:
+            cache_dir = _read_etrade_json(config_file).get(PROPERTIES_CHAIN_CACHE_DIR,DEFAULT_CHAIN_CACHE_DIR)
+            _CHAIN_CACHE_DIRS[key] = cache_dir
+    return cache_dir
+
 def get_options_expiration_dates(config_file, symbol):
-    authtoken_data = _get_authtoken(config_file)
-    market = _get_market(authtoken_data)
     dates = None
-    dates = market.get_option_expire_date(symbol,resp_format='json')
+    dates = get_session(config_file).call_market("get_option_expire_date",symbol,resp_format='json')
     return dates
 
 def get_next_monthly_expiration():
@@ -89,6 +268,28 @@ def get_next_monthly_expiration():
         else:
             return get_third_friday(now.year+1,1)
         
+def is_market_open(now=None):
+    """ Returns True if the US equity market is in regular trading hours (holidays are not considered) """
+    if now is None:
+        now = datetime.datetime.now(MARKET_TIMEZONE)
+    now = now.astimezone(MARKET_TIMEZONE)
+    if now.weekday() >= 5:
+        return False
+    return MARKET_OPEN_TIME <= now.time() < MARKET_CLOSE_TIME
+
+def get_next_market_open(now=None):
+    """ Returns a timezone aware datetime for the next regular market open after now """
+    if now is None:
+        now = datetime.datetime.now(MARKET_TIMEZONE)
+    now = now.astimezone(MARKET_TIMEZONE)
+
+    day = now.date()
+    if now.time() >= MARKET_OPEN_TIME:
+        day += datetime.timedelta(days=1)
+    while day.weekday() >= 5:
+        day += datetime.timedelta(days=1)
+    return datetime.datetime.combine(day, MARKET_OPEN_TIME, tzinfo=MARKET_TIMEZONE)
+
 def get_third_friday(year,month):
     # Special case the year
     if year == 2022 and month == 4:
@@ -126,23 +327,30 @@ def renew_authtoken(config_file,force_renew):
     return
 
 def get_account_list(config_file):
-    authtoken_data = _get_authtoken(config_file)
-    etrade_account = _get_etrade_account(authtoken_data)
-    account_data = etrade_account.list_accounts(resp_format='json')
-    account_list = AccountList(etrade_account, account_data)
+    session = get_session(config_file)
+    account_data = session.call_accounts("list_accounts",resp_format='json')
+    account_list = AccountList(session, account_data)
     return account_list
 
 def get_portfolio(config_file, acc_obj):
     portfolio = None
-    authtoken_data = _get_authtoken(config_file)
-    etrade_account = _get_etrade_account(authtoken_data)
     try:
-        portfolio = etrade_account.get_account_portfolio(acc_obj.get_key(), resp_format='json')
-    except Exception as e:
+        portfolio = get_session(config_file).call_accounts("get_account_portfolio",acc_obj.get_key(), resp_format='json')
+    except ETradeAPIError as e:
         print(f"unable to get portfolio data for {acc_obj.get_display_name()}: {e}")
 
     return portfolio
-        
+
+def get_session(config_file):
+    """ Returns the process-wide ETradeSession for an etrade json config file """
+    key = os.path.abspath(expanduser(config_file))
+    with _SESSIONS_LOCK:
+        session = _SESSIONS.get(key,None)
+        if session is None:
+            session = ETradeSession(config_file)
+            _SESSIONS[key] = session
+    return session
+
 
 ################################################################################
 # Private methods
@@ -158,6 +366,22 @@ def _read_etrade_json(config_file):
     """ Read in an etrade json config file and return it """
     return read_json_file(config_file)
 
+def _get_positive_property(config_file, config_data, name, default, cast):
+    """ Read a numeric property from an etrade json config, it must be greater than 0 """
+    try:
+        value = cast(config_data.get(name,default))
+    except (TypeError, ValueError):
+        raise ETradeConfigurationError(f"property '{name}' must be a number in {config_file}")
+    if not value > 0:
+        raise ETradeConfigurationError(f"property '{name}' must be greater than 0 in {config_file}")
+    return value
+
+def _get_max_in_flight(config_file, config_data):
+    return _get_positive_property(config_file, config_data, PROPERTIES_MAX_IN_FLIGHT, DEFAULT_MAX_IN_FLIGHT, int)
+
+def _get_requests_per_second(config_file, config_data):
+    return _get_positive_property(config_file, config_data, PROPERTIES_REQUESTS_PER_SECOND, DEFAULT_REQUESTS_PER_SECOND, float)
+
 def _get_market(authtoken_data):
     """ Create a market object from the authtoken data """
     return pyetrade.ETradeMarket( 
@@ -276,14 +500,281 @@ def _get_authtoken(config_file):
     renew_authtoken(config_file,False)
     return authtoken_data
 
+def _get_chain_cache_filename(cache_dir, symbol, expiration_date):
+    expiration = "nearest"
+    if expiration_date is not None:
+        expiration = f"{expiration_date.year}-{expiration_date.month:02d}-{expiration_date.day:02d}"
+    return os.path.join(expanduser(cache_dir), f"{symbol.upper()}.{expiration}.chain.json")
+
+def _get_chain_cache_expiration(fetch_time):
+    """ Chains fetched during market hours go stale quickly, otherwise they are good until the next open """
+    now = datetime.datetime.fromtimestamp(fetch_time, MARKET_TIMEZONE)
+    if is_market_open(now):
+        return int(fetch_time + CHAIN_CACHE_MARKET_HOURS_TTL)
+    return int(get_next_market_open(now).timestamp())
+
+def _read_cached_chain(cache_file):
+    """ Returns the cached OptionChainResponse payload, or None if missing or stale """
+    try:
+        cached = read_json_file(cache_file)
+    except (OSError, ValueError):
+        return None
+
+    if time.time() >= cached.get(CHAIN_CACHE_EXPIRATION,0):
+        return None
+    return cached.get(CHAIN_CACHE_DATA,None)
+
+def _cache_chain(cache_file, option_data):
+    fetch_time = int(time.time())
+    cached = {
+        CHAIN_CACHE_FETCH_TIME: fetch_time,
+        CHAIN_CACHE_EXPIRATION: _get_chain_cache_expiration(fetch_time),
+        CHAIN_CACHE_DATA: option_data
+    }
+    try:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        _prune_chain_cache(os.path.dirname(cache_file))
+        temp_file = f"{cache_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_file, "w") as f:
+            f.write(json.dumps(cached))
+        os.replace(temp_file, cache_file)
+    except OSError as e:
+        print(f"unable to cache option chain {cache_file}: {e}")
+
+def _prune_chain_cache(cache_dir):
+    """ Remove the cached chains that can't be used again, once per process and directory:
+        chains for an expiration date that has passed and files not refreshed in CHAIN_CACHE_MAX_AGE """
+    with _CHAIN_CACHE_LOCK:
+        if cache_dir in _PRUNED_CHAIN_CACHE_DIRS:
+            return
+        _PRUNED_CHAIN_CACHE_DIRS.add(cache_dir)
+
+    today = datetime.date.today().isoformat()
+    oldest = time.time() - CHAIN_CACHE_MAX_AGE
+    for entry in os.scandir(cache_dir):
+        if not entry.name.endswith(".chain.json"):
+            continue
+        expiration = entry.name[:-len(".chain.json")].rsplit(".",1)[-1]
+        try:
+            if (expiration != "nearest" and expiration < today) or entry.stat().st_mtime < oldest:
+                os.remove(entry.path)
+        except OSError:
+            # Removed by another process
+            pass
+
+def _classify_error(error):
+    """ Map an exception raised by a pyetrade call onto an ETradeAPIError subclass """
+    if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+        status = error.response.status_code
+        if status == 429:
+            return ETradeThrottledError(f"request throttled: {error}")
+        if status == 401:
+            return ETradeAuthExpiredError(f"authorization rejected: {error}")
+        if status in (400, 404):
+            return ETradeNotFoundError(f"not found: {error}")
+        if status >= 500:
+            return ETradeTransientError(f"server error: {error}")
+    elif isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+        return ETradeTransientError(f"network error: {error}")
+    return ETradeAPIError(str(error))
+
+def _get_retry_delay(error, attempt):
+    """ Exponential backoff with full jitter, honoring Retry-After when throttled """
+    response = getattr(error.__cause__, "response", None)
+    if response is not None:
+        try:
+            return min(RETRY_BACKOFF_MAX, float(response.headers.get("Retry-After")))
+        except (TypeError, ValueError):
+            pass
+    return random.uniform(0, min(RETRY_BACKOFF_MAX, RETRY_BACKOFF_BASE * (2 ** attempt)))
+
+class RateLimiter():
+    """ Token bucket shared by every call made through an ETradeSession """
+    def __init__(self,rate,capacity=None):
+        if not float(rate) > 0:
+            raise ValueError(f"rate must be greater than 0, got {rate}")
+        self._rate = float(rate)
+        self._capacity = float(capacity or max(1.0,rate))
+        self._tokens = self._capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """ Block until a request may be sent """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self._capacity, self._tokens + (now - self._last) * self._rate)
+                self._last = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                wait = (1.0 - self._tokens) / self._rate
+            time.sleep(wait)
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+def _option_columns(option_list):
+    """ Build a dict of OPTION_COLUMNS -> float array from a list of option dicts (None for a missing leg) """
+    columns = dict()
+    for column in OPTION_COLUMNS:
+        values = list()
+        for option in option_list:
+            if option is None:
+                values.append(np.nan)
+            elif column in OPTION_GREEKS:
+                values.append(_to_float((option.get("OptionGreeks") or dict()).get(column)))
+            else:
+                values.append(_to_float(option.get(column)))
+        columns[column] = np.array(values, dtype=float)
+    return columns
+
+def _total_open_interest(legs_list):
+    """ Returns the open interest of every option in lists of options (missing open interest counts as 0) """
+    return float(np.nansum([_to_float(leg.get(OPTION_OPEN_INTEREST)) for legs in legs_list for leg in legs]))
+
+def _keep_alive(client,pool_size=HTTP_POOL_SIZE):
+    """ Give a pyetrade client a connection pool large enough to be shared """
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    client.session.mount("https://", adapter)
+    return client
+
+class ETradeSession():
+    """ Loads the credentials and auth token once and keeps long-lived market
+        and accounts clients for every call made against the same config file.
+        The token is renewed on a background timer shortly before MAX_AUTH_TIME """
+    def __init__(self,config_file):
+        self._config_file = config_file
+        self._lock = threading.RLock()
+        self._renew_timer = None
+        self._market = None
+        self._accounts = None
+
+        (self._creds_file, self._authtoken_file) = _get_etrade_config(config_file)
+        config_data = _read_etrade_json(config_file)
+        self._max_in_flight = _get_max_in_flight(config_file, config_data)
+        self._rate_limiter = RateLimiter(_get_requests_per_second(config_file, config_data))
+        self._chain_cache_dir = get_chain_cache_dir(config_file)
+        self._authtoken_data = _get_authtoken(config_file)
+        self._build_clients()
+        self._schedule_renewal()
+
+    def get_config_file(self):
+        return self._config_file
+
+    def authenticate(self):
+        """ Make sure the auth token is current, prompting for a new one if it lapsed.
+            Call this from the main thread before handing the session to workers """
+        with self._lock:
+            self._check_expired()
+
+    def get_max_in_flight(self):
+        return self._max_in_flight
+
+    def get_chain_cache_dir(self):
+        return self._chain_cache_dir
+
+    def get_market(self):
+        with self._lock:
+            self._check_expired()
+            return self._market
+
+    def get_accounts(self):
+        with self._lock:
+            self._check_expired()
+            return self._accounts
+
+    def call_market(self, method, *args, **kwargs):
+        """ Rate limited, retrying call of a pyetrade ETradeMarket method """
+        return self._call(self.get_market, method, *args, **kwargs)
+
+    def call_accounts(self, method, *args, **kwargs):
+        """ Rate limited, retrying call of a pyetrade ETradeAccounts method """
+        return self._call(self.get_accounts, method, *args, **kwargs)
+
+    def _call(self, get_client, method, *args, **kwargs):
+        attempt = 0
+        renewed = False
+        while True:
+            self._rate_limiter.acquire()
+            try:
+                return getattr(get_client(), method)(*args, **kwargs)
+            except Exception as e:
+                error = _classify_error(e)
+                error.__cause__ = e
+
+            if isinstance(error, ETradeAuthExpiredError) and not renewed:
+                renewed = True
+                self._renew()
+                continue
+
+            if isinstance(error, (ETradeThrottledError, ETradeTransientError)) and attempt < MAX_API_RETRIES:
+                time.sleep(_get_retry_delay(error, attempt))
+                attempt += 1
+                continue
+
+            raise error
+
+    def _build_clients(self):
+        pool_size = max(HTTP_POOL_SIZE,self._max_in_flight)
+        self._market = _keep_alive(_get_market(self._authtoken_data),pool_size)
+        self._accounts = _keep_alive(_get_etrade_account(self._authtoken_data),pool_size)
+
+    def _get_auth_age(self):
+        return int(time.time() - self._authtoken_data.get(PROPERTIES_LAST_AUTH_TIME,0))
+
+    def _check_expired(self):
+        """ Re-authenticate if the token was allowed to lapse (e.g. renewal failed) """
+        if self._get_auth_age() <= MAX_AUTH_TIME:
+            return
+
+        self._authtoken_data = _generate_authtoken(
+                self._authtoken_file,
+                self._authtoken_data.get(PROPERTIES_CONSUMER_KEY),
+                self._authtoken_data.get(PROPERTIES_CONSUMER_SECRET),
+                self._authtoken_data.get(PROPERTIES_SANDBOX))
+        self._build_clients()
+        self._schedule_renewal()
+
+    def _schedule_renewal(self):
+        if self._renew_timer:
+            self._renew_timer.cancel()
+
+        delay = max(0, MAX_AUTH_TIME - MIN_AUTH_RENEW_THRESHOLD - self._get_auth_age())
+        self._renew_timer = threading.Timer(delay, self._renew)
+        self._renew_timer.daemon = True
+        self._renew_timer.start()
+
+    def _renew(self):
+        with self._lock:
+            try:
+                authManager = pyetrade.authorization.ETradeAccessManager(
+                        self._authtoken_data.get(PROPERTIES_CONSUMER_KEY),
+                        self._authtoken_data.get(PROPERTIES_CONSUMER_SECRET),
+                        self._authtoken_data.get(PROPERTIES_OAUTH_TOKEN),
+                        self._authtoken_data.get(PROPERTIES_OAUTH_TOKEN_SECRET)
+                    )
+                authManager.renew_access_token()
+            except Exception as e:
+                print(f"unable to renew the auth token: {e}")
+                return
+
+            self._authtoken_data[PROPERTIES_LAST_AUTH_TIME] = int(time.time())
+            _write_authtoken_file(self._authtoken_file,self._authtoken_data)
+            self._schedule_renewal()
+
 class AccountList:
-    def __init__(self, etrade_account, account_data):
+    def __init__(self, session, account_data):
         self._accounts = dict()
 
         for acc_data in account_data.get("AccountListResponse").get("Accounts").get("Account"):
             try:
                 acc_obj = Account(
-                    etrade_account,
+                    session,
                     acc_data.get("accountId"),
                     acc_data.get("accountIdKey"),
                     acc_data.get("accountName"),
@@ -316,7 +807,7 @@ class AccountList:
                 return acc_obj
 
 class Account:
-    def __init__(self, etrade_account, account_id, account_key, account_name, account_type, description):
+    def __init__(self, session, account_id, account_key, account_name, account_type, description):
 
         if account_id is None or account_key is None:
             raise AccountCreationException
@@ -331,7 +822,7 @@ class Account:
 
         self._type = account_type
 
-        self._positions = PortfolioPositions(etrade_account, account_key)
+        self._positions = PortfolioPositions(session, account_key)
 
     def get_id(self):
         return self._id
@@ -363,13 +854,13 @@ class PortfolioPositions:
     _SUBTYPE_OPTION_CALL = "CALL"
     _SUBTYPE_OPTION_PUT = "PUT"
 
-    def __init__(self, etrade_account, account_key):
-        self._etrade_account = etrade_account
+    def __init__(self, session, account_key):
+        self._session = session
         self._account_key = account_key
         self._positions = dict()
         try:
-            self._portfolio_data = etrade_account.get_account_portfolio(account_key, resp_format='json')
-        except Exception as e:
+            self._portfolio_data = session.call_accounts("get_account_portfolio", account_key, resp_format='json')
+        except ETradeAPIError as e:
             raise AccountCreationException
 
         for p in self._portfolio_data.get("PortfolioResponse").get("AccountPortfolio")[0].get("Position"):
@@ -398,7 +889,7 @@ class PortfolioPositions:
         return self._positions.values()
 
     def _get_cash_position(self):
-        return CashPosition(cash_data = self._etrade_account.get_account_balance(self._account_key, resp_format='json'))
+        return CashPosition(cash_data = self._session.call_accounts("get_account_balance", self._account_key, resp_format='json'))
 
     def get_balance(self):
         return self._cash_position.get_quantity()
@@ -449,55 +940,98 @@ class CashPosition(Position):
         self._display_name = PortfolioPositions._TYPE_CASH
         self._quantity = cash_data.get("BalanceResponse").get("Cash").get("moneyMktBalance")
 
+def _to_datetime(timestamp):
+    return datetime.datetime.fromtimestamp(int(timestamp))
+
+def _to_earnings_date(earnings_date):
+    """ Parse a MM/DD/YYYY earnings date, an earnings date before today is moved forward three months """
+    try:
+        (month, day, year) = earnings_date.split("/")
+        next_earnings_date = datetime.datetime(year=int(year),month=int(month),day=int(day))
+    except (AttributeError, ValueError):
+        return None
+
+    if next_earnings_date < datetime.datetime.now():
+        next_earnings_date = datetime.datetime.fromtimestamp(next_earnings_date.timestamp() + Quote._THREE_MONTHS)
+    return next_earnings_date
+
+def parse_quotes(quote_data,screener_config=None):
+    """ Returns symbol (upper case) -> Quote for every complete quote in a (multi-symbol) quote response """
+    quotes = dict()
+    for index in range(len(quote_data.get("QuoteResponse").get("QuoteData") or list())):
+        try:
+            quote = Quote(quote_data,screener_config,index)
+        except (AttributeError, TypeError, ValueError):
+            # Incomplete quote data
+            continue
+        quotes[quote.get_symbol().upper()] = quote
+    return quotes
+
 class Quote():
+    """ A quote from a quote response. The "All" block is resolved once and each field
+        is converted (and the sector looked up) on first use """
     # Three months in seconds to be added to earnings dates that are before today
     _THREE_MONTHS = 90 * 24 * 60 * 60
-    def __init__(self,quote_data,screener_config=None):
+
+    # attribute -> (field in the "All" block, conversion or None to keep the value as is).
+    # A missing or invalid field reads as None
+    _FIELDS = {
+        "_bid": ("bid", float),
+        "_ask": ("ask", float),
+        "_bid_size": ("bidSize", int),
+        "_ask_size": ("askSize", int),
+        "_day_high": ("high", float),
+        "_52week_high": ("high52", float),
+        "_52week_high_date": ("week52HiDate", _to_datetime),
+        "_day_low": ("low", float),
+        "_52week_low": ("low52", float),
+        "_52week_low_date": ("week52LowDate", _to_datetime),
+        "_prev_close": ("previousClose", float),
+        "_change_close": ("changeClose", float),
+        "_change_close_prct": ("changeClosePercentage", float),
+        "_company_name": ("companyName", None),
+        "_avg_vol": ("averageVolume", int),
+        "_volume": ("totalVolume", int),
+        "_beta": ("beta", float),
+        "_market_cap": ("marketCap", int),
+        "_float": ("sharesOutstanding", int),
+        "_ex_date": ("exDividendDate", int),
+        "_dividend": ("dividend", float),
+        "_next_earnings_date": ("nextEarningDate", _to_earnings_date),
+    }
+    __slots__ = ("_quote_data", "_all", "_screener_config", "_symbol", "_price", "_sector") + tuple(_FIELDS.keys())
+
+    def __init__(self,quote_data,screener_config=None,index=0):
         self._quote_data = quote_data
+        symbol_data = quote_data.get("QuoteResponse").get("QuoteData")[index]
+        self._all = symbol_data.get("All")
+        self._screener_config = screener_config
 
-        self._symbol = self._quote_data.get("QuoteResponse").get("QuoteData")[0].get("Product").get("symbol")
-        self._price = float(self._quote_data.get("QuoteResponse").get("QuoteData")[0].get("All").get("lastTrade"))
-        self._bid = float(self._quote_data.get("QuoteResponse").get("QuoteData")[0].get("All").get("bid"))
-        self._ask = float(self._quote_data.get("QuoteResponse").get("QuoteData")[0].get("All").get("ask"))
-        self._bid_size = int(self._quote_data.get("QuoteResponse").get("QuoteData")[0].get("All").get("bidSize"))
-        self._ask_size = int(self._quote_data.get("QuoteResponse").get("QuoteData")[0].get("All").get("askSize"))
-
-        self._day_high = float(self._quote_data.get("QuoteResponse").get("QuoteData")[0].get("All").get("high"))
-        self._52week_high = float(self._quote_data.get("QuoteResponse").get("QuoteData")[0].get("All").get("high52"))
-        self._52week_high_date = datetime.datetime.fromtimestamp(int(self._quote_data.get("QuoteResponse").get("QuoteData")[0].get("All").get("week52HiDate")))
-        self._day_low = float(self._quote_data.get("QuoteResponse").get("QuoteData")[0].get("All").get("low"))
-        self._52week_low = float(self._quote_data.get("QuoteResponse").get("QuoteData")[0].get("All").get("low52"))
-        self._52week_low_date = datetime.datetime.fromtimestamp(int(self._quote_data.get("QuoteResponse").get("QuoteData")[0].get("All").get("week52LowDate")))
-
-        self._prev_close = float(self._quote_data.get("QuoteResponse").get("QuoteData")[0].get("All").get("previousClose"))
-        self._change_close = float(self._quote_data.get("QuoteResponse").get("QuoteData")[0].get("All").get("changeClose"))
-        self._change_close_prct = float(self._quote_data.get("QuoteResponse").get("QuoteData")[0].get("All").get("changeClosePercentage"))
-
-        self._company_name = self._quote_data.get("QuoteResponse").get("QuoteData")[0].get("All").get("companyName")
-        self._avg_vol = int(self._quote_data.get("QuoteResponse").get("QuoteData")[0].get("All").get("averageVolume"))
-        self._volume = int(self._quote_data.get("QuoteResponse").get("QuoteData")[0].get("All").get("totalVolume"))
-        self._beta = float(self._quote_data.get("QuoteResponse").get("QuoteData")[0].get("All").get("beta"))
-        self._market_cap = int(self._quote_data.get("QuoteResponse").get("QuoteData")[0].get("All").get("marketCap"))
-        self._float = int(self._quote_data.get("QuoteResponse").get("QuoteData")[0].get("All").get("sharesOutstanding"))
-        self._ex_date = int(self._quote_data.get("QuoteResponse").get("QuoteData")[0].get("All").get("exDividendDate"))
-        self._dividend = float(self._quote_data.get("QuoteResponse").get("QuoteData")[0].get("All").get("dividend"))
-
-        earnings_date = self._quote_data.get("QuoteResponse").get("QuoteData")[0].get("All").get("nextEarningDate")
+        # The symbol and price are always used, converting the price also checks the quote is complete
+        self._symbol = symbol_data.get("Product").get("symbol")
+        self._price = float(self._all.get("lastTrade"))
 
-        try:
-            (month, day, year) = earnings_date.split("/")
-            self._next_earnings_date = datetime.datetime(year=int(year),month=int(month),day=int(day))
-            if self._next_earnings_date < datetime.datetime.now():
-                self._next_earnings_date = datetime.datetime.fromtimestamp(self._next_earnings_date.timestamp() + self._THREE_MONTHS)
-
-        except ValueError as e:
-            self._next_earnings_date = None
-            
         # TODO - yield, div pay date(epoch seconds), p/e ratio, eps, estEarning, 
         # TODO - after hours data (price, bid, ask, volume, change%)
-        self._sector = "unknown"
-        if screener_config:
-            self._sector = get_sector_from_cache(screener_config,self._symbol)
+
+    def __getattr__(self,name):
+        # Only called for a slot that hasn't been set yet
+        if name == "_sector":
+            value = "unknown"
+            if self._screener_config:
+                value = get_sector_from_cache(self._screener_config,self._symbol)
+        elif name in Quote._FIELDS:
+            (field, convert) = Quote._FIELDS.get(name)
+            value = self._all.get(field)
+            if convert is not None:
+                try:
+                    value = convert(value)
+                except (TypeError, ValueError, OverflowError, OSError):
+                    value = None
+        else:
+            raise AttributeError(name)
+        setattr(self,name,value)
+        return value
 
     def get_symbol(self):
         return self._symbol
@@ -525,6 +1059,8 @@ class Quote():
 
     def get_market_cap(self):
         cap = self._market_cap
+        if cap is None:
+            return None
         if cap > 10**9:
             cap = f"{cap / 10**9:.1f}B"
         elif cap > 10**6:
@@ -533,6 +1069,8 @@ class Quote():
 
     def get_float(self):
         fl = self._float
+        if fl is None:
+            return None
         if fl > 10**9:
             fl = f"{fl / 10**9:.1f}B"
         elif fl > 10**6:
@@ -565,6 +1103,8 @@ class Quote():
 
     def get_52week_high_date(self):
         d = self._52week_high_date
+        if d is None:
+            return None
         return f"{d.year}-{d.month:02d}-{d.day:02d}"
 
     def get_day_low(self):
@@ -575,9 +1115,13 @@ class Quote():
 
     def get_52week_low_date(self):
         d = self._52week_low_date
+        if d is None:
+            return None
         return f"{d.year}-{d.month:02d}-{d.day:02d}"
 
     def get_exdate(self):
+        if self._ex_date is None:
+            return None
         return datetime.datetime.fromtimestamp(self._ex_date)
 
     def get_dividend(self):
@@ -588,6 +1132,9 @@ class Quote():
 
 
 class OptionChain():
+    """ Columnar option chain: a sorted strike array with parallel float arrays
+        (see OPTION_COLUMNS) for the calls and the puts. The CallOption and
+        PutOption accessors are thin views built on demand """
     def __init__(self,symbol,option_data):
         self._symbol = symbol
         self._option_data = option_data
@@ -599,24 +1146,39 @@ class OptionChain():
 
         self._call_options = dict()
         self._put_options = dict()
-        self._strike_prices = set()
-
-        # For determining Put/Call Ratio
-        self._put_open_interest = 0
-        self._call_open_interest = 0
 
         self._parse_option_pairs()
 
-        self._calculate_max_pain()
+        # For determining Put/Call Ratio (totalled in _parse_option_pairs)
 
-    def get_symbol():
+        # Max pain is calculated on first use
+        self._max_pain = None
+        self._max_pain_calculated = False
+
+    def get_symbol(self):
         return self._symbol
 
     def _parse_option_pairs(self):
-        min_dollars = 0
-        for option in self._option_data.get("OptionChainResponse").get("OptionPair"):
-            self._add_option(CallOption(option.get("Call")))
-            self._add_option(PutOption(option.get("Put")))
+        # strike -> every call (put) listed at that strike, a chain can list a strike more than once
+        calls = dict()
+        puts = dict()
+        for option in self._option_data.get("OptionChainResponse").get("OptionPair") or list():
+            for (leg, legs) in ((option.get("Call"), calls), (option.get("Put"), puts)):
+                if leg is not None:
+                    legs.setdefault(float(leg.get("strikePrice")), list()).append(leg)
+
+        self._strike_prices = sorted(set(calls.keys()) | set(puts.keys()))
+        self._strike_index = {strike: i for (i, strike) in enumerate(self._strike_prices)}
+        self._strikes = np.array(self._strike_prices, dtype=float)
+
+        # The last option listed at a strike is the one used (for the columns and max pain),
+        # but the open interest of all of them counts towards the put/call ratio
+        self._call_data = [calls[strike][-1] if strike in calls else None for strike in self._strike_prices]
+        self._put_data = [puts[strike][-1] if strike in puts else None for strike in self._strike_prices]
+        self._calls = _option_columns(self._call_data)
+        self._puts = _option_columns(self._put_data)
+        self._call_open_interest = _total_open_interest(calls.values())
+        self._put_open_interest = _total_open_interest(puts.values())
 
     def get_option_data(self):
         return self._option_data
@@ -624,25 +1186,36 @@ class OptionChain():
     def get_expiration(self):
         return self._expiration
 
-    def _add_option(self,option):
-        strike = option.get_strike_price()
-        self._strike_prices.add(strike)
+    def get_strike_prices(self):
+        """ Returns the (already sorted) strike prices, do not modify the list """
+        return self._strike_prices
 
-        if isinstance(option,CallOption):
-            self._call_options[strike] = option
-            self._call_open_interest += option.get_open_interest()
-        elif isinstance(option,PutOption):
-            self._put_options[strike] = option
-            self._put_open_interest += option.get_open_interest()
+    def get_strike_array(self):
+        return self._strikes
 
-    def get_strike_prices(self):
-        return sorted(self._strike_prices)
+    def get_call_array(self,column):
+        """ Returns the numpy array for an OPTION_COLUMNS column of the calls, aligned with get_strike_array() """
+        return self._calls[column]
+
+    def get_put_array(self,column):
+        """ Returns the numpy array for an OPTION_COLUMNS column of the puts, aligned with get_strike_array() """
+        return self._puts[column]
 
     def get_call_option(self,strike):
-        return self._call_options.get(strike)
+        return self._get_option(strike,self._call_options,self._call_data,CallOption)
 
     def get_put_option(self,strike):
-        return self._put_options.get(strike)
+        return self._get_option(strike,self._put_options,self._put_data,PutOption)
+
+    def _get_option(self,strike,options,option_data,option_class):
+        option = options.get(strike)
+        if option is None:
+            index = self._strike_index.get(strike)
+            if index is None or option_data[index] is None:
+                return None
+            option = option_class(option_data[index])
+            options[strike] = option
+        return option
 
     def get_put_call_ratio(self):
         if float(self._call_open_interest) == 0:
@@ -650,39 +1223,34 @@ class OptionChain():
         return float(self._put_open_interest) / float(self._call_open_interest)
 
     def _calculate_max_pain(self):
-        min_dollars = 0
-        max_pain_strike = None
-        for working_strike in self.get_strike_prices():
-            put_dollars = 0
-            call_dollars = 0
-            for strike in self.get_strike_prices():
-                price_delta = working_strike - strike
-
-                if price_delta > 0:
-                    # Calls are in the money
-                    call_oi = 0
-                    try:
-                        call_oi = self.get_call_option(strike).get_open_interest()
-                    except:
-                        pass
-                    call_dollars += (price_delta * call_oi * 100)
-                elif price_delta < 0:
-                    # Puts are in the money
-                    put_oi = 0
-                    try:
-                        put_oi = self.get_put_option(strike).get_open_interest()
-                    except:
-                        pass
-                    put_dollars += (price_delta * put_oi * -100)
-            total_strike_dollars = call_dollars + put_dollars
-
-            if max_pain_strike is None or (total_strike_dollars < min_dollars):
-                min_dollars = total_strike_dollars
-                max_pain_strike = working_strike
-
-        self._max_pain = max_pain_strike
+        """ Find the strike where the option holders' payout is smallest. Using
+            prefix sums of open interest (and strike * open interest) the payout
+            at every strike is computed in a single pass over the chain. As in the
+            original calculation, a strike listed more than once uses the open
+            interest of the last option listed there """
+        if len(self._strikes) == 0:
+            return None
+
+        strikes = self._strikes
+        call_oi = np.nan_to_num(self._calls[OPTION_OPEN_INTEREST])
+        put_oi = np.nan_to_num(self._puts[OPTION_OPEN_INTEREST])
+
+        # Calls at strikes below the working strike are in the money
+        call_oi_below = np.concatenate(([0.0], np.cumsum(call_oi)[:-1]))
+        call_value_below = np.concatenate(([0.0], np.cumsum(call_oi * strikes)[:-1]))
+        call_dollars = 100 * (strikes * call_oi_below - call_value_below)
+
+        # Puts at strikes above the working strike are in the money
+        put_oi_above = np.concatenate((np.cumsum(put_oi[::-1])[::-1][1:], [0.0]))
+        put_value_above = np.concatenate((np.cumsum((put_oi * strikes)[::-1])[::-1][1:], [0.0]))
+        put_dollars = 100 * (put_value_above - strikes * put_oi_above)
+
+        return float(strikes[np.argmin(call_dollars + put_dollars)])
 
     def get_max_pain(self):
+        if not self._max_pain_calculated:
+            self._max_pain = self._calculate_max_pain()
+            self._max_pain_calculated = True
         return self._max_pain
 
 class OptionChainOption():
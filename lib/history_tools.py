@@ -0,0 +1,424 @@
+import datetime
+import glob
+import numpy as np
+import os
+import pandas as pd
+import threading
+import time
+import yfinance as yf
+
+from os.path import expanduser
+from stock_chart_tools.utils import get_historical_data, get_historical_data_range, EMA, SMA, OBV, SSO, MACD
+from stock_chart_tools.utils import COLUMN_CLOSE, COLUMN_VOLUME, COLUMN_HIGH, COLUMN_LOW, MACD_DIVERGENCE, MACD_LABEL, OBV_LABEL, SS_K, SS_D
+from stock_chart_tools.utils import DEFAULT_OBV_DAYS, DEFAULT_MACD_LONG_PERIOD, DEFAULT_MACD_SHORT_PERIOD, DEFAULT_MACD_SIGNAL
+from stock_chart_tools.utils import DEFAULT_SS_PERIOD, DEFAULT_SS_K, DEFAULT_SS_D
+
+# Two hours
+CACHE_FRESHNESS_SECONDS=60*60 * 4
+
+# Price history spans (calendar days)
+ONE_YEAR_DAYS=365
+TWO_YEAR_DAYS=1000
+
+# A span inferred from the first cached bar can be short by a weekend or holiday
+HISTORY_SPAN_SLACK=5
+
+HISTORY_GROUP_SIZE=100
+HISTORY_COLUMNS=["Open","High","Low","Close","Adj Close","Volume"]
+HISTORY_INDEX="Date"
+HISTORY_SPAN="span"
+HISTORY_CACHE_SUFFIX=".history.npy"
+LEGACY_HISTORY_CACHE_SUFFIX=".year.cache"
+
+# Columns
+THREE_DAY_EMA="3dayEMA"
+FIVE_DAY_EMA="5dayEMA"
+NINE_DAY_EMA="9dayEMA"
+TWENTY_DAY_EMA="20dayEMA"
+HUNDRED_DAY_EMA="100dayEMA"
+VOL_THREE_DAY="Vol3DayEMA"
+VOL_TWENTY_DAY="Vol20DayEMA"
+FIFTY_DAY_SMA="50daySMA"
+TWO_HUNDRED_DAY_SMA="200daySMA"
+OBV_THREE_DAY_EMA="OBV3dayEMA"
+OBV_NINE_DAY_EMA="OBV9dayEMA"
+MACD_THREE_DAY_EMA="MACD3dayEMA"
+MACD_FIVE_DAY_EMA="MACD5dayEMA"
+SS_K_THREE_DAY_EMA="%K3dayEMA"
+SS_K_FIVE_DAY_EMA="%K5dayEMA"
+
+# Indicator kinds
+INDICATOR_EMA="ema"
+INDICATOR_SMA="sma"
+INDICATOR_OBV="obv"
+INDICATOR_MACD="macd"
+INDICATOR_MACD_DIVERGENCE="macd_divergence"
+INDICATOR_SLOW_K="slow_k"
+INDICATOR_SLOW_D="slow_d"
+
+# kind -> function(source series..., parameters...) returning the indicator series
+INDICATOR_FUNCTIONS={
+    INDICATOR_EMA: EMA,
+    INDICATOR_SMA: SMA,
+    INDICATOR_OBV: lambda close, volume, days: OBV(close,volume,days)[OBV_LABEL],
+    INDICATOR_MACD: lambda close, long, short, signal: MACD(close,long,short,signal)[MACD_LABEL],
+    INDICATOR_MACD_DIVERGENCE: lambda close, long, short, signal: MACD(close,long,short,signal)[MACD_DIVERGENCE],
+    INDICATOR_SLOW_K: lambda close, high, low, period, k, d: SSO(close,high,low,period,k,d)[SS_K],
+    INDICATOR_SLOW_D: lambda close, high, low, period, k, d: SSO(close,high,low,period,k,d)[SS_D],
+}
+
+# Indicators that can be cached with the history: column -> (kind, source columns, parameters)
+INDICATORS={
+    THREE_DAY_EMA: (INDICATOR_EMA,[COLUMN_CLOSE],[3]),
+    FIVE_DAY_EMA: (INDICATOR_EMA,[COLUMN_CLOSE],[5]),
+    NINE_DAY_EMA: (INDICATOR_EMA,[COLUMN_CLOSE],[9]),
+    TWENTY_DAY_EMA: (INDICATOR_EMA,[COLUMN_CLOSE],[20]),
+    HUNDRED_DAY_EMA: (INDICATOR_EMA,[COLUMN_CLOSE],[100]),
+    VOL_THREE_DAY: (INDICATOR_EMA,[COLUMN_VOLUME],[3]),
+    VOL_TWENTY_DAY: (INDICATOR_EMA,[COLUMN_VOLUME],[20]),
+    FIFTY_DAY_SMA: (INDICATOR_SMA,[COLUMN_CLOSE],[50]),
+    TWO_HUNDRED_DAY_SMA: (INDICATOR_SMA,[COLUMN_CLOSE],[200]),
+    OBV_LABEL: (INDICATOR_OBV,[COLUMN_CLOSE,COLUMN_VOLUME],[DEFAULT_OBV_DAYS]),
+    OBV_THREE_DAY_EMA: (INDICATOR_EMA,[OBV_LABEL],[3]),
+    OBV_NINE_DAY_EMA: (INDICATOR_EMA,[OBV_LABEL],[9]),
+    MACD_LABEL: (INDICATOR_MACD,[COLUMN_CLOSE],[DEFAULT_MACD_LONG_PERIOD,DEFAULT_MACD_SHORT_PERIOD,DEFAULT_MACD_SIGNAL]),
+    MACD_DIVERGENCE: (INDICATOR_MACD_DIVERGENCE,[COLUMN_CLOSE],[DEFAULT_MACD_LONG_PERIOD,DEFAULT_MACD_SHORT_PERIOD,DEFAULT_MACD_SIGNAL]),
+    MACD_THREE_DAY_EMA: (INDICATOR_EMA,[MACD_LABEL],[3]),
+    MACD_FIVE_DAY_EMA: (INDICATOR_EMA,[MACD_LABEL],[5]),
+    SS_K: (INDICATOR_SLOW_K,[COLUMN_CLOSE,COLUMN_HIGH,COLUMN_LOW],[DEFAULT_SS_PERIOD,DEFAULT_SS_K,DEFAULT_SS_D]),
+    SS_D: (INDICATOR_SLOW_D,[COLUMN_CLOSE,COLUMN_HIGH,COLUMN_LOW],[DEFAULT_SS_PERIOD,DEFAULT_SS_K,DEFAULT_SS_D]),
+    SS_K_THREE_DAY_EMA: (INDICATOR_EMA,[SS_K],[3]),
+    SS_K_FIVE_DAY_EMA: (INDICATOR_EMA,[SS_K],[5]),
+}
+
+# Indicators computed whenever the history is fetched
+PRICE_INDICATORS=[THREE_DAY_EMA,FIVE_DAY_EMA,NINE_DAY_EMA,TWENTY_DAY_EMA,HUNDRED_DAY_EMA,VOL_THREE_DAY,VOL_TWENTY_DAY]
+
+def get_two_year_data(symbol,cache_dir):
+    return get_price_history(symbol,cache_dir,TWO_YEAR_DAYS)
+
+def get_one_year_data(symbol,cache_dir):
+    return get_price_history(symbol,cache_dir,ONE_YEAR_DAYS)
+
+def get_price_history(symbol,cache_dir,days,indicators=None):
+    """ Returns the last <days> calendar days of a symbol's history with the PRICE_INDICATORS
+        columns, plus any other INDICATORS columns asked for.
+
+        Each symbol has one cache file holding the longest span fetched so far. Shorter
+        requests are sliced from it, a stale cache is brought up to date with just the
+        missing bars, and the full history is only fetched when the span isn't covered.
+        Indicators are computed once per refresh and saved with the history """
+    (price_data,span,fresh) = read_history_cache(symbol,cache_dir)
+    if price_data is not None and span >= days:
+        if not fresh:
+            # Bring a stale cache up to date with just the missing bars
+            price_data = update_history_cache(symbol,cache_dir,price_data,span)
+    else:
+        price_data = None
+
+    if price_data is None:
+        # Nothing usable in the cache, fetch (at least) the span that was cached before
+        span = max(days,span)
+        price_data = add_price_indicators(get_historical_data(symbol,span))
+        cache_historical_data(symbol,cache_dir,price_data,span)
+
+    if indicators:
+        cache_indicators(symbol,cache_dir,price_data,span,indicators)
+    return slice_history(price_data,days)
+
+def get_history_matrix(symbols,cache_dir,days,columns,indicators=None):
+    """ Returns ({column: DataFrame with a row per bar and a column per symbol}, symbols that failed)
+        for the last <days> calendar days of the symbols' histories. The rows are lined up on each
+        symbol's own bars counting back from its last one, so iloc[-1] is every symbol's latest bar
+        whatever date it traded on, and a shorter history is padded with NaN at the top. The
+        HISTORY_INDEX entry holds the date of each bar """
+    histories = dict()
+    failed = list()
+    for symbol in sorted(set(symbols)):
+        try:
+            histories[symbol] = get_price_history(symbol,cache_dir,days,indicators)
+        except Exception as e:
+            print(f"error with {symbol}: {e}")
+            failed.append(symbol)
+
+    length = max([len(price_data) for price_data in histories.values()] + [0])
+    rows = pd.RangeIndex(-length,0)
+    matrices = dict()
+    for column in list(columns) + [HISTORY_INDEX]:
+        if column == HISTORY_INDEX:
+            matrix = np.full((length,len(histories)),np.datetime64("NaT"),dtype="datetime64[ns]")
+        else:
+            matrix = np.full((length,len(histories)),np.nan)
+        for (index,price_data) in enumerate(histories.values()):
+            if len(price_data) == 0:
+                continue
+            if column == HISTORY_INDEX:
+                matrix[-len(price_data):,index] = price_data.index.to_numpy(dtype="datetime64[ns]")
+            else:
+                matrix[-len(price_data):,index] = price_data[column].to_numpy(dtype=float)
+        matrices[column] = pd.DataFrame(matrix,index=rows,columns=list(histories.keys()))
+    return (matrices,failed)
+
+def slice_history(price_data,days):
+    start_date = datetime.datetime.now() - datetime.timedelta(days=days)
+    return price_data[price_data.index >= start_date]
+
+def get_cache_filename(symbol,cache_dir):
+    return os.path.join(expanduser(cache_dir),f"{symbol}{HISTORY_CACHE_SUFFIX}")
+
+def get_legacy_cache_filename(symbol,cache_dir):
+    return os.path.join(expanduser(cache_dir),f"{symbol}{LEGACY_HISTORY_CACHE_SUFFIX}")
+
+def cache_historical_data(symbol,cache_dir,price_data,span):
+    write_history_file(get_cache_filename(symbol,cache_dir),price_data,span)
+
+def read_history_cache(symbol,cache_dir):
+    """ Returns (price_data, span, fresh) for a symbol's cache, or (None, 0, False) if there isn't a readable one """
+    filename = get_history_file(symbol,cache_dir)
+    try:
+        fresh = (time.time() - os.path.getmtime(filename)) < CACHE_FRESHNESS_SECONDS
+        (price_data,span) = read_history_file(filename)
+    except Exception:
+        return (None,0,False)
+
+    if len(price_data) < 2 or any([column not in price_data.columns for column in PRICE_INDICATORS]):
+        return (None,0,False)
+    return (price_data,span,fresh)
+
+def write_history_file(filename,price_data,span):
+    """ Save a price history as a single numpy record whose fields are the (typed) columns,
+        so each column is stored contiguously """
+    price_data = price_data.reset_index()
+    price_data = price_data.rename(columns={price_data.columns[0]: HISTORY_INDEX})
+    dates = pd.to_datetime(price_data[HISTORY_INDEX])
+    if dates.dt.tz is not None:
+        # Keep the exchange's wall clock dates, a tz-aware column can't be saved as datetime64
+        dates = dates.dt.tz_localize(None)
+    price_data[HISTORY_INDEX] = dates.astype("datetime64[ns]")
+
+    length = len(price_data)
+    fields = [(str(column),price_data[column].to_numpy().dtype,(length,)) for column in price_data.columns]
+    record = np.empty((),dtype=fields + [(HISTORY_SPAN,np.int64)])
+    for column in price_data.columns:
+        record[str(column)] = price_data[column].to_numpy()
+    record[HISTORY_SPAN] = span
+
+    # Write to a temp file, then rename
+    temp_file = f"{filename}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_file,"wb") as f:
+        np.save(f,record,allow_pickle=False)
+    os.replace(temp_file,filename)
+
+def read_history_file(filename):
+    """ Returns (price_data, span) """
+    # One read of the file, the DataFrame is built from views of the loaded record
+    record = np.load(filename,allow_pickle=False)
+    columns = [name for name in record.dtype.names if name not in (HISTORY_INDEX,HISTORY_SPAN)]
+    price_data = pd.DataFrame(dict([(column,record[column]) for column in columns]),
+        index=pd.DatetimeIndex(record[HISTORY_INDEX],name=HISTORY_INDEX))
+
+    if HISTORY_SPAN in record.dtype.names:
+        span = int(record[HISTORY_SPAN])
+    else:
+        span = infer_span(price_data,os.path.getmtime(filename))
+    return (price_data,span)
+
+def infer_span(price_data,file_mtime):
+    """ The span a history was fetched with, for caches written without one """
+    if len(price_data) == 0:
+        return 0
+    return (datetime.datetime.fromtimestamp(file_mtime) - price_data.index[0].to_pydatetime()).days + HISTORY_SPAN_SLACK
+
+def get_history_file(symbol,cache_dir):
+    """ Returns the history cache file for a symbol, converting a csv cache from older versions if there is one """
+    filename = get_cache_filename(symbol,cache_dir)
+    if not os.path.exists(filename):
+        migrate_legacy_cache(symbol,cache_dir)
+    return filename
+
+def migrate_legacy_cache(symbol,cache_dir):
+    """ Convert a symbol's csv history cache, keeping its modification time (and so its freshness) """
+    legacy_file = get_legacy_cache_filename(symbol,cache_dir)
+    try:
+        file_mtime = os.path.getmtime(legacy_file)
+        price_data = pd.read_csv(legacy_file,index_col=0)
+        price_data.index = pd.to_datetime(price_data.index)
+    except Exception:
+        return False
+
+    filename = get_cache_filename(symbol,cache_dir)
+    write_history_file(filename,price_data,infer_span(price_data,file_mtime))
+    os.utime(filename,(file_mtime,file_mtime))
+    os.remove(legacy_file)
+    return True
+
+def migrate_history_cache(cache_dir):
+    """ Convert every csv history cache in a directory, returns the number converted """
+    count = 0
+    for legacy_file in glob.glob(os.path.join(expanduser(cache_dir),f"*{LEGACY_HISTORY_CACHE_SUFFIX}")):
+        symbol = os.path.basename(legacy_file)[:-len(LEGACY_HISTORY_CACHE_SUFFIX)]
+        if not os.path.exists(get_cache_filename(symbol,cache_dir)) and migrate_legacy_cache(symbol,cache_dir):
+            count += 1
+    return count
+
+def add_price_indicators(price_data):
+    """ Add the cached EMA columns to a price history """
+    return add_indicators(price_data,PRICE_INDICATORS)
+
+def add_indicators(price_data,columns):
+    """ Add the INDICATORS columns that are missing (and the indicators they are computed from) """
+    for column in columns:
+        if column in price_data.columns:
+            continue
+        (kind,sources,parameters) = INDICATORS.get(column)
+        add_indicators(price_data,[source for source in sources if source in INDICATORS])
+        price_data[column] = INDICATOR_FUNCTIONS.get(kind)(*[price_data[source] for source in sources],*parameters)
+    return price_data
+
+def cache_indicators(symbol,cache_dir,price_data,span,columns):
+    """ Compute the missing indicators and save them with the cached history, keeping the cache's freshness """
+    missing = [column for column in columns if column not in price_data.columns]
+    if len(missing) == 0:
+        return price_data
+
+    add_indicators(price_data,missing)
+    filename = get_cache_filename(symbol,cache_dir)
+    try:
+        file_mtime = os.path.getmtime(filename)
+        cache_historical_data(symbol,cache_dir,price_data,span)
+        os.utime(filename,(file_mtime,file_mtime))
+    except OSError as e:
+        print(f"could not cache indicators for {symbol}: {e}")
+    return price_data
+
+def extend_ema(previous,values,span):
+    """ Continue an EMA (same weights as EMA(), i.e. adjust=False) from its last value over new values """
+    alpha = 2.0 / (span + 1)
+    ema = np.empty(len(values))
+    for index in range(len(values)):
+        if not np.isnan(values[index]):
+            previous = alpha * values[index] + (1 - alpha) * previous
+        ema[index] = previous
+    return ema
+
+def get_append_start(price_data):
+    """ Returns the date to fetch new bars from, the last complete cached bar (the last one may have been partial) """
+    return price_data.index[-2].to_pydatetime()
+
+def append_historical_data(cached,new_data,span):
+    """ Returns the cached history extended with new bars (which start inside the cached history), carrying the
+        EMAs of the price columns forward and trimmed to span days. Other indicators are dropped to be recomputed
+        on demand. Returns None if the bars don't line up, e.g. the history was re-adjusted for a split or dividend """
+    new_data = new_data[[column for column in HISTORY_COLUMNS if column in new_data.columns]].dropna(how="all")
+    if len(new_data) == 0 or len(cached) == 0:
+        return None
+
+    # The first fetched bar is complete and already cached, it must not have changed
+    first = new_data.index[0]
+    if first not in cached.index:
+        return None
+    for column in ("Close",COLUMN_CLOSE):
+        if not np.isclose(cached.at[first,column],new_data.at[first,column],rtol=1e-6):
+            return None
+
+    base = cached[cached.index < first]
+    if len(base) == 0:
+        return None
+
+    new_rows = new_data.copy()
+    for column in base.columns:
+        (kind,sources,parameters) = INDICATORS.get(column,(None,None,None))
+        if kind == INDICATOR_EMA and sources[0] in new_data.columns:
+            new_rows[column] = extend_ema(base[column].iloc[-1],new_rows[sources[0]].to_numpy(dtype=float),parameters[0])
+
+    columns = [column for column in base.columns if column in new_rows.columns]
+    price_data = slice_history(pd.concat([base[columns],new_rows[columns]]),span)
+    price_data.index.name = HISTORY_INDEX
+    return price_data
+
+def update_history_cache(symbol,cache_dir,cached,span):
+    """ Fetch only the bars missing from a stale cache and append them. Returns None if the cache can't be extended """
+    try:
+        new_data = get_historical_data_range(symbol,get_append_start(cached),datetime.datetime.now())
+    except Exception as e:
+        print(f"could not update history for {symbol}: {e}")
+        return None
+
+    price_data = append_historical_data(cached,new_data,span)
+    if price_data is not None:
+        cache_historical_data(symbol,cache_dir,price_data,span)
+    return price_data
+
+def split_historical_data(data,symbol):
+    """ Returns one symbol's history from a multi-ticker download, or None if it has no data """
+    if isinstance(data.columns,pd.MultiIndex):
+        if symbol not in data.columns.get_level_values(0):
+            return None
+        data = data[symbol]
+
+    data = data[[column for column in HISTORY_COLUMNS if column in data.columns]].dropna(how="all")
+    if len(data) == 0:
+        return None
+    data.index.name = HISTORY_INDEX
+    return data.copy()
+
+def download_historical_data(symbols,start_date,end_date):
+    """ One multi-ticker history request, returns None if it failed """
+    try:
+        return yf.download(symbols,start=start_date,end=end_date,group_by="ticker",auto_adjust=False,actions=False,threads=True,progress=False)
+    except Exception as e:
+        print(f"could not download history for {len(symbols)} symbols: {e}")
+        return None
+
+def prefetch_historical_data(symbols,cache_dir,days=TWO_YEAR_DAYS,group_size=HISTORY_GROUP_SIZE):
+    """ Download the history of every symbol whose cache is stale or too short in grouped
+        multi-ticker requests and cache it. Returns (fetched symbols, symbols with no data) """
+    end_date = datetime.datetime.now()
+    start_date = end_date - datetime.timedelta(days=days)
+
+    # Symbols with a long enough (but stale) cache only need the bars since their last cached day
+    cached = dict()
+    cold = list()
+    for symbol in sorted(set(symbols)):
+        (price_data,span,fresh) = read_history_cache(symbol,cache_dir)
+        if price_data is None or span < days:
+            cold.append(symbol)
+        elif not fresh:
+            cached[symbol] = (price_data,span)
+    warm = sorted(cached.keys(),key=lambda symbol: get_append_start(cached.get(symbol)[0]))
+
+    fetched = list()
+    missing = list()
+    for index in range(0,len(warm),group_size):
+        group = warm[index:index + group_size]
+        data = download_historical_data(group,min([get_append_start(cached.get(symbol)[0]) for symbol in group]),end_date)
+        for symbol in group:
+            (price_data,span) = cached.get(symbol)
+            updated = None
+            if data is not None:
+                new_data = split_historical_data(data,symbol)
+                if new_data is not None:
+                    updated = append_historical_data(price_data,new_data,span)
+            if updated is None:
+                # Re-adjusted or missing, fetch the full history
+                cold.append(symbol)
+                continue
+            cache_historical_data(symbol,cache_dir,updated,span)
+            fetched.append(symbol)
+
+    for index in range(0,len(cold),group_size):
+        group = cold[index:index + group_size]
+        data = download_historical_data(group,start_date,end_date)
+        if data is None:
+            missing.extend(group)
+            continue
+
+        for symbol in group:
+            price_data = split_historical_data(data,symbol)
+            if price_data is None:
+                missing.append(symbol)
+                continue
+            cache_historical_data(symbol,cache_dir,add_price_indicators(price_data),days)
+            fetched.append(symbol)
+
+    return (fetched,missing)
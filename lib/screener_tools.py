@@ -2,10 +2,21 @@ import glob
 import json
 import os
 import pandas as pd
+import sqlite3
 import sys
+import threading
 import time
 
+try:
+    import fcntl
+except ImportError:
+    # No advisory locks on Windows, answer files are only merged there
+    fcntl = None
+
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from etrade_tools import *
+from history_tools import *
 from os.path import expanduser
 from pandas_datareader import data as pdr
 from stock_chart_tools.utils import get_historical_data, EMA, OBV, SSO, MACD
@@ -17,6 +28,7 @@ ETRADE_CONFIG="etrade_config"
 QUESTIONS_DIR="questions_directory"
 SYMBOLS_DIR="symbols_directory"
 SECTOR_QUESTION_ID="sector_question_id"
+ANSWER_DB="answer_db"
 
 # Defaults
 DEFAULT_CACHE_DIR=".answers"
@@ -48,8 +60,27 @@ CACHE_VALUE="value"
 CACHE_EXPIRATION_TIMESTAMP="expiration_timestamp"
 CACHE_QUESTION="question"
 
-# Two hours
-CACHE_FRESHNESS_SECONDS=60*60 * 4
+# Answer stores loaded in this process, keyed by answer file (or database and symbol)
+_ANSWER_STORES = dict()
+_ANSWER_STORES_LOCK = threading.Lock()
+
+# Open answer databases, keyed by database file
+_ANSWER_DATABASES = dict()
+
+# Answer database schema, values are stored json encoded
+ANSWER_DB_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS answers (
+        symbol TEXT NOT NULL,
+        question_uuid TEXT NOT NULL,
+        value TEXT,
+        expiration_timestamp NUMERIC,
+        question_text TEXT,
+        PRIMARY KEY (symbol, question_uuid)
+    )""",
+    "CREATE INDEX IF NOT EXISTS answers_symbol ON answers (symbol)",
+    "CREATE INDEX IF NOT EXISTS answers_expiration ON answers (expiration_timestamp)",
+    "CREATE INDEX IF NOT EXISTS answers_question ON answers (question_uuid, value, expiration_timestamp)",
+]
 
 # Quetion types
 TYPE_BOOLEAN="boolean"
@@ -60,32 +91,353 @@ TYPE_VOLUME="volume_filter"
 TYPE_OPEN_INTEREST="open_interest_filter"
 TYPE_BETA="beta_filter"
 
-# Columns
-THREE_DAY_EMA="3dayEMA"
-FIVE_DAY_EMA="5dayEMA"
-NINE_DAY_EMA="9dayEMA"
-TWENTY_DAY_EMA="20dayEMA"
-HUNDRED_DAY_EMA="100dayEMA"
-VOL_THREE_DAY="Vol3DayEMA"
-VOL_TWENTY_DAY="Vol20DayEMA"
+# Estimated cost of answering a question, by type (quote lookups < option chain fetches < prompts)
+QUESTION_COSTS={
+    TYPE_PRICE: 1,
+    TYPE_VOLUME: 1,
+    TYPE_BETA: 1,
+    TYPE_EARNINGS: 1,
+    TYPE_OPEN_INTEREST: 10,
+    TYPE_BOOLEAN: 100,
+    TYPE_SECTOR: 100,
+}
+CACHED_QUESTION_COST=0
+DEFAULT_QUESTION_COST=100
+
+class AnswerStore():
+    """ A symbol's cached answers, read from its answer file once and served
+        from memory. Changes are tracked and written back by flush() """
+    def __init__(self,cache_dir,symbol):
+        self._symbol = symbol
+        self._answer_file = get_answer_file(cache_dir,symbol)
+        self._answers = get_all_answers_from_cache(self._answer_file)
+        self._dirty = set()
+        self._lock = threading.RLock()
+
+    def get_symbol(self):
+        return self._symbol
+
+    def get_answer_file(self):
+        return self._answer_file
+
+    def exists(self):
+        return len(self._answers) > 0
+
+    def get_answers(self):
+        return self._answers
+
+    def get(self,question_id,default=None):
+        return self._answers.get(question_id,default)
+
+    def get_answer(self,question):
+        """ Returns (value, expiration_timestamp) for a question, or (None,0) if there is no fresh answer """
+        answer = self._answers.get(question.get(QUESTION_ID),None)
+        if isinstance(answer,dict):
+            expiration_timestamp = answer.get(CACHE_EXPIRATION_TIMESTAMP,None)
+            if get_current_timestamp() < answer.get(CACHE_EXPIRATION_TIMESTAMP,0):
+                return (answer.get(CACHE_VALUE,None),expiration_timestamp)
+
+        # Didn't find a fresh answer
+        return (None,0)
+
+    def set_answer(self,question_id,value,expiration_timestamp,question_text=None):
+        with self._lock:
+            answer = self._answers.setdefault(question_id,dict())
+            if question_text is not None or CACHE_QUESTION not in answer:
+                answer[CACHE_QUESTION] = question_text
+            answer[CACHE_VALUE] = value
+            answer[CACHE_EXPIRATION_TIMESTAMP] = expiration_timestamp
+            self._dirty.add(question_id)
+
+    def clear(self):
+        with self._lock:
+            self._dirty.update(self._answers.keys())
+            self._answers = dict()
+
+    def is_dirty(self):
+        return len(self._dirty) > 0
+
+    def flush(self):
+        """ Write the answers back if anything changed """
+        with self._lock:
+            if not self.is_dirty():
+                return
+            self._write()
+            self._dirty = set()
+
+    def _write(self):
+        # Another process may have written the file since it was read, so merge
+        # the changed questions into what is on disk under a file lock
+        with answer_file_lock(self._answer_file):
+            answers = get_all_answers_from_cache(self._answer_file)
+            for question_id in self._dirty:
+                if question_id in self._answers:
+                    answers[question_id] = self._answers[question_id]
+                else:
+                    answers.pop(question_id,None)
+            answers[CACHE_SYMBOL] = self._symbol
+
+            # Write to a temp file, then rename
+            write_json_file_atomic(self._answer_file,answers)
+            self._answers = answers
+
+class SqliteAnswerStore(AnswerStore):
+    """ A symbol's answers, read from the answer database once and served from memory """
+    def __init__(self,answer_db,symbol):
+        self._symbol = symbol
+        self._answer_file = None
+        self._answer_db = answer_db
+        self._answers = answer_db.get_answers(symbol)
+        self._dirty = set()
+        self._lock = threading.RLock()
+
+    def _write(self):
+        changed = dict()
+        removed = list()
+        for question_id in self._dirty:
+            if question_id in self._answers:
+                changed[question_id] = self._answers.get(question_id)
+            else:
+                removed.append(question_id)
+        self._answer_db.save_answers(self._symbol,changed,removed)
+
+class QuestionPlanner():
+    """ Orders a symbol's questions by (estimated cost, blocker first, failure rate) so a failing
+        blocker is found as cheaply as possible, and keeps per question timings """
+    def __init__(self,questions,failure_rates=None):
+        self._questions = list()
+        for section in sorted(questions.keys()):
+            for question in questions[section].get(QUESTION_LIST):
+                self._questions.append((section,question))
+        self._failure_rates = failure_rates or dict()
+        self._timings = dict()
+
+    def get_questions(self):
+        return self._questions
+
+    def get_failure_rate(self,question):
+        return self._failure_rates.get(question.get(QUESTION_ID),0.0)
+
+    def get_cost(self,question,answers=None):
+        if answers is not None and answers.get_answer(question)[0] is not None:
+            return CACHED_QUESTION_COST
+        return QUESTION_COSTS.get(question.get(QUESTION_TYPE),DEFAULT_QUESTION_COST)
+
+    def get_plan(self,answers=None,question_types=None):
+        """ Returns the (section, question) pairs in the order to ask them, cached answers first """
+        plan = list()
+        for (index,(section,question)) in enumerate(self._questions):
+            if question_types is not None and question.get(QUESTION_TYPE) not in question_types:
+                continue
+            key = (self.get_cost(question,answers),not question.get(QUESTION_BLOCKER,False),-self.get_failure_rate(question),index)
+            plan.append((key,section,question))
+        return [(section,question) for (key,section,question) in sorted(plan,key=lambda entry: entry[0])]
+
+    def record(self,question,seconds,value):
+        """ Add an answered question's time and outcome to its timings """
+        (count,total_seconds,failures) = self._timings.get(question.get(QUESTION_ID),(0,0.0,0))
+        self._timings[question.get(QUESTION_ID)] = (count + 1,total_seconds + seconds,failures + (value is False))
+
+    def print_plan(self):
+        print("Question plan (cost, blocker, failure rate)")
+        for (section,question) in self.get_plan():
+            blocker = "blocker" if question.get(QUESTION_BLOCKER,False) else "       "
+            print(f"\t{self.get_cost(question):4d} {blocker} {100 * self.get_failure_rate(question):5.1f}%  [{section}] {question.get(QUESTION_TEXT)}")
+
+    def print_timings(self):
+        print("Question timings (asked, failed, total, average)")
+        for (section,question) in self.get_plan():
+            (count,total_seconds,failures) = self._timings.get(question.get(QUESTION_ID),(0,0.0,0))
+            if count == 0:
+                continue
+            print(f"\t{count:5d} {failures:5d} {total_seconds:8.2f}s {1000 * total_seconds / count:8.1f}ms  [{section}] {question.get(QUESTION_TEXT)}")
+
+class AnswerDatabase():
+    """ Cached answers for every symbol, kept in a single SQLite database """
+    def __init__(self,db_file):
+        self._db_file = expanduser(db_file)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self._db_file,check_same_thread=False)
+        with self._lock, self._connection:
+            for statement in ANSWER_DB_SCHEMA:
+                self._connection.execute(statement)
+
+    def get_db_file(self):
+        return self._db_file
+
+    def get_answers(self,symbol):
+        """ Returns a symbol's answers in the same layout as an answer file """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT question_uuid, value, expiration_timestamp, question_text FROM answers WHERE symbol = ?",
+                (symbol.upper(),)).fetchall()
+
+        answers = dict()
+        for (question_id, value, expiration_timestamp, question_text) in rows:
+            answers[question_id] = {
+                CACHE_QUESTION: question_text,
+                CACHE_VALUE: json.loads(value),
+                CACHE_EXPIRATION_TIMESTAMP: expiration_timestamp,
+            }
+        return answers
+
+    def save_answers(self,symbol,answers,removed=()):
+        """ Insert or replace a symbol's answers, and delete the removed question ids """
+        rows = list()
+        for question_id in answers:
+            answer = answers.get(question_id)
+            if not isinstance(answer,dict):
+                continue
+            rows.append((symbol.upper(),question_id,json.dumps(answer.get(CACHE_VALUE,None)),
+                answer.get(CACHE_EXPIRATION_TIMESTAMP,0),answer.get(CACHE_QUESTION,None)))
+
+        with self._lock, self._connection:
+            self._connection.executemany("INSERT OR REPLACE INTO answers VALUES (?,?,?,?,?)",rows)
+            self._connection.executemany("DELETE FROM answers WHERE symbol = ? AND question_uuid = ?",
+                [(symbol.upper(),question_id) for question_id in removed])
+
+    def get_symbols(self):
+        with self._lock:
+            rows = self._connection.execute("SELECT DISTINCT symbol FROM answers").fetchall()
+        return set([row[0] for row in rows])
+
+    def get_answer_counts(self,fresh_after=None):
+        """ Returns symbol -> (true answers, yes/no answers) for every symbol with at least one
+            yes/no answer, only counting answers that expire after fresh_after when it is given """
+        query = ("SELECT symbol, SUM(value = 'true'), COUNT(*) FROM answers "
+            "WHERE value IN ('true','false')")
+        parameters = list()
+        if fresh_after is not None:
+            query += " AND expiration_timestamp > ?"
+            parameters.append(fresh_after)
+        query += " GROUP BY symbol"
+
+        with self._lock:
+            rows = self._connection.execute(query,parameters).fetchall()
+        return dict([(symbol,(true_count,total_count)) for (symbol,true_count,total_count) in rows])
+
+    def get_scores(self,symbols=None,fresh_after=None):
+        """ Returns symbol -> score for every symbol with at least one yes/no answer """
+        counts = self.get_answer_counts(fresh_after)
+        if symbols is not None:
+            wanted = set([symbol.upper() for symbol in symbols])
+            counts = dict([(symbol,counts.get(symbol)) for symbol in counts if symbol in wanted])
+        return dict([(symbol,100 * float(true_count / total_count)) for (symbol,(true_count,total_count)) in counts.items()])
+
+    def get_failed_symbols(self,question_ids,now=None):
+        """ Returns the symbols with a fresh false answer to any of the questions """
+        if now is None:
+            now = get_current_timestamp()
+        question_ids = list(question_ids)
+        if len(question_ids) == 0:
+            return set()
+
+        query = ("SELECT DISTINCT symbol FROM answers WHERE value = 'false' AND expiration_timestamp > ? "
+            f"AND question_uuid IN ({','.join('?' * len(question_ids))})")
+        with self._lock:
+            rows = self._connection.execute(query,[now] + question_ids).fetchall()
+        return set([row[0] for row in rows])
+
+    def get_failure_counts(self,question_ids):
+        """ Returns question id -> (false answers, yes/no answers) across all symbols """
+        question_ids = list(question_ids)
+        if len(question_ids) == 0:
+            return dict()
+
+        query = ("SELECT question_uuid, SUM(value = 'false'), COUNT(*) FROM answers WHERE value IN ('true','false') "
+            f"AND question_uuid IN ({','.join('?' * len(question_ids))}) GROUP BY question_uuid")
+        with self._lock:
+            rows = self._connection.execute(query,question_ids).fetchall()
+        return dict([(question_id,(false_count,total_count)) for (question_id,false_count,total_count) in rows])
+
+def get_answer_database(db_file):
+    """ Returns the process-wide AnswerDatabase for a database file """
+    db_file = expanduser(db_file)
+    with _ANSWER_STORES_LOCK:
+        answer_db = _ANSWER_DATABASES.get(db_file,None)
+        if answer_db is None:
+            answer_db = AnswerDatabase(db_file)
+            _ANSWER_DATABASES[db_file] = answer_db
+    return answer_db
+
+def get_answer_store(screener_config,symbol):
+    """ Returns the process-wide AnswerStore for a symbol, backed by the answer
+        database when the screener config names one, else by the symbol's json file """
+    db_file = screener_config.get(ANSWER_DB,None)
+    if db_file:
+        answer_db = get_answer_database(db_file)
+        key = (answer_db.get_db_file(),symbol.upper())
+    else:
+        key = expanduser(get_answer_file(screener_config.get(CACHE_DIR),symbol))
+
+    with _ANSWER_STORES_LOCK:
+        store = _ANSWER_STORES.get(key,None)
+        if store is None:
+            if db_file:
+                store = SqliteAnswerStore(answer_db,symbol)
+            else:
+                store = AnswerStore(screener_config.get(CACHE_DIR),symbol)
+            _ANSWER_STORES[key] = store
+    return store
+
+def get_scores(screener_config,symbols):
+    """ Returns symbol -> score (symbols upper cased) for the symbols that have been scored """
+    db_file = screener_config.get(ANSWER_DB,None)
+    if db_file:
+        return get_answer_database(db_file).get_scores(symbols)
+
+    scores = dict()
+    for symbol in symbols:
+        (true_count,total_count) = count_answers(get_answer_store(screener_config,symbol).get_answers())
+        if total_count > 0:
+            scores[symbol.upper()] = 100 * float(true_count / total_count)
+    return scores
+
+def get_failed_symbols(screener_config,symbols,question_ids):
+    """ Returns the symbols with a fresh false answer to any of the (blocker) questions """
+    db_file = screener_config.get(ANSWER_DB,None)
+    if db_file:
+        return get_answer_database(db_file).get_failed_symbols(question_ids) & set([symbol.upper() for symbol in symbols])
+
+    failed = set()
+    for symbol in symbols:
+        store = get_answer_store(screener_config,symbol)
+        for question_id in question_ids:
+            if store.get_answer({QUESTION_ID: question_id})[0] is False:
+                failed.add(symbol.upper())
+                break
+    return failed
+
+def get_failure_rates(screener_config,symbols,question_ids):
+    """ Returns question id -> fraction of the yes/no answers that are false (fresh or not) """
+    db_file = screener_config.get(ANSWER_DB,None)
+    if db_file:
+        counts = get_answer_database(db_file).get_failure_counts(question_ids)
+    else:
+        counts = dict()
+        for symbol in symbols:
+            answers = get_answer_store(screener_config,symbol)
+            for question_id in question_ids:
+                value = answers.get(question_id,dict()).get(CACHE_VALUE,None)
+                if isinstance(value,bool):
+                    (false_count,total_count) = counts.get(question_id,(0,0))
+                    counts[question_id] = (false_count + (value is False),total_count + 1)
+
+    return dict([(question_id,float(false_count / total_count)) for (question_id,(false_count,total_count)) in counts.items() if total_count > 0])
 
 def get_sector_from_cache(screener_config,symbol):
-    answer_file = get_answer_file(screener_config.get(CACHE_DIR),symbol)
-    if not os.path.exists(expanduser(answer_file)):
-        return None
-
     sector_question_id = screener_config.get(SECTOR_QUESTION_ID,None)
     if sector_question_id is None:
         return None
 
-    answers = get_all_answers_from_cache(answer_file)
+    answers = get_answer_store(screener_config,symbol)
     answer = answers.get(sector_question_id,None)
     if answer:
         return answer.get(CACHE_VALUE,None)
     return None
 
 def cache_answers(answer_file,answers):
-    write_json_file(answer_file,answers)
+    write_json_file_atomic(answer_file,answers)
 
 def get_answer_file(cache_dir,symbol):
     return f"{cache_dir}/{symbol.upper()}.json"
@@ -126,6 +478,27 @@ def write_json_file(filename,data):
     with open(expanduser(filename), "w") as f:
         f.write(json.dumps(data,indent=2))
 
+@contextmanager
+def answer_file_lock(answer_file):
+    """ Hold an exclusive lock on an answer file across processes. The file itself
+        is replaced on every write, so a separate .lock file is locked """
+    if fcntl is None:
+        yield
+        return
+    with open(f"{expanduser(answer_file)}.lock","a") as lock_file:
+        fcntl.flock(lock_file,fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file,fcntl.LOCK_UN)
+
+def write_json_file_atomic(filename,data):
+    """ Write a json file so readers never see a partial file """
+    filename = expanduser(filename)
+    temp_file = f"{filename}.{os.getpid()}.{threading.get_ident()}.tmp"
+    write_json_file(temp_file,data)
+    os.replace(temp_file,filename)
+
 def get_questions(questions_dir):
     questions = dict()
     for file in glob.glob(f"{questions_dir}/*.json"):
@@ -137,6 +510,14 @@ def get_questions(questions_dir):
             print(f"Could not read {file}: {e}")
     return questions
 
+def get_blocker_ids(questions):
+    blocker_ids = list()
+    for section in sorted(questions.keys()):
+        for question in questions[section].get(QUESTION_LIST):
+            if question.get(QUESTION_BLOCKER,False):
+                blocker_ids.append(question.get(QUESTION_ID))
+    return blocker_ids
+
 def get_symbols(symbols_dir):
     symbols = set()
     for file in glob.glob(f"{expanduser(symbols_dir)}/*"):
@@ -150,12 +531,15 @@ def get_current_timestamp():
     return int(datetime.datetime.now().timestamp())
 
 def get_score(screener_config,symbol):
-    answer_file = get_answer_file(screener_config.get(CACHE_DIR),symbol)
-    if not os.path.exists(expanduser(answer_file)):
+    store = get_answer_store(screener_config,symbol)
+    if not store.exists():
         print(f"no data found for {symbol}")
 
-    answers = get_all_answers_from_cache(answer_file)
+    (true_count,total_count) = count_answers(store.get_answers())
+    return 100 * float(true_count / total_count)
 
+def count_answers(answers,fresh_after=None):
+    """ Returns (true answers, yes/no answers) for a symbol's answers """
     total_count = 0
     true_count = 0
     for key in answers:
@@ -163,99 +547,89 @@ def get_score(screener_config,symbol):
         if isinstance(answer,dict):
             value = answer.get(CACHE_VALUE)
             if isinstance(value,bool):
+                if fresh_after is not None and answer.get(CACHE_EXPIRATION_TIMESTAMP,0) <= fresh_after:
+                    continue
                 total_count += 1
                 if value:
                     true_count += 1
-                
-    return 100 * float(true_count / total_count)
-
-def get_cache_filename(symbol,cache_dir):
-    return os.path.join(expanduser(cache_dir),f"{symbol}.year.cache")
-
-def get_cached_historical_data(symbol,cache_dir):
-    filename = get_cache_filename(symbol,cache_dir)
-    try:
-        file_mtime = os.path.getmtime(filename)
-        if (time.time() - file_mtime) < CACHE_FRESHNESS_SECONDS:
-            data = pd.read_csv(filename,index_col=0)
-            return data
-        else:
-            print(f"{filename} cache is not fresh enough")
-    except Exception as e:
-        pass
-
-    return None
-
-def cache_historical_data(symbol,cache_dir,price_data):
-    filename = get_cache_filename(symbol,cache_dir)
-    price_data.to_csv(filename)
-
-def get_two_year_data(symbol,cache_dir):
-
-    # Try to get the price data from cache
-    price_data = get_cached_historical_data(symbol,cache_dir)
-    if price_data is not None:
-        return price_data
-
-    # Nothing fresh in the cache
-    price_data = get_historical_data(symbol, 1000)
-
-    price_data[THREE_DAY_EMA] = EMA(price_data[COLUMN_CLOSE],3)
-    price_data[FIVE_DAY_EMA] = EMA(price_data[COLUMN_CLOSE],5)
-    price_data[NINE_DAY_EMA] = EMA(price_data[COLUMN_CLOSE],9)
-    price_data[TWENTY_DAY_EMA] = EMA(price_data[COLUMN_CLOSE],20)
-    price_data[HUNDRED_DAY_EMA] = EMA(price_data[COLUMN_CLOSE],100)
-
-    price_data[VOL_THREE_DAY] = EMA(price_data[COLUMN_VOLUME],3)
-    price_data[VOL_TWENTY_DAY] = EMA(price_data[COLUMN_VOLUME],20)
-
-    cache_historical_data(symbol,cache_dir,price_data)
-
-    return price_data
-
-def get_cache_filename(symbol,cache_dir):
-    return os.path.join(expanduser(cache_dir),f"{symbol}.year.cache")
+    return (true_count,total_count)
+
+def is_blocked(answers,blocker_ids,now):
+    """ Returns True if any of the blocker questions has a fresh false answer """
+    for question_id in blocker_ids:
+        answer = answers.get(question_id,None)
+        if isinstance(answer,dict) and answer.get(CACHE_VALUE) is False:
+            if now < answer.get(CACHE_EXPIRATION_TIMESTAMP,0):
+                return True
+    return False
+
+def get_cached_symbols(screener_config):
+    """ Returns every symbol that has cached answers """
+    db_file = screener_config.get(ANSWER_DB,None)
+    if db_file:
+        return get_answer_database(db_file).get_symbols()
+
+    return get_answer_file_symbols(screener_config.get(CACHE_DIR))
+
+def get_answer_file_symbols(cache_dir):
+    """ Returns every symbol with an answer file in a cache directory """
+    # Answer files are named after the upper case symbol (see get_answer_file), the other
+    # json files that can share the cache directory (e.g. X.2025-01-17.chain.json) aren't
+    symbols = set()
+    for answer_file in glob.glob(f"{expanduser(cache_dir)}/*.json"):
+        symbol = os.path.basename(answer_file)[:-len(".json")]
+        if symbol == symbol.upper():
+            symbols.add(symbol)
+    return symbols
 
-def get_cached_historical_data(symbol,cache_dir):
-    filename = get_cache_filename(symbol,cache_dir)
-    try:
-        print(f"trying to get the cached data")
-        file_mtime = os.path.getmtime(filename)
-        if (time.time() - file_mtime) < CACHE_FRESHNESS_SECONDS:
-            data = pd.read_csv(filename,index_col=0)
-            print(f"found cached data for {symbol}")
-            return data
+def _rank_answer_file(answer_file,fresh_after,blocker_ids,now):
+    # Runs in a worker process, reads the answer file directly
+    answers = get_all_answers_from_cache(answer_file)
+    if not isinstance(answers,dict):
+        answers = dict()
+    (true_count,total_count) = count_answers(answers,fresh_after)
+    return (true_count,total_count,is_blocked(answers,blocker_ids,now))
+
+def get_score_table(screener_config,fresh_only=False,blocker_ids=None,processes=1):
+    """ Scores every cached symbol in one pass, returns a DataFrame sorted by score (best first)
+        with Symbol, Score, Passed, Answered and Blocked columns """
+    now = get_current_timestamp()
+    fresh_after = now if fresh_only else None
+    blocker_ids = list(blocker_ids or [])
+
+    rows = list()
+    db_file = screener_config.get(ANSWER_DB,None)
+    if db_file:
+        answer_db = get_answer_database(db_file)
+        counts = answer_db.get_answer_counts(fresh_after)
+        blocked = answer_db.get_failed_symbols(blocker_ids,now)
+        for symbol in counts:
+            (true_count,total_count) = counts.get(symbol)
+            rows.append((symbol,true_count,total_count,symbol in blocked))
+    else:
+        symbols = sorted(get_cached_symbols(screener_config))
+        answer_files = [expanduser(get_answer_file(screener_config.get(CACHE_DIR),symbol)) for symbol in symbols]
+        count = len(answer_files)
+        if processes > 1 and count > 1:
+            with ProcessPoolExecutor(max_workers=processes) as executor:
+                results = list(executor.map(_rank_answer_file,answer_files,[fresh_after]*count,[blocker_ids]*count,[now]*count,
+                    chunksize=max(1,count // (processes * 4))))
         else:
-            print(f"{filename} cache is not fresh enough")
-    except Exception as e:
-        print(f"could not get cached data for {symbol}: {e}")
-        pass
-
-    return None
-
-def cache_historical_data(symbol,cache_dir,price_data):
-    filename = get_cache_filename(symbol,cache_dir)
-    price_data.to_csv(filename)
-
-def get_one_year_data(symbol,cache_dir):
-
-    # Try to get the price data from cache
-    price_data = get_cached_historical_data(symbol,cache_dir)
-    if price_data is not None:
-        return price_data
-
-    # Nothing fresh in the cache
-    price_data = get_historical_data(symbol)
-
-    price_data[THREE_DAY_EMA] = EMA(price_data[COLUMN_CLOSE],3)
-    price_data[FIVE_DAY_EMA] = EMA(price_data[COLUMN_CLOSE],5)
-    price_data[NINE_DAY_EMA] = EMA(price_data[COLUMN_CLOSE],9)
-    price_data[TWENTY_DAY_EMA] = EMA(price_data[COLUMN_CLOSE],20)
-    price_data[HUNDRED_DAY_EMA] = EMA(price_data[COLUMN_CLOSE],100)
-
-    price_data[VOL_THREE_DAY] = EMA(price_data[COLUMN_VOLUME],3)
-    price_data[VOL_TWENTY_DAY] = EMA(price_data[COLUMN_VOLUME],20)
-
-    cache_historical_data(symbol,cache_dir,price_data)
-
-    return price_data
+            results = [_rank_answer_file(answer_file,fresh_after,blocker_ids,now) for answer_file in answer_files]
+
+        for (symbol,(true_count,total_count,blocked)) in zip(symbols,results):
+            if total_count > 0:
+                rows.append((symbol,true_count,total_count,blocked))
+
+    table = pd.DataFrame(rows,columns=["Symbol","Passed","Answered","Blocked"])
+    table["Score"] = 100.0 * table["Passed"] / table["Answered"]
+    table = table[["Symbol","Score","Passed","Answered","Blocked"]]
+    return table.sort_values(["Score","Symbol"],ascending=[False,True]).reset_index(drop=True)
+
+def read_score_table(score_file):
+    """ Reads a table written by rank_symbols.py and returns symbol -> score """
+    if score_file.endswith(".parquet"):
+        table = pd.read_parquet(expanduser(score_file))
+    else:
+        table = pd.read_csv(expanduser(score_file))
+    return dict(zip(table["Symbol"].str.upper(),table["Score"].astype(float)))
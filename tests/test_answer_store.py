@@ -0,0 +1,53 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lib"))
+
+# etrade_tools and screener_tools import each other, load them in the order the scripts do
+import etrade_tools
+from screener_tools import *
+
+def test_flush_keeps_answers_written_by_another_store(tmp_path):
+    cache_dir = str(tmp_path)
+    first = AnswerStore(cache_dir, "TEST")
+    second = AnswerStore(cache_dir, "TEST")
+
+    first.set_answer("q1", True, 100, "first question")
+    second.set_answer("q2", False, 200, "second question")
+    first.flush()
+    second.flush()
+
+    answers = get_all_answers_from_cache(get_answer_file(cache_dir, "TEST"))
+    assert answers.get("q1").get(CACHE_VALUE) is True
+    assert answers.get("q2").get(CACHE_VALUE) is False
+    assert answers.get(CACHE_SYMBOL) == "TEST"
+
+def test_flush_only_writes_changed_answers(tmp_path):
+    cache_dir = str(tmp_path)
+    store = AnswerStore(cache_dir, "TEST")
+    store.set_answer("q1", 1, 100)
+    store.flush()
+
+    stale = AnswerStore(cache_dir, "TEST")
+    store.set_answer("q1", 2, 100)
+    store.flush()
+
+    # The stale copy of q1 is not written back over the newer answer
+    stale.set_answer("q2", 3, 100)
+    stale.flush()
+
+    answers = get_all_answers_from_cache(get_answer_file(cache_dir, "TEST"))
+    assert answers.get("q1").get(CACHE_VALUE) == 2
+    assert answers.get("q2").get(CACHE_VALUE) == 3
+
+def test_clear_removes_answers_on_flush(tmp_path):
+    cache_dir = str(tmp_path)
+    store = AnswerStore(cache_dir, "TEST")
+    store.set_answer("q1", 1, 100)
+    store.flush()
+
+    store.clear()
+    store.flush()
+
+    answers = get_all_answers_from_cache(get_answer_file(cache_dir, "TEST"))
+    assert "q1" not in answers
@@ -0,0 +1,58 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lib"))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bin"))
+
+import pytest
+
+import bull_call_spread_screener
+from etrade_tools import *
+
+def call(strike, bid, ask, delta, open_interest=100):
+    option = {"strikePrice": strike, "bid": bid, "ask": ask, "OptionGreeks": {"delta": delta}}
+    if open_interest is not None:
+        option["openInterest"] = open_interest
+    return option
+
+def option_chain(option_pairs):
+    return OptionChain("TEST", {"OptionChainResponse": {"SelectedED": {"year": 2030, "month": 1, "day": 18}, "OptionPair": option_pairs}})
+
+def find_spreads(chain, price=100.0):
+    return bull_call_spread_screener.find_spread_pairs(
+        chain.get_strike_array(),
+        chain.get_call_array(OPTION_BID),
+        chain.get_call_array(OPTION_ASK),
+        chain.get_call_array(OPTION_OPEN_INTEREST),
+        chain.get_call_array(OPTION_DELTA),
+        price, 30, 10, 0.0, 0.0, 0.0, 0.0)
+
+@pytest.fixture(autouse=True)
+def quiet(monkeypatch):
+    monkeypatch.setattr(bull_call_spread_screener, "GLOBAL_DEBUG", False, raising=False)
+
+def test_complete_chain_finds_spreads():
+    chain = option_chain([{"Call": call(80, 21.0, 21.2, 0.9)}, {"Call": call(85, 17.0, 17.2, 0.8)}, {"Call": call(90, 13.0, 13.2, 0.7)}])
+    spreads = find_spreads(chain)
+    assert len(spreads) > 0
+
+@pytest.mark.parametrize("incomplete", [
+    {"Put": {"strikePrice": 85, "bid": 1.0, "ask": 1.1, "openInterest": 100}},
+    {"Call": call(85, 17.0, 17.2, 0.8, open_interest=None)},
+    {"Call": call(85, 17.0, None, 0.8)},
+    {"Call": call(85, None, 17.2, 0.8)},
+    {"Call": call(85, 17.0, 17.2, None)},
+])
+def test_incomplete_strikes_are_never_used(incomplete):
+    chain = option_chain([{"Call": call(80, 21.0, 21.2, 0.9)}, incomplete, {"Call": call(90, 13.0, 13.2, 0.7)}])
+    spreads = find_spreads(chain)
+    assert len(spreads) > 0
+
+    strikes = chain.get_strike_array()
+    for spread in spreads:
+        assert strikes[spread.get("long")] != 85.0
+        assert strikes[spread.get("short")] != 85.0
+        # Every strike used has a call to report
+        assert chain.get_call_option(float(strikes[spread.get("long")])) is not None
+        assert chain.get_call_option(float(strikes[spread.get("short")])) is not None
+        assert all(value == value for value in spread.values())
@@ -0,0 +1,65 @@
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lib"))
+
+import pytest
+
+import etrade_tools
+from etrade_tools import *
+
+def test_rate_and_in_flight_defaults():
+    assert etrade_tools._get_requests_per_second("etrade.json", dict()) == DEFAULT_REQUESTS_PER_SECOND
+    assert etrade_tools._get_max_in_flight("etrade.json", dict()) == DEFAULT_MAX_IN_FLIGHT
+
+@pytest.mark.parametrize("value", [0, -1, "0", "fast"])
+def test_bad_requests_per_second(value):
+    with pytest.raises(ETradeConfigurationError):
+        etrade_tools._get_requests_per_second("etrade.json", {PROPERTIES_REQUESTS_PER_SECOND: value})
+
+@pytest.mark.parametrize("value", [0, -2])
+def test_bad_max_in_flight(value):
+    with pytest.raises(ETradeConfigurationError):
+        etrade_tools._get_max_in_flight("etrade.json", {PROPERTIES_MAX_IN_FLIGHT: value})
+
+def test_rate_limiter_rejects_zero():
+    with pytest.raises(ValueError):
+        RateLimiter(0)
+
+class FakeSession():
+    def __init__(self):
+        self.events = list()
+
+    def authenticate(self):
+        self.events.append(("authenticate", threading.current_thread()))
+
+    def get_max_in_flight(self):
+        return 2
+
+def test_chains_authenticate_before_the_workers(monkeypatch):
+    session = FakeSession()
+    cached = {"AAA": "cached chain"}
+
+    def fetch(config_file, symbol, expiration_date):
+        session.events.append(("fetch", threading.current_thread()))
+        return f"{symbol} chain"
+
+    monkeypatch.setattr(etrade_tools, "get_session", lambda config_file: session)
+    monkeypatch.setattr(etrade_tools, "_get_cached_option_chain", lambda config_file, symbol, expiration_date: cached.get(symbol))
+    monkeypatch.setattr(etrade_tools, "_fetch_option_chain", fetch)
+
+    chains = get_option_chains("etrade.json", [("AAA", "2030-01-18"), ("BBB", "2030-01-18"), ("CCC", "2030-01-18")])
+
+    assert chains == ["cached chain", "BBB chain", "CCC chain"]
+    assert session.events[0] == ("authenticate", threading.current_thread())
+    assert [event for (event, thread) in session.events].count("fetch") == 2
+
+def test_cached_chains_need_no_session(monkeypatch):
+    def no_session(config_file):
+        raise AssertionError("the session should not be created")
+
+    monkeypatch.setattr(etrade_tools, "get_session", no_session)
+    monkeypatch.setattr(etrade_tools, "_get_cached_option_chain", lambda config_file, symbol, expiration_date: f"{symbol} chain")
+
+    assert get_option_chains("etrade.json", [("AAA", "2030-01-18")]) == ["AAA chain"]
@@ -0,0 +1,51 @@
+import datetime
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lib"))
+
+import numpy as np
+import pandas as pd
+
+from history_tools import *
+
+def cache_history(cache_dir, symbol, dates, seed):
+    """ Write a fresh history cache for a symbol with a random walk over the given dates """
+    generator = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(generator.normal(0, 0.02, len(dates))))
+    price_data = pd.DataFrame({"Open": close, "High": close * 1.01, "Low": close * 0.99, "Close": close,
+        "Adj Close": close, "Volume": generator.integers(100000, 1000000, len(dates)).astype(float)},
+        index=pd.DatetimeIndex(dates, name=HISTORY_INDEX))
+    cache_historical_data(symbol, cache_dir, add_price_indicators(price_data), TWO_YEAR_DAYS)
+
+def test_rows_line_up_on_each_symbols_own_bars(tmp_path):
+    dates = pd.bdate_range(end=datetime.date.today() - datetime.timedelta(days=1), periods=300)
+    cache_history(tmp_path, "FULL", dates, 1)
+    # Stale, missing the last three bars
+    cache_history(tmp_path, "STALE", dates[:-3], 2)
+    # Missing bars inside the last week
+    cache_history(tmp_path, "GAPS", dates.delete([-2, -4]), 3)
+    # A bar on a date nobody else traded
+    cache_history(tmp_path, "EXTRA", dates.append(pd.DatetimeIndex([dates[-1] + pd.Timedelta(hours=12)])), 4)
+    # Shorter than the others
+    cache_history(tmp_path, "SHORT", dates[-20:], 5)
+
+    symbols = ["FULL", "STALE", "GAPS", "EXTRA", "SHORT", "MISSING"]
+    columns = [COLUMN_CLOSE, COLUMN_HIGH, TWENTY_DAY_EMA]
+    (matrices, failed) = get_history_matrix(symbols, tmp_path, TWO_YEAR_DAYS, columns)
+    assert failed == ["MISSING"]
+    assert sorted(matrices.get(COLUMN_CLOSE).columns) == sorted(symbols[:-1])
+
+    for symbol in symbols[:-1]:
+        price_data = get_price_history(symbol, tmp_path, TWO_YEAR_DAYS)
+        for column in columns:
+            matrix = matrices.get(column)[symbol]
+            # The same rows the per symbol code reads
+            assert matrix.iloc[-1] == price_data[column].iloc[-1]
+            assert matrix.iloc[-6] == price_data[column].iloc[-6]
+            assert matrix.iloc[-5:].max() == price_data[column].iloc[-5:].max()
+            assert matrix.iloc[-250:].max() == price_data[column].iloc[-250:].max()
+        assert matrices.get(HISTORY_INDEX)[symbol].iloc[-1] == price_data.index[-1]
+
+    # The short history is padded at the top, not filled
+    assert matrices.get(COLUMN_CLOSE)["SHORT"].isna().sum() == len(matrices.get(COLUMN_CLOSE)) - 20
@@ -0,0 +1,77 @@
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lib"))
+
+import pytest
+
+from etrade_tools import *
+
+def option_chain(pairs):
+    """ An OptionChain for (strike, call open interest, put open interest) rows, None for a missing leg """
+    option_pairs = list()
+    for (strike, call_oi, put_oi) in pairs:
+        option_pair = dict()
+        if call_oi is not None:
+            option_pair["Call"] = {"strikePrice": strike, "openInterest": call_oi}
+        if put_oi is not None:
+            option_pair["Put"] = {"strikePrice": strike, "openInterest": put_oi}
+        option_pairs.append(option_pair)
+    return OptionChain("TEST", {"OptionChainResponse": {"SelectedED": {"year": 2030, "month": 1, "day": 18}, "OptionPair": option_pairs}})
+
+def reference_max_pain(pairs):
+    """ The original nested loop: the first strike (lowest) where the in the money payout is smallest.
+        A strike listed more than once uses the last option listed there """
+    strikes = sorted(strike for (strike, call_oi, put_oi) in pairs)
+    call_ois = dict((strike, call_oi or 0) for (strike, call_oi, put_oi) in pairs)
+    put_ois = dict((strike, put_oi or 0) for (strike, call_oi, put_oi) in pairs)
+
+    min_dollars = 0
+    max_pain_strike = None
+    for working_strike in strikes:
+        dollars = 0
+        for strike in strikes:
+            price_delta = working_strike - strike
+            if price_delta > 0:
+                dollars += price_delta * call_ois[strike] * 100
+            elif price_delta < 0:
+                dollars += price_delta * put_ois[strike] * -100
+        if max_pain_strike is None or dollars < min_dollars:
+            min_dollars = dollars
+            max_pain_strike = working_strike
+    return max_pain_strike
+
+FIXTURES = {
+    "single strike": [(100, 10, 10)],
+    "calls heavy": [(90, 500, 10), (95, 400, 20), (100, 300, 30), (105, 200, 40), (110, 100, 50)],
+    "puts heavy": [(90, 10, 500), (95, 20, 400), (100, 30, 300), (105, 40, 200), (110, 50, 100)],
+    "unsorted strikes": [(110, 5, 0), (90, 0, 7), (100, 3, 3), (95, 1, 2), (105, 2, 1)],
+    "half dollar strikes": [(7.5, 100, 0), (8.0, 50, 25), (8.5, 10, 80), (9.0, 0, 120)],
+    "missing legs": [(40, 100, None), (45, None, 60), (50, 30, 30), (55, 80, None)],
+    # 100 is listed twice, only the last listing's open interest counts (summing it moves max pain to 100)
+    "duplicate strikes": [(95, 0, 0), (100, 900, 0), (105, 0, 0), (100, 1, 1), (110, 0, 100)],
+    # Every strike pays nothing, the lowest strike wins the tie
+    "all zero open interest": [(10, 0, 0), (20, 0, 0), (30, 0, 0)],
+    # Symmetric open interest pays the same at every strike, the lowest strike wins the tie
+    "flat tie": [(95, 10, 0), (100, 0, 0), (105, 0, 10)],
+    # 60 and 70 tie below the outer strikes, 60 wins
+    "inner tie": [(50, 1, 0), (60, 1, 0), (70, 0, 1), (80, 0, 1)],
+}
+
+@pytest.mark.parametrize("name", sorted(FIXTURES))
+def test_max_pain_matches_reference(name):
+    pairs = FIXTURES[name]
+    assert option_chain(pairs).get_max_pain() == reference_max_pain(pairs)
+
+def test_max_pain_matches_reference_on_random_chains():
+    generator = random.Random(7)
+    for _ in range(200):
+        count = generator.randint(1, 40)
+        strikes = sorted(generator.sample(range(20, 400), count))
+        pairs = [(strike / 2, generator.choice([0, 0, generator.randint(0, 5000)]), generator.choice([0, generator.randint(0, 5000)]))
+            for strike in strikes]
+        assert option_chain(pairs).get_max_pain() == reference_max_pain(pairs)
+
+def test_max_pain_of_an_empty_chain():
+    assert option_chain(list()).get_max_pain() is None
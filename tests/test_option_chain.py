@@ -0,0 +1,51 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lib"))
+
+import numpy as np
+
+from etrade_tools import *
+
+def leg(strike, open_interest, bid):
+    return {"strikePrice": strike, "openInterest": open_interest, "bid": bid, "displaySymbol": f"TEST {strike} {bid}"}
+
+def option_chain(option_pairs):
+    return OptionChain("TEST", {"OptionChainResponse": {"SelectedED": {"year": 2030, "month": 1, "day": 18}, "OptionPair": option_pairs}})
+
+# 100 is listed twice (e.g. an adjusted option next to the standard one), 105 has a call in one
+# pair and a put in another
+DUPLICATE_STRIKES = [
+    {"Call": leg(95, 10, 6.0), "Put": leg(95, 40, 1.0)},
+    {"Call": leg(100, 20, 3.0), "Put": leg(100, 30, 2.0)},
+    {"Call": leg(100, 5, 2.5), "Put": leg(100, 7, 2.2)},
+    {"Call": leg(105, 8, 1.0)},
+    {"Put": leg(105, 9, 5.0)},
+]
+
+def test_duplicate_strikes_are_listed_once():
+    chain = option_chain(DUPLICATE_STRIKES)
+    assert chain.get_strike_prices() == [95.0, 100.0, 105.0]
+    assert chain.get_call_option(105.0) is not None
+    assert chain.get_put_option(105.0) is not None
+
+def test_duplicate_strikes_keep_the_last_option():
+    chain = option_chain(DUPLICATE_STRIKES)
+    assert chain.get_call_option(100.0).get_bid() == 2.5
+    assert list(chain.get_call_array(OPTION_BID)) == [6.0, 2.5, 1.0]
+
+def test_open_interest_of_duplicate_strikes():
+    chain = option_chain(DUPLICATE_STRIKES)
+    # The columns hold the last option listed at each strike
+    assert list(chain.get_call_array(OPTION_OPEN_INTEREST)) == [10, 5, 8]
+    assert list(chain.get_put_array(OPTION_OPEN_INTEREST)) == [40, 7, 9]
+
+    # The put/call ratio adds up every option in the chain
+    call_open_interest = sum(pair["Call"]["openInterest"] for pair in DUPLICATE_STRIKES if "Call" in pair)
+    put_open_interest = sum(pair["Put"]["openInterest"] for pair in DUPLICATE_STRIKES if "Put" in pair)
+    assert chain.get_put_call_ratio() == put_open_interest / call_open_interest
+
+def test_missing_open_interest():
+    chain = option_chain([{"Call": {"strikePrice": 10}, "Put": leg(10, 3, 1.0)}, {"Put": leg(20, 4, 2.0)}])
+    assert np.isnan(chain.get_call_array(OPTION_OPEN_INTEREST)).all()
+    assert chain.get_put_call_ratio() == 99.99
@@ -0,0 +1,91 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lib"))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bin"))
+
+import pytest
+
+import stock_screener
+from etrade_tools import *
+
+def quote_response(*quotes):
+    """ A quote response holding one QuoteData entry per (symbol, All block) """
+    return {"QuoteResponse": {"QuoteData": [{"Product": {"symbol": symbol}, "All": all_data} for (symbol, all_data) in quotes]}}
+
+COMPLETE = {"lastTrade": 101.5, "beta": 1.2, "averageVolume": 2500000, "companyName": "Complete Co"}
+MISSING_FIELDS = {"lastTrade": 55.0}
+INVALID_FIELDS = {"lastTrade": 55.0, "beta": "n/a", "averageVolume": "", "week52HiDate": 10**20, "marketCap": "n/a", "sharesOutstanding": ""}
+
+@pytest.fixture
+def screener_config(tmp_path, monkeypatch):
+    monkeypatch.setattr(stock_screener, "GLOBAL_VERBOSE", False, raising=False)
+    monkeypatch.setattr(stock_screener, "GLOBAL_REFRESH", False, raising=False)
+    monkeypatch.setattr(stock_screener, "GLOBAL_QUOTE_CACHE", dict(), raising=False)
+    monkeypatch.setattr(stock_screener, "GLOBAL_MISSING_SYMBOLS", set(), raising=False)
+    monkeypatch.setattr(stock_screener, "GLOBAL_OPTION_CHAINS", dict(), raising=False)
+    return {CACHE_DIR: str(tmp_path)}
+
+def load_quotes(screener_config, quote_data):
+    quotes = parse_quotes(quote_data)
+    stock_screener.GLOBAL_QUOTE_CACHE.update(quotes)
+    return quotes
+
+def ask(screener_config, symbol, question):
+    answers = get_answer_store(screener_config, symbol)
+    return stock_screener.ask_automated_question(screener_config, answers, symbol, None, question)
+
+def test_parse_quotes_skips_quotes_without_a_price():
+    quotes = parse_quotes(quote_response(("GOOD", COMPLETE), ("NOPRICE", {"beta": 1.0})))
+    assert list(quotes.keys()) == ["GOOD"]
+
+def test_missing_and_invalid_fields_read_as_none():
+    quotes = parse_quotes(quote_response(("MISS", MISSING_FIELDS), ("BAD", INVALID_FIELDS)))
+    for symbol in ("MISS", "BAD"):
+        quote = quotes.get(symbol)
+        assert quote.get_price() == 55.0
+        assert quote.get_beta() is None
+        assert quote.get_average_volume() is None
+        assert quote.get_52week_high_date() is None
+        assert quote.get_market_cap() is None
+        assert quote.get_float() is None
+    assert quotes.get("MISS").get_company_name() is None
+
+def test_market_cap_and_float_are_abbreviated():
+    quote = parse_quotes(quote_response(("GOOD", dict(COMPLETE, marketCap=2500000000, sharesOutstanding=750000000)))).get("GOOD")
+    assert quote.get_market_cap() == "2.5B"
+    assert quote.get_float() == "750.0M"
+
+def test_company_name_is_passed_through():
+    quote = parse_quotes(quote_response(("GOOD", COMPLETE))).get("GOOD")
+    assert quote.get_company_name() == "Complete Co"
+
+@pytest.mark.parametrize("question", [
+    {QUESTION_ID: "beta", QUESTION_TYPE: TYPE_BETA, BETA_MAX: 2.0, QUESTION_EXPIRATION_DAYS: 7},
+    {QUESTION_ID: "volume", QUESTION_TYPE: TYPE_VOLUME, VOLUME_MIN: 1000000, QUESTION_EXPIRATION_DAYS: 7},
+])
+def test_incomplete_quote_fails_the_question(screener_config, question):
+    load_quotes(screener_config, quote_response(("GOOD", COMPLETE), ("MISS", MISSING_FIELDS), ("BAD", INVALID_FIELDS)))
+
+    (value, expiration_timestamp) = ask(screener_config, "GOOD", question)
+    assert value is True
+    assert expiration_timestamp > get_current_timestamp()
+
+    # Incomplete data fails without a lasting answer
+    for symbol in ("MISS", "BAD"):
+        assert ask(screener_config, symbol, question) == (False, 0)
+
+def test_cached_false_is_checked_again(screener_config):
+    load_quotes(screener_config, quote_response(("GOOD", COMPLETE)))
+    question = {QUESTION_ID: "volume", QUESTION_TYPE: TYPE_VOLUME, VOLUME_MIN: 1000000, QUESTION_EXPIRATION_DAYS: 7}
+    get_answer_store(screener_config, "GOOD").set_answer("volume", False, get_current_timestamp() + 86400)
+
+    assert ask(screener_config, "GOOD", question)[0] is True
+
+def test_cached_earnings_answer_is_reused(screener_config):
+    question = {QUESTION_ID: "earnings", QUESTION_TYPE: TYPE_EARNINGS, QUESTION_EXPIRATION_DAYS: 7}
+    expiration_timestamp = get_current_timestamp() + 86400
+    get_answer_store(screener_config, "GOOD").set_answer("earnings", False, expiration_timestamp)
+
+    # No quote is loaded, the cached answer is returned without one
+    assert ask(screener_config, "GOOD", question) == (False, expiration_timestamp)